@@ -1,17 +1,19 @@
 # 
 from flask import Flask
-from .llm.llm_client import init_llm
+from .common.json_codec import FastJSONProvider
+from .common.logging_setup import setup_logging
+from .common.queue_stats import register_queue_gauges
 from.routes import bp as main_bp
-import logging
-
-logging.basicConfig(
-    level=logging.DEBUG,
-    format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-)
 
 
 def create_app() -> Flask:
+    """
+    只注册路由和指标，不连接任何外部依赖：Redis / MySQL / MinIO 客户端在第一次使用时创建，
+    可以配合 gunicorn --preload 在 master 里加载应用后再 fork worker
+    """
+    setup_logging("controller")
     app = Flask(__name__)
-    init_llm()
+    app.json = FastJSONProvider(app)
+    register_queue_gauges()
     app.register_blueprint(main_bp)
     return app
\ No newline at end of file
@@ -1,5 +1,20 @@
 # app/common/__init__.py
 
 from .retrying import BackoffConfig, RetryableError, retry_with_backoff
+from .deadline import DeadlineExceededError, check_deadline, deadline_scope, get_deadline, time_remaining
+from .circuit_breaker import CircuitBreakerConfig, CircuitOpenError, CircuitState, RedisCircuitBreaker
 
-__all__ = ["BackoffConfig", "RetryableError", "retry_with_backoff"]
\ No newline at end of file
+__all__ = [
+    "BackoffConfig",
+    "RetryableError",
+    "retry_with_backoff",
+    "CircuitBreakerConfig",
+    "CircuitOpenError",
+    "CircuitState",
+    "RedisCircuitBreaker",
+    "DeadlineExceededError",
+    "check_deadline",
+    "deadline_scope",
+    "get_deadline",
+    "time_remaining",
+]
\ No newline at end of file
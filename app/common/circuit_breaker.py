@@ -0,0 +1,149 @@
+# app/common/circuit_breaker.py
+# 基于 Redis 的共享熔断器：controller 与所有 worker 进程看到同一份状态
+from __future__ import annotations
+import logging
+import time
+from dataclasses import dataclass
+from enum import Enum as PyEnum
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+
+# 记录一次失败并在需要时打开熔断器，读状态和计数在同一个脚本里完成。
+# 已经打开（未到半开时间）时不计数也不重置 opened_at，打开前发出的请求陆续失败不会推迟半开探测。
+# 返回 {是否本次打开, 失败次数}
+_RECORD_FAILURE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local half_open = false
+if redis.call('HGET', KEYS[1], 'state') == 'open' then
+    local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or '0')
+    if now - opened_at < tonumber(ARGV[2]) then
+        return {0, 0}
+    end
+    half_open = true
+end
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if half_open or failures >= tonumber(ARGV[3]) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    redis.call('DEL', KEYS[2])
+    return {1, failures}
+end
+return {0, failures}
+"""
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被快速拒绝（不应再重试）"""
+    pass
+
+
+class CircuitState(str, PyEnum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+@dataclass
+class CircuitBreakerConfig:
+    """
+    熔断器配置
+    """
+    failure_threshold: int = 5       # 连续失败多少次后打开
+    open_seconds: float = 30.0       # 打开多久后进入半开，允许一次探测
+    probe_ttl_seconds: float = 60.0  # 半开探测锁的过期时间，防止探测方崩溃后永远不再探测
+
+
+class RedisCircuitBreaker:
+    """
+    closed    -> 正常放行，连续失败达到阈值后 -> open
+    open      -> 直接抛 CircuitOpenError，open_seconds 之后视为 half_open
+    half_open -> 只放行一个探测请求：成功 -> closed，失败 -> open
+
+    Redis 不可用时熔断器自身“失效放行”，不影响正常调用。
+    """
+
+    def __init__(self, redis_client: redis.Redis, name: str, cfg: CircuitBreakerConfig | None = None):
+        self.redis = redis_client
+        self.name = name
+        self.cfg = cfg or CircuitBreakerConfig()
+        self.key = f"doc_llm:circuit:{name}"
+        self.probe_key = f"{self.key}:probe"
+        # 脚本在第一次使用时注册，模块级创建熔断器时不触发 Redis 客户端初始化
+        self._record_failure_script = None
+
+    def state(self) -> CircuitState:
+        """读取当前状态，open 超过 open_seconds 视为 half_open"""
+        try:
+            raw = self.redis.hgetall(self.key)
+        except redis.RedisError:
+            logger.exception(f"[CIRCUIT] {self.name}: failed to read state, treat as closed")
+            return CircuitState.closed
+
+        state = raw.get(b"state", b"closed").decode("utf-8")
+        if state != CircuitState.open:
+            return CircuitState.closed
+
+        opened_at = float(raw.get(b"opened_at", b"0"))
+        if time.time() - opened_at >= self.cfg.open_seconds:
+            return CircuitState.half_open
+        return CircuitState.open
+
+    def before_call(self) -> None:
+        """调用前检查，不允许调用时抛 CircuitOpenError"""
+        state = self.state()
+        if state == CircuitState.closed:
+            return
+        if state == CircuitState.open:
+            raise CircuitOpenError(f"circuit {self.name} is open")
+
+        # half_open：抢到探测锁的调用才放行
+        try:
+            acquired = self.redis.set(
+                self.probe_key, 1, nx=True, px=int(self.cfg.probe_ttl_seconds * 1000)
+            )
+        except redis.RedisError:
+            logger.exception(f"[CIRCUIT] {self.name}: failed to acquire probe lock, allow call")
+            return
+        if not acquired:
+            raise CircuitOpenError(f"circuit {self.name} is half-open, probe in flight")
+        logger.info(f"[CIRCUIT] {self.name}: half-open, probing backend")
+
+    def record_success(self) -> None:
+        """调用成功：重置失败计数，关闭熔断器"""
+        try:
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, mapping={"state": CircuitState.closed.value, "failures": 0})
+            pipe.delete(self.probe_key)
+            pipe.execute()
+        except redis.RedisError:
+            logger.exception(f"[CIRCUIT] {self.name}: failed to record success")
+
+    def release_probe(self) -> None:
+        """调用没有得出后端是否可用的结论（如被 deadline 截断）：只释放半开探测锁，不改变状态"""
+        try:
+            self.redis.delete(self.probe_key)
+        except redis.RedisError:
+            logger.exception(f"[CIRCUIT] {self.name}: failed to release probe lock")
+
+    def record_failure(self) -> None:
+        """调用失败：累计失败次数，达到阈值或半开探测失败时打开熔断器；已打开时忽略"""
+        try:
+            if self._record_failure_script is None:
+                self._record_failure_script = self.redis.register_script(_RECORD_FAILURE_SCRIPT)
+            opened, failures = self._record_failure_script(
+                keys=[self.key, self.probe_key],
+                args=[time.time(), self.cfg.open_seconds, self.cfg.failure_threshold],
+            )
+            if opened:
+                logger.warning(
+                    f"[CIRCUIT] {self.name}: opened, failures={failures}, "
+                    f"retry after {self.cfg.open_seconds}s"
+                )
+        except redis.RedisError:
+            logger.exception(f"[CIRCUIT] {self.name}: failed to record failure")
+
+    def allows_requests(self) -> bool:
+        """是否值得再去调用后端（open 时为 False）"""
+        return self.state() != CircuitState.open
@@ -1,9 +1,10 @@
 # app/common/db.py
 from __future__ import annotations
-from sqlalchemy import create_engine
+from sqlalchemy import Engine, create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 from contextlib import contextmanager
 import os
+import threading
 
 DB_USER = os.getenv("DB_USER", "root")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
@@ -11,20 +12,57 @@ DB_HOST = os.getenv("DB_HOST", "127.0.0.1")
 DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME", "doc_llm")
 
-SQLALCHEMY_DATABASE_URL = (
+# 设置 DATABASE_URL 时优先使用（如压测用的 sqlite:///bench.db），否则按 DB_* 拼 MySQL 地址
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL") or (
     f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     "?charset=utf8mb4"
 )
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    echo=True,          
-    pool_pre_ping=True,
-    future=True,
-)
+# 打印每条 SQL 只在本地排查问题时打开
+DB_ECHO = os.getenv("DB_ECHO", "0") == "1"
+
+_connect_args = {}
+if SQLALCHEMY_DATABASE_URL.startswith("sqlite"):
+    # worker 多线程共用连接池；写锁冲突时等待而不是立即报错
+    _connect_args = {"check_same_thread": False, "timeout": 30}
+
+_engine: Engine | None = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    """进程内共享的 engine，首次使用时才创建（import 时不加载数据库驱动、不解析连接串）"""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    SQLALCHEMY_DATABASE_URL,
+                    echo=DB_ECHO,
+                    pool_pre_ping=True,
+                    future=True,
+                    connect_args=_connect_args,
+                )
+    return _engine
+
+
+def _dispose_after_fork() -> None:
+    # fork 前父进程已建立的连接留给父进程，子进程的连接池从空开始
+    if _engine is not None:
+        _engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def __getattr__(name: str):
+    # 兼容 from app.common.db import engine
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 SessionLocal = sessionmaker(
-    bind=engine,
     autoflush=False,
     autocommit=False,
     expire_on_commit=False,
@@ -37,7 +75,7 @@ Base = declarative_base()
 @contextmanager
 def get_session():
     """session 上下文管理器"""
-    session: Session = SessionLocal()
+    session: Session = SessionLocal(bind=get_engine())
     try:
         yield session
         session.commit()
@@ -0,0 +1,55 @@
+# app/common/deadline.py
+# 任务级 deadline，通过 contextvar 在同一调用链内传递（重试循环、LLM 调用、MinIO 下载都会检查）
+from __future__ import annotations
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+_current_deadline: ContextVar[float | None] = ContextVar("doc_llm_deadline", default=None)
+
+
+class DeadlineExceededError(Exception):
+    """任务已超过 deadline，应放弃后续工作"""
+    pass
+
+
+@contextmanager
+def deadline_scope(deadline: float | None) -> Iterator[None]:
+    """
+    在 with 块内设置 deadline（unix 时间戳，秒）。
+    嵌套时取更早的那个；deadline 为 None 时沿用外层。
+    """
+    outer = _current_deadline.get()
+    if deadline is None:
+        effective = outer
+    elif outer is None:
+        effective = deadline
+    else:
+        effective = min(outer, deadline)
+
+    token = _current_deadline.set(effective)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+
+def get_deadline() -> float | None:
+    """当前生效的 deadline，没有则为 None"""
+    return _current_deadline.get()
+
+
+def time_remaining() -> float | None:
+    """距离 deadline 的剩余秒数，没有 deadline 时返回 None"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.time()
+
+
+def check_deadline(what: str = "operation") -> None:
+    """deadline 已过则抛出 DeadlineExceededError"""
+    remaining = time_remaining()
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceededError(f"{what} aborted: deadline exceeded by {-remaining:.1f}s")
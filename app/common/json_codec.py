@@ -0,0 +1,60 @@
+# app/common/json_codec.py
+# JSON 编解码：安装了 orjson 时使用 orjson（快数倍、直接输出 bytes），否则退回标准库 json
+from __future__ import annotations
+import json
+from typing import Any
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+_COMPACT_SEPARATORS = (",", ":")
+
+
+def _default(obj: Any) -> Any:
+    # 与 Flask 默认行为保持一致：datetime 输出 HTTP 日期、Decimal 输出字符串等
+    return DefaultJSONProvider.default(obj)
+
+
+def dumps_bytes(obj: Any, sort_keys: bool = False) -> bytes:
+    """紧凑编码为 UTF-8 bytes（不转义中文）"""
+    if orjson is not None:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=_default, option=option)
+    return dumps(obj, sort_keys=sort_keys).encode("utf-8")
+
+
+def dumps(obj: Any, sort_keys: bool = False) -> str:
+    """紧凑编码为 str（不转义中文）"""
+    if orjson is not None:
+        return dumps_bytes(obj, sort_keys=sort_keys).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, separators=_COMPACT_SEPARATORS, sort_keys=sort_keys, default=_default)
+
+
+def loads(data: bytes | bytearray | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider：jsonify / request.get_json 走 dumps / loads"""
+
+    ensure_ascii = False
+    sort_keys = False
+    compact = True
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs.get("indent"):
+            # 调试模式下的美化输出，走标准库即可
+            kwargs.setdefault("default", _default)
+            return json.dumps(obj, **kwargs)
+        return dumps(obj, sort_keys=kwargs.get("sort_keys", False))
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        return loads(s)
@@ -0,0 +1,74 @@
+# app/common/leader_lock.py
+# 基于 Redis 的选主锁：多个副本里只有持有锁的一个执行后台巡检类任务
+from __future__ import annotations
+import logging
+import os
+import socket
+import uuid
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# 只有锁仍属于自己时才续期 / 释放，避免误删其他副本抢到的锁
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLock:
+    """
+    SET NX PX 抢锁，持有者每轮调用 acquire_or_renew 续期。
+    持有者崩溃后锁在 ttl 之后自动过期，由其他副本接手；ttl 应大于巡检间隔的两倍。
+    """
+
+    def __init__(self, redis_client: redis.Redis, name: str, ttl_seconds: float):
+        self.redis = redis_client
+        self.name = name
+        self.key = f"doc_llm:leader:{name}"
+        self.ttl_ms = int(ttl_seconds * 1000)
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex}".encode("utf-8")
+        # 脚本在第一次使用时注册，模块级创建锁对象时不触发 Redis 客户端初始化
+        self._scripts: dict[str, redis.commands.core.Script] = {}
+        self._is_leader = False
+
+    def _script(self, name: str, source: str):
+        if name not in self._scripts:
+            self._scripts[name] = self.redis.register_script(source)
+        return self._scripts[name]
+
+    def acquire_or_renew(self) -> bool:
+        """已是 leader 则续期，否则尝试抢锁；返回当前是否为 leader"""
+        try:
+            renew = self._script("renew", _RENEW_SCRIPT)
+            if self._is_leader and renew(keys=[self.key], args=[self.token, self.ttl_ms]):
+                return True
+            acquired = bool(self.redis.set(self.key, self.token, nx=True, px=self.ttl_ms))
+        except redis.RedisError:
+            logger.exception(f"[LEADER] {self.name}: redis error, step down")
+            acquired = False
+
+        if acquired != self._is_leader:
+            logger.info(f"[LEADER] {self.name}: {'acquired' if acquired else 'lost'} leadership")
+        self._is_leader = acquired
+        return acquired
+
+    def release(self) -> None:
+        """主动让出（进程正常退出时），其他副本无需等待 ttl 过期"""
+        if not self._is_leader:
+            return
+        try:
+            self._script("release", _RELEASE_SCRIPT)(keys=[self.key], args=[self.token])
+        except redis.RedisError:
+            logger.exception(f"[LEADER] {self.name}: failed to release lock")
+        self._is_leader = False
@@ -0,0 +1,184 @@
+# app/common/logging_setup.py
+# 统一日志配置：业务线程只把日志放进内存队列，由后台线程写 stdout，避免大段同步写阻塞请求 / 任务
+#
+# 环境变量：
+#   LOG_LEVEL            根 logger 级别，默认 INFO
+#   LOG_LEVELS           按模块覆盖级别，如 "app.llm=DEBUG,sqlalchemy.engine=WARNING"
+#   LOG_FORMAT           text / json，默认 text
+#   LOG_MAX_FIELD_CHARS  单条日志消息 / 附加字段的最大字符数，超出截断
+#   LOG_SAMPLE_RATE      带 extra={"sample": True} 的高频日志的采样比例
+#   LOG_QUEUE_SIZE       日志队列长度，写满时丢弃新日志并计数
+from __future__ import annotations
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+from app.common.metrics import registry as metrics_registry
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+LOG_MAX_FIELD_CHARS = int(os.getenv("LOG_MAX_FIELD_CHARS", "2000"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.01"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+# 第三方库默认级别，LOG_LEVELS 中可以覆盖
+DEFAULT_MODULE_LEVELS = {
+    "sqlalchemy.engine": "WARNING",
+    "urllib3": "WARNING",
+    "dashscope": "WARNING",
+}
+
+# LogRecord 自带属性，其余属性视为 extra 传入的附加字段
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def parse_module_levels(spec: str) -> dict[str, str]:
+    """解析 "a.b=DEBUG,c=WARNING" 形式的模块级别配置"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def _truncate(value: str, limit: int) -> str:
+    if len(value) <= limit:
+        return value
+    return f"{value[:limit]}...(truncated {len(value) - limit} chars)"
+
+
+class SamplingFilter(logging.Filter):
+    """带 sample 标记的日志只保留一部分，WARNING 及以上不采样"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sample", False) or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate
+
+
+class TruncatingFilter(logging.Filter):
+    """截断过长的消息和附加字段，避免整篇文档 / 模型原始回答写进日志"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = limit
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if len(message) > self.limit:
+            record.msg = _truncate(message, self.limit)
+            record.args = None
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and isinstance(value, str) and len(value) > self.limit:
+                record.__dict__[key] = _truncate(value, self.limit)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """一行一个 JSON 对象，extra 字段原样带上"""
+
+    def __init__(self, service: str):
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "service": self.service,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and key != "sample":
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """队列写满时直接丢弃，不阻塞业务线程"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics_registry.inc("doc_llm_log_records_dropped_total")
+
+
+def _stop_listener() -> None:
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_listener_after_fork() -> None:
+    """
+    gunicorn --preload 在 master 里配置日志后 fork worker，监听线程不会被带到子进程；
+    子进程换一个新队列（旧队列的锁可能在 fork 时被持有）并重新启动监听线程
+    """
+    global _listener
+    if _listener is None:
+        return
+    new_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            handler.queue = new_queue
+    _listener = logging.handlers.QueueListener(new_queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+os.register_at_fork(after_in_child=_restart_listener_after_fork)
+
+
+def setup_logging(service: str) -> None:
+    """
+    进程启动时调用一次（create_app / run_worker），重复调用无副作用。
+    根 logger 只挂一个队列 handler，由 QueueListener 线程负责格式化和输出。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    if LOG_FORMAT == "json":
+        formatter: logging.Formatter = JsonFormatter(service)
+    else:
+        formatter = logging.Formatter(TEXT_FORMAT)
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    # 先采样再截断，被丢弃的日志不用格式化
+    queue_handler.addFilter(SamplingFilter(LOG_SAMPLE_RATE))
+    queue_handler.addFilter(TruncatingFilter(LOG_MAX_FIELD_CHARS))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name, level in {**DEFAULT_MODULE_LEVELS, **parse_module_levels(LOG_LEVELS)}.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+    logging.getLogger(__name__).info(f"logging configured for {service}, level={LOG_LEVEL}, format={LOG_FORMAT}")
@@ -0,0 +1,80 @@
+# app/common/minhash.py
+# 文档近似去重用的 MinHash 签名与 LSH 分桶（纯 Python，无第三方依赖）
+# 签名用单次哈希的 one permutation hashing：每个 shingle 只哈希一次，按低位分到 NUM_PERM 个桶，
+# 每个桶取高位的最小值，空桶从右边最近的非空桶借值（rotation densification），
+# 同一位置相等的概率仍近似 Jaccard 相似度，计算量不再乘以 NUM_PERM
+from __future__ import annotations
+import hashlib
+import re
+import struct
+
+NUM_PERM = 64          # 签名长度（桶数），必须是 2 的幂
+LSH_BANDS = 16         # 分桶数，NUM_PERM 必须能被整除；16x4 时相似度约 0.5 以上才会成为候选
+SHINGLE_SIZE = 5       # 字符 n-gram 长度，中文按字切，英文也按字符切
+
+_MAX_HASH = (1 << 32) - 1
+_BIN_BITS = NUM_PERM.bit_length() - 1
+_BIN_MASK = NUM_PERM - 1
+# 桶内的值只用哈希的高位，剩下的位留给 densification 的借位距离，保证借来的值不会和原值相等
+_VALUE_BITS = 32 - _BIN_BITS
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """去掉空白差异、统一大小写，日期等小改动仍保留，由相似度体现"""
+    return _WHITESPACE_RE.sub(" ", text).strip().lower()
+
+
+def _shingle_hashes(text: str) -> set[int]:
+    if len(text) <= SHINGLE_SIZE:
+        grams = [text] if text else []
+    else:
+        grams = (text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1))
+    return {
+        struct.unpack("<I", hashlib.blake2b(g.encode("utf-8"), digest_size=4).digest())[0]
+        for g in grams
+    }
+
+
+def minhash_signature(text: str) -> list[int]:
+    """对规范化后的文本计算 MinHash 签名"""
+    hashes = _shingle_hashes(normalize_text(text))
+    if not hashes:
+        return [_MAX_HASH] * NUM_PERM
+    # 从大到小写入，同一个桶最后留下的是最小值（低位相同时按整体排序等价于按高位排序）
+    bins = {h & _BIN_MASK: h >> _BIN_BITS for h in sorted(hashes, reverse=True)}
+    sig = []
+    for i in range(NUM_PERM):
+        distance = 0
+        while (i + distance) % NUM_PERM not in bins:
+            distance += 1
+        sig.append(bins[(i + distance) % NUM_PERM] | (distance << _VALUE_BITS))
+    return sig
+
+
+def estimate_similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    """两个签名相同位置相等的比例，近似 Jaccard 相似度"""
+    if len(sig_a) != len(sig_b) or not sig_a:
+        return 0.0
+    same = sum(1 for x, y in zip(sig_a, sig_b) if x == y)
+    return same / len(sig_a)
+
+
+def lsh_band_keys(sig: list[int]) -> list[str]:
+    """把签名切成 LSH_BANDS 段，每段哈希成一个桶 key"""
+    rows = len(sig) // LSH_BANDS
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = sig[band * rows:(band + 1) * rows]
+        digest = hashlib.blake2b(struct.pack(f"<{rows}I", *chunk), digest_size=8).hexdigest()
+        keys.append(f"{band}:{digest}")
+    return keys
+
+
+def pack_signature(sig: list[int]) -> bytes:
+    return struct.pack(f"<{len(sig)}I", *sig)
+
+
+def unpack_signature(raw: bytes) -> list[int]:
+    return list(struct.unpack(f"<{len(raw) // 4}I", raw))
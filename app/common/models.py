@@ -2,7 +2,7 @@
 from __future__ import annotations
 from datetime import datetime
 from enum import Enum as PyEnum
-from sqlalchemy import JSON, BigInteger, String, Text, DateTime, Enum, Index, Integer
+from sqlalchemy import JSON, BigInteger, Boolean, String, Text, DateTime, Enum, Index, Integer, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column
 from .db import Base
 
@@ -12,13 +12,21 @@ class TaskStatus(str, PyEnum):
     processing = "processing"
     success = "success"
     failed = "failed"
+    dead_letter = "dead_letter"   # 超过重试预算被隔离，只能人工 replay
+
+
+# 不会再被 worker 处理的状态
+TERMINAL_TASK_STATUSES = frozenset({TaskStatus.success, TaskStatus.failed, TaskStatus.dead_letter})
+# 以失败结束的状态
+FAILED_TASK_STATUSES = frozenset({TaskStatus.failed, TaskStatus.dead_letter})
 
 
 class TaskDocLLM(Base):
     __tablename__ = "task_doc_llm"
 
+    # sqlite 只有 INTEGER 主键会自增，本地压测用 sqlite 时换成 Integer
     task_id: Mapped[int] = mapped_column(
-        "task_id", BigInteger, primary_key=True, autoincrement=True, comment="任务ID，自增主键"
+        "task_id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="任务ID，自增主键"
     )
     task_name: Mapped[str] = mapped_column(
         "task_name", String(255), nullable=False, comment="任务名称，可重复"
@@ -26,6 +34,9 @@ class TaskDocLLM(Base):
     create_time: Mapped[datetime] = mapped_column(
         "create_time", DateTime, nullable=False, default=datetime.now, comment="创建时间"
     )
+    update_time: Mapped[datetime] = mapped_column(
+        "update_time", DateTime, nullable=False, default=datetime.now, onupdate=datetime.now, comment="最后更新时间"
+    )
     doc: Mapped[str] = mapped_column(
         "doc", String(length=65535), nullable=False, comment="文档内容"
     )
@@ -35,11 +46,36 @@ class TaskDocLLM(Base):
     feature: Mapped[str | None] = mapped_column(
         "feature", String(5000), nullable=True, comment="功能点"
     )
+    previous_task_id: Mapped[int | None] = mapped_column(
+        "previous_task_id", BigInteger, nullable=True, comment="上一版本文档的任务ID，设置时只复检改动段落"
+    )
+    not_before: Mapped[datetime | None] = mapped_column(
+        "not_before", DateTime, nullable=True, comment="最早开始处理的时间，之前只在延迟队列里等待"
+    )
+    run_window: Mapped[str | None] = mapped_column(
+        "run_window", String(11), nullable=True, comment="低优先级批量任务的运行时间窗 HH:MM-HH:MM"
+    )
+    prompt_version: Mapped[str | None] = mapped_column(
+        "prompt_version", String(32), nullable=True, comment="使用的 prompt 版本，NULL 表示最新版本"
+    )
+    model: Mapped[str | None] = mapped_column(
+        "model", String(64), nullable=True, comment="使用的模型，NULL 表示默认模型"
+    )
+    idempotency_key: Mapped[str | None] = mapped_column(
+        "idempotency_key", String(64), nullable=True, comment="提交幂等键（sha256），同一个键只会创建一个任务"
+    )
+    callback_url: Mapped[str | None] = mapped_column(
+        "callback_url", String(1024), nullable=True, comment="任务结束后回调的地址"
+    )
+    callback_batch: Mapped[bool] = mapped_column(
+        "callback_batch", Boolean, nullable=False, default=False, server_default="0", comment="回调方是否接受批量推送"
+    )
     status: Mapped[TaskStatus] = mapped_column(
         "status", Enum(TaskStatus), nullable=False, default=TaskStatus.pending, comment="任务状态"
     )
     result: Mapped[dict | None] = mapped_column(
-        "result", JSON, nullable=True, comment="执行结果，JSON 格式，pending 时为 NULL",
+        "result", JSON, nullable=True,
+        comment="执行结果，JSON 格式，pending 时为 NULL；紧凑格式下 bugs / raw_answer 拆到 task_bug / task_raw_answer",
     )
     processing_started_at: Mapped[datetime | None] = mapped_column(
         "processing_started_at", DateTime, nullable=True, comment="任务开始处理的时间",
@@ -49,6 +85,8 @@ class TaskDocLLM(Base):
     )
     __table_args__ = (
         Index("idx_status_ctime", "status", "create_time"),
+        Index("idx_status_started", "status", "processing_started_at"),
+        Index("uq_idempotency_key", "idempotency_key", unique=True),
     )
     def __repr__(self) -> str:
         return (
@@ -62,10 +100,202 @@ class TaskDocLLM(Base):
             "task_name": self.task_name,
             "product": self.product,
             "feature": self.feature,
+            "previous_task_id": self.previous_task_id,
+            "callback_url": self.callback_url,
             "status": self.status,
             "result": self.result,
             "create_time": self.create_time.isoformat() if self.create_time else None,
+            "update_time": self.update_time.isoformat() if self.update_time else None,
             "processing_started_at": self.processing_started_at.isoformat() if self.processing_started_at else None,
             "retry_count": self.retry_count,
+            "not_before": self.not_before.isoformat() if self.not_before else None,
+            "run_window": self.run_window,
+            "prompt_version": self.prompt_version,
+            "model": self.model,
             "doc": self.doc,
-        }
\ No newline at end of file
+        }
+
+class TaskBug(Base):
+    """
+    成功任务结果里的单个 bug，一行一个。按 (product, bug_type) 建索引，
+    “产品 X 的所有术语错误”这类查询走索引，不用扫描 result JSON
+    """
+    __tablename__ = "task_bug"
+
+    id: Mapped[int] = mapped_column(
+        "id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="自增主键"
+    )
+    task_id: Mapped[int] = mapped_column(
+        "task_id", BigInteger, nullable=False, comment="所属任务ID"
+    )
+    seq: Mapped[int] = mapped_column(
+        "seq", Integer, nullable=False, comment="在结果 bugs 列表中的下标"
+    )
+    product: Mapped[str | None] = mapped_column(
+        "product", String(100), nullable=True, comment="任务的产品名称（冗余，便于按产品查询）"
+    )
+    bug_type: Mapped[str | None] = mapped_column(
+        "bug_type", String(64), nullable=True, comment="问题类型"
+    )
+    bug_no: Mapped[str | None] = mapped_column(
+        "bug_no", String(32), nullable=True, comment="模型给出的问题编号"
+    )
+    description: Mapped[str | None] = mapped_column(
+        "description", Text, nullable=True, comment="问题描述"
+    )
+    suggestion: Mapped[str | None] = mapped_column(
+        "suggestion", Text, nullable=True, comment="优化建议"
+    )
+    offset: Mapped[int | None] = mapped_column(
+        "offset", Integer, nullable=True, comment="问题在文档中的字符位置"
+    )
+    extra: Mapped[dict | None] = mapped_column(
+        "extra", JSON, nullable=True, comment="其余字段，原样保存"
+    )
+    __table_args__ = (
+        Index("idx_bug_task_seq", "task_id", "seq"),
+        Index("idx_bug_product_type", "product", "bug_type"),
+        Index("idx_bug_type", "bug_type"),
+    )
+
+
+class TaskRawAnswer(Base):
+    """成功任务的模型原始回答，压缩后单独存放，只有明确请求时才读取和解压"""
+    __tablename__ = "task_raw_answer"
+
+    task_id: Mapped[int] = mapped_column(
+        "task_id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=False, comment="任务ID"
+    )
+    codec: Mapped[str] = mapped_column(
+        "codec", String(8), nullable=False, comment="压缩算法：zstd / zlib"
+    )
+    raw_size: Mapped[int] = mapped_column(
+        "raw_size", Integer, nullable=False, comment="压缩前的字节数"
+    )
+    data: Mapped[bytes] = mapped_column(
+        "data", LargeBinary(length=16777215), nullable=False, comment="压缩后的原始回答（UTF-8）"
+    )
+
+
+class TaskOutbox(Base):
+    """
+    待入队消息（事务性 outbox）：与任务行在同一个事务里写入，
+    由 controller 提交后立即发布、relay 兜底发布到 Redis ready 队列，发布成功后删除
+    """
+    __tablename__ = "task_outbox"
+
+    id: Mapped[int] = mapped_column(
+        "id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="自增主键"
+    )
+    task_id: Mapped[int] = mapped_column(
+        "task_id", BigInteger, nullable=False, comment="待入队的任务ID"
+    )
+    task_name: Mapped[str | None] = mapped_column(
+        "task_name", String(255), nullable=True, comment="任务名称，写进队列消息"
+    )
+    create_time: Mapped[datetime] = mapped_column(
+        "create_time", DateTime, nullable=False, default=datetime.now, comment="写入时间"
+    )
+    __table_args__ = (
+        Index("idx_task_id", "task_id"),
+    )
+
+
+class EvalRunStatus(str, PyEnum):
+    running = "running"     # 还有组合未派发或未结束
+    finished = "finished"   # 全部组合结束，report 已生成
+
+
+class EvalRun(Base):
+    """一次评测：语料 × prompt 版本 × 模型的所有组合，每个组合对应一个任务"""
+    __tablename__ = "eval_run"
+
+    id: Mapped[int] = mapped_column(
+        "id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="评测ID，自增主键"
+    )
+    name: Mapped[str] = mapped_column(
+        "name", String(255), nullable=False, comment="评测名称"
+    )
+    prompt_versions: Mapped[list] = mapped_column(
+        "prompt_versions", JSON, nullable=False, comment="参与对比的 prompt 版本列表"
+    )
+    models: Mapped[list] = mapped_column(
+        "models", JSON, nullable=False, comment="参与对比的模型列表"
+    )
+    doc_count: Mapped[int] = mapped_column(
+        "doc_count", Integer, nullable=False, comment="语料文档数"
+    )
+    max_concurrency: Mapped[int] = mapped_column(
+        "max_concurrency", Integer, nullable=False, comment="同时在队列 / 处理中的任务数上限"
+    )
+    status: Mapped[EvalRunStatus] = mapped_column(
+        "status", Enum(EvalRunStatus), nullable=False, default=EvalRunStatus.running, comment="评测状态"
+    )
+    report: Mapped[dict | None] = mapped_column(
+        "report", JSON, nullable=True, comment="对比报告，评测结束时生成"
+    )
+    create_time: Mapped[datetime] = mapped_column(
+        "create_time", DateTime, nullable=False, default=datetime.now, comment="创建时间"
+    )
+    finish_time: Mapped[datetime | None] = mapped_column(
+        "finish_time", DateTime, nullable=True, comment="结束时间"
+    )
+    __table_args__ = (
+        Index("idx_eval_status", "status"),
+    )
+
+    def to_dict(self) -> dict:
+        return {
+            "eval_run_id": self.id,
+            "name": self.name,
+            "prompt_versions": self.prompt_versions,
+            "models": self.models,
+            "doc_count": self.doc_count,
+            "max_concurrency": self.max_concurrency,
+            "status": self.status,
+            "create_time": self.create_time.isoformat() if self.create_time else None,
+            "finish_time": self.finish_time.isoformat() if self.finish_time else None,
+        }
+
+
+class EvalRunItem(Base):
+    """
+    评测中的一个组合（文档 × prompt 版本 × 模型）。
+    cache_key 相同的组合已有成功结果时直接复用那个任务，不再重复调用模型
+    """
+    __tablename__ = "eval_run_item"
+
+    id: Mapped[int] = mapped_column(
+        "id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True, comment="自增主键"
+    )
+    run_id: Mapped[int] = mapped_column(
+        "run_id", BigInteger, nullable=False, comment="所属评测ID"
+    )
+    doc_index: Mapped[int] = mapped_column(
+        "doc_index", Integer, nullable=False, comment="文档在语料中的下标"
+    )
+    source_task_id: Mapped[int | None] = mapped_column(
+        "source_task_id", BigInteger, nullable=True, comment="语料来自已有任务时的原任务ID"
+    )
+    prompt_version: Mapped[str] = mapped_column(
+        "prompt_version", String(32), nullable=False, comment="prompt 版本"
+    )
+    model: Mapped[str] = mapped_column(
+        "model", String(64), nullable=False, comment="模型"
+    )
+    cache_key: Mapped[str] = mapped_column(
+        "cache_key", String(64), nullable=False, comment="sha256(文档, 产品, 功能点, prompt 版本, 模型)"
+    )
+    task_id: Mapped[int] = mapped_column(
+        "task_id", BigInteger, nullable=False, comment="执行该组合的任务ID（复用时为已有任务）"
+    )
+    reused: Mapped[bool] = mapped_column(
+        "reused", Boolean, nullable=False, default=False, server_default="0", comment="是否复用了已有结果"
+    )
+    dispatched: Mapped[bool] = mapped_column(
+        "dispatched", Boolean, nullable=False, default=False, server_default="0", comment="任务是否已入队"
+    )
+    __table_args__ = (
+        Index("idx_run_dispatched", "run_id", "dispatched"),
+        Index("idx_cache_key", "cache_key"),
+    )
@@ -0,0 +1,81 @@
+# app/common/profiling.py
+# 线上 worker 的采样 profiler：收到信号后在后台线程按固定间隔采样所有线程的调用栈，
+# 结束后写出 collapsed stack 格式报告（与 py-spy --format raw 相同，可直接生成火焰图）
+#
+#   WORKER_PROFILER_SIGNAL=SIGUSR1 python run_worker.py
+#   kill -USR1 <pid>     # 采样 PROFILER_DURATION_SECONDS 秒，报告写到 PROFILER_OUTPUT_DIR
+from __future__ import annotations
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+PROFILER_INTERVAL_SECONDS = float(os.getenv("PROFILER_INTERVAL_SECONDS", "0.01"))
+PROFILER_DURATION_SECONDS = float(os.getenv("PROFILER_DURATION_SECONDS", "30"))
+PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", "/tmp")
+
+_running = threading.Lock()
+
+
+def _frame_stack(frame) -> str:
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def sample_stacks(duration: float, interval: float = PROFILER_INTERVAL_SECONDS) -> Counter:
+    """采样 duration 秒，返回 {"线程名;栈帧;...": 次数}，跳过采样线程自身"""
+    own_id = threading.get_ident()
+    counts: Counter = Counter()
+    end_at = time.monotonic() + duration
+    while time.monotonic() < end_at:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            counts[f"{names.get(thread_id, thread_id)};{_frame_stack(frame)}"] += 1
+        time.sleep(interval)
+    return counts
+
+
+def write_report(counts: Counter, path: Path) -> None:
+    with path.open("w", encoding="utf-8") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def _profile_once(duration: float) -> None:
+    try:
+        path = Path(PROFILER_OUTPUT_DIR) / f"doc_llm_profile_{os.getpid()}_{int(time.time())}.txt"
+        logger.info(f"sampling profiler started, duration={duration}s")
+        counts = sample_stacks(duration)
+        write_report(counts, path)
+        logger.info(f"sampling profiler finished, {sum(counts.values())} samples written to {path}")
+    except Exception:
+        logger.exception("sampling profiler failed")
+    finally:
+        _running.release()
+
+
+def trigger_profile(duration: float = PROFILER_DURATION_SECONDS) -> bool:
+    """启动一次后台采样，已有采样在进行时返回 False"""
+    if not _running.acquire(blocking=False):
+        return False
+    threading.Thread(target=_profile_once, args=(duration,), name="doc_llm_profiler", daemon=True).start()
+    return True
+
+
+def install_profiler_signal(signal_name: str) -> None:
+    """注册信号处理：收到信号即触发一次采样（需在主线程调用）"""
+    signum = getattr(signal, signal_name)
+    signal.signal(signum, lambda *_: trigger_profile())
+    logger.info(f"sampling profiler armed on {signal_name}")
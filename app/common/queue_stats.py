@@ -0,0 +1,247 @@
+# app/common/queue_stats.py
+# 集群级的队列 / 吞吐统计，供 /metrics 导出和 autoscaler 决策使用：
+#   - 事件计数按分钟分桶写在 Redis（INCRBY + EXPIRE），任意进程都能算出整个集群的速率
+#   - 各 worker 定期上报心跳、在途任务数和并发数（worker_loop 线程数）
+#   - queue_snapshot 只用 O(1) / O(log N) 命令（LLEN、LINDEX、ZCARD），不遍历队列；worker 列表的大小只和副本数有关
+from __future__ import annotations
+import logging
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+import redis
+
+from app.common import json_codec
+from app.common.metrics import MetricsRegistry, registry as metrics_registry
+from app.common.redis_client import lazy_redis
+from app.common.task_queue import (
+    TASK_DEADLINE_SECONDS,
+    TASK_PROCESSING_DEADLINES_KEY,
+    TASK_QUEUE_BULK_KEY,
+    TASK_QUEUE_DEFERRED_KEY,
+    TASK_QUEUE_DELAYED_KEY,
+    TASK_QUEUE_READY_KEY,
+)
+
+logger = logging.getLogger(__name__)
+
+STATS_BUCKET_SECONDS = 60
+STATS_TTL_SECONDS = 3600
+# 计算速率用的窗口（秒），只统计已结束的分钟桶
+STATS_RATE_WINDOW_SECONDS = int(os.getenv("STATS_RATE_WINDOW_SECONDS", "300"))
+# worker 超过该时长没有心跳视为已下线
+WORKER_STALE_SECONDS = int(os.getenv("WORKER_STALE_SECONDS", "180"))
+# /metrics 采集时复用快照的时间，避免一次采集对每个 gauge 各查一遍 Redis
+SNAPSHOT_CACHE_SECONDS = 1.0
+
+WORKERS_KEY = "doc_llm:zset:workers"
+WORKER_INFLIGHT_KEY = "doc_llm:hash:worker_inflight"
+WORKER_CAPACITY_KEY = "doc_llm:hash:worker_capacity"
+
+# 事件名
+EVENT_TASK_COMPLETED = "tasks_completed"
+EVENT_LLM_CALL = "llm_calls"
+EVENT_LLM_THROTTLED = "llm_throttled"
+
+redis_client = lazy_redis()
+
+
+@dataclass
+class QueueSnapshot:
+    ready: int
+    oldest_ready_age_seconds: float
+    processing: int
+    delayed: int
+    bulk: int
+    deferred: int
+    live_workers: int           # 存活的 worker 进程数
+    live_hosts: int             # 存活的 worker 主机（容器）数，即副本数
+    inflight: int
+    worker_inflight: dict[str, int]
+    capacity: int               # 存活 worker 进程的 worker_loop 线程总数，即能同时处理的任务数
+    completion_rate: float      # 每秒完成的任务数
+    llm_call_rate: float        # 每秒 LLM 调用数
+    llm_throttle_ratio: float   # 429 占 LLM 调用的比例
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _bucket_key(event: str, bucket: int) -> str:
+    return f"doc_llm:stats:{event}:{bucket}"
+
+
+def record_event(event: str, value: int = 1) -> None:
+    """记录一次事件；统计失败不影响业务"""
+    metrics_registry.inc(f"doc_llm_{event}_total", value)
+    key = _bucket_key(event, int(time.time()) // STATS_BUCKET_SECONDS)
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.incrby(key, value)
+        pipe.expire(key, STATS_TTL_SECONDS)
+        pipe.execute()
+    except redis.RedisError:
+        logger.debug(f"failed to record stats event {event}", exc_info=True)
+
+
+def event_rate(event: str, window_seconds: int = STATS_RATE_WINDOW_SECONDS) -> float:
+    """最近 window_seconds 内（不含当前未结束的分钟）的每秒事件数"""
+    buckets = max(window_seconds // STATS_BUCKET_SECONDS, 1)
+    current = int(time.time()) // STATS_BUCKET_SECONDS
+    values = redis_client.mget([_bucket_key(event, current - i) for i in range(1, buckets + 1)])
+    return sum(int(v) for v in values if v) / (buckets * STATS_BUCKET_SECONDS)
+
+
+def worker_id() -> str:
+    # 每次现取 pid：supervisor fork 出的子进程不能沿用父进程的 ID
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+_inflight_lock = threading.Lock()
+_inflight = 0
+_capacity = 0
+
+
+def add_worker_slots(delta: int) -> None:
+    """worker_loop 线程启动 / 退出时调用，本进程能同时处理的任务数随之增减"""
+    global _capacity
+    with _inflight_lock:
+        _capacity += delta
+    worker_heartbeat()
+
+
+@contextmanager
+def inflight_scope():
+    """标记本进程正在处理一个任务；同一进程的多个 worker 线程共用一个计数"""
+    global _inflight
+    with _inflight_lock:
+        _inflight += 1
+    worker_heartbeat()
+    try:
+        yield
+    finally:
+        with _inflight_lock:
+            _inflight -= 1
+        worker_heartbeat()
+
+
+def worker_heartbeat() -> None:
+    """worker 进程上报存活、在途任务数和并发数"""
+    inflight = _inflight
+    metrics_registry.set_gauge("doc_llm_worker_inflight", inflight)
+    current = worker_id()
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zadd(WORKERS_KEY, {current: time.time()})
+        pipe.hset(WORKER_INFLIGHT_KEY, current, inflight)
+        pipe.hset(WORKER_CAPACITY_KEY, current, _capacity)
+        pipe.execute()
+    except redis.RedisError:
+        logger.debug("failed to report worker heartbeat", exc_info=True)
+
+
+def _enqueued_at(raw: bytes | None) -> float | None:
+    if raw is None:
+        return None
+    try:
+        payload = json_codec.loads(raw)
+    except Exception:
+        return None
+    if "enqueued_at" in payload:
+        return float(payload["enqueued_at"])
+    if "deadline" in payload:
+        return float(payload["deadline"]) - TASK_DEADLINE_SECONDS
+    return None
+
+
+def queue_snapshot() -> QueueSnapshot:
+    now = time.time()
+    stale_before = now - WORKER_STALE_SECONDS
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(TASK_QUEUE_READY_KEY)
+    pipe.lindex(TASK_QUEUE_READY_KEY, -1)  # LPUSH 入队、从右侧取，最右边是最老的任务
+    pipe.zcard(TASK_PROCESSING_DEADLINES_KEY)
+    pipe.zcard(TASK_QUEUE_DELAYED_KEY)
+    pipe.zcard(TASK_QUEUE_BULK_KEY)
+    pipe.llen(TASK_QUEUE_DEFERRED_KEY)
+    pipe.zrangebyscore(WORKERS_KEY, stale_before, "+inf")
+    pipe.zrangebyscore(WORKERS_KEY, "-inf", stale_before)
+    ready, oldest_raw, processing, delayed, bulk, deferred, workers, stale = pipe.execute()
+    if stale:
+        # 被 kill / 缩容掉的 worker 不会自己清理，顺手删掉
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.zrem(WORKERS_KEY, *stale)
+        pipe.hdel(WORKER_INFLIGHT_KEY, *stale)
+        pipe.hdel(WORKER_CAPACITY_KEY, *stale)
+        pipe.execute()
+
+    worker_ids = [w.decode("utf-8") if isinstance(w, bytes) else w for w in workers]
+    worker_inflight = {}
+    capacity = 0
+    if worker_ids:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hmget(WORKER_INFLIGHT_KEY, worker_ids)
+        pipe.hmget(WORKER_CAPACITY_KEY, worker_ids)
+        values, capacities = pipe.execute()
+        worker_inflight = {w: int(v or 0) for w, v in zip(worker_ids, values)}
+        capacity = sum(int(v or 0) for v in capacities)
+
+    enqueued_at = _enqueued_at(oldest_raw)
+    llm_call_rate = event_rate(EVENT_LLM_CALL)
+    throttle_rate = event_rate(EVENT_LLM_THROTTLED)
+    return QueueSnapshot(
+        ready=ready,
+        oldest_ready_age_seconds=max(now - enqueued_at, 0.0) if enqueued_at else 0.0,
+        processing=processing,
+        delayed=delayed,
+        bulk=bulk,
+        deferred=deferred,
+        live_workers=len(worker_ids),
+        live_hosts=len({w.rsplit(":", 1)[0] for w in worker_ids}),
+        inflight=sum(worker_inflight.values()),
+        worker_inflight=worker_inflight,
+        capacity=capacity,
+        completion_rate=event_rate(EVENT_TASK_COMPLETED),
+        llm_call_rate=llm_call_rate,
+        llm_throttle_ratio=throttle_rate / llm_call_rate if llm_call_rate else 0.0,
+    )
+
+
+_snapshot_lock = threading.Lock()
+_snapshot_cache: tuple[float, QueueSnapshot] | None = None
+
+
+def _cached_snapshot() -> QueueSnapshot:
+    global _snapshot_cache
+    with _snapshot_lock:
+        if _snapshot_cache is None or time.monotonic() - _snapshot_cache[0] > SNAPSHOT_CACHE_SECONDS:
+            _snapshot_cache = (time.monotonic(), queue_snapshot())
+        return _snapshot_cache[1]
+
+
+def register_queue_gauges(registry: MetricsRegistry = metrics_registry) -> None:
+    """把队列快照注册成 /metrics 里的 gauge（采集时才查询 Redis）"""
+    simple = {
+        "doc_llm_queue_ready_length": "ready",
+        "doc_llm_queue_oldest_age_seconds": "oldest_ready_age_seconds",
+        "doc_llm_queue_processing": "processing",
+        "doc_llm_queue_delayed": "delayed",
+        "doc_llm_queue_bulk": "bulk",
+        "doc_llm_queue_deferred": "deferred",
+        "doc_llm_workers_live": "live_workers",
+        "doc_llm_worker_hosts_live": "live_hosts",
+        "doc_llm_tasks_inflight": "inflight",
+        "doc_llm_worker_capacity": "capacity",
+        "doc_llm_task_completion_rate": "completion_rate",
+        "doc_llm_llm_call_rate": "llm_call_rate",
+        "doc_llm_llm_throttle_ratio": "llm_throttle_ratio",
+    }
+    for name, field in simple.items():
+        registry.register_gauge_callback(name, lambda field=field: getattr(_cached_snapshot(), field))
+    registry.register_gauge_callback(
+        "doc_llm_worker_inflight_by_worker",
+        lambda: {(("worker", w),): float(n) for w, n in _cached_snapshot().worker_inflight.items()},
+    )
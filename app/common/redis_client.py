@@ -0,0 +1,141 @@
+# app/common/redis_client.py
+# 进程内共享的 Redis 客户端工厂：统一连接池、超时和指标
+# 客户端在第一次使用时才创建；fork 出的子进程（gunicorn --preload、supervisor）重新创建自己的连接池
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+
+import redis
+from redis.connection import BlockingConnectionPool
+from redis.utils import HIREDIS_AVAILABLE
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
+REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
+REDIS_DB = int(os.getenv("REDIS_DB", "0"))
+
+# 每个进程的最大连接数，gunicorn gthread 下至少要大于 --threads
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "32"))
+# 连接池耗尽时等待空闲连接的时间（秒），超时抛 ConnectionError
+REDIS_POOL_TIMEOUT_SECONDS = float(os.getenv("REDIS_POOL_TIMEOUT_SECONDS", "5"))
+# 读写超时必须大于阻塞命令（如 brpoplpush timeout=10）的等待时间
+REDIS_SOCKET_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_TIMEOUT_SECONDS", "30"))
+REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS = float(os.getenv("REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS", "5"))
+REDIS_HEALTH_CHECK_INTERVAL_SECONDS = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL_SECONDS", "30"))
+REDIS_SOCKET_KEEPALIVE = os.getenv("REDIS_SOCKET_KEEPALIVE", "1") == "1"
+# auto: 安装了 hiredis 就用；0: 强制纯 Python 解析器
+REDIS_USE_HIREDIS = os.getenv("REDIS_USE_HIREDIS", "auto")
+
+_client: redis.Redis | None = None
+_client_lock = threading.Lock()
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """记录从连接池取连接的等待时间和取不到连接的次数（连接池饱和信号）"""
+
+    def get_connection(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().get_connection(*args, **kwargs)
+        except redis.ConnectionError as e:
+            # 只有等不到空闲连接才算连接池饱和，连不上 Redis 属于另一类错误
+            if "No connection available" in str(e):
+                registry.inc("redis_pool_exhausted_total")
+            raise
+        finally:
+            registry.observe("redis_pool_wait_seconds", time.perf_counter() - start)
+
+    def in_use_count(self) -> int:
+        """已创建但未归还的连接数"""
+        idle = sum(1 for conn in list(self.pool.queue) if conn is not None)
+        return len(self._connections) - idle
+
+
+class InstrumentedRedis(redis.Redis):
+    """按命令记录耗时"""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            command = str(args[0]).lower() if args else "unknown"
+            registry.observe("redis_command_seconds", time.perf_counter() - start, command=command)
+
+
+def _build_pool() -> InstrumentedConnectionPool:
+    connection_kwargs = dict(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        db=REDIS_DB,
+        password=REDIS_PASSWORD,
+        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+        socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT_SECONDS,
+        socket_keepalive=REDIS_SOCKET_KEEPALIVE,
+        health_check_interval=REDIS_HEALTH_CHECK_INTERVAL_SECONDS,
+    )
+    if REDIS_USE_HIREDIS == "0":
+        from redis.connection import _RESP2Parser
+        connection_kwargs["parser_class"] = _RESP2Parser
+    elif REDIS_USE_HIREDIS == "1" and not HIREDIS_AVAILABLE:
+        logger.warning("REDIS_USE_HIREDIS=1 but hiredis is not installed, using python parser")
+
+    return InstrumentedConnectionPool(
+        max_connections=REDIS_MAX_CONNECTIONS,
+        timeout=REDIS_POOL_TIMEOUT_SECONDS,
+        **connection_kwargs,
+    )
+
+
+def get_redis() -> redis.Redis:
+    """返回进程内共享的 Redis 客户端（首次调用时创建，连接在首次使用时才建立）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                pool = _build_pool()
+                registry.register_gauge_callback("redis_pool_in_use", pool.in_use_count)
+                registry.register_gauge_callback("redis_pool_max", lambda: pool.max_connections)
+                _client = InstrumentedRedis(connection_pool=pool)
+                logger.info(
+                    f"redis client created, host={REDIS_HOST}:{REDIS_PORT}, "
+                    f"max_connections={REDIS_MAX_CONNECTIONS}, hiredis={HIREDIS_AVAILABLE}"
+                )
+    return _client
+
+
+
+def _reset_after_fork() -> None:
+    # 子进程不能沿用父进程的连接池（socket 会被父子进程同时读写），丢掉引用后下次使用时重建
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class _LazyRedis:
+    """模块级 redis_client 的占位对象：访问属性时才取 get_redis()，import 模块不再创建连接池"""
+
+    __slots__ = ()
+
+    def __getattr__(self, name):
+        return getattr(get_redis(), name)
+
+    def __repr__(self) -> str:
+        return "<lazy doc_llm redis client>"
+
+
+_lazy_client = _LazyRedis()
+
+
+def lazy_redis() -> redis.Redis:
+    """供模块级变量使用的延迟客户端，用法与 get_redis() 的返回值相同"""
+    return _lazy_client  # type: ignore[return-value]
@@ -7,6 +7,11 @@ import logging
 from dataclasses import dataclass
 from typing import Callable, Type, Any, Tuple, TypeVar
 
+from .deadline import DeadlineExceededError, check_deadline, time_remaining
+from .tracing import span
+
+logger = logging.getLogger(__name__)
+
 T = TypeVar('T')
 
 
@@ -49,6 +54,9 @@ def retry_with_backoff(
     @retry_with_backoff(BackoffConfig(max_retries=3, base_delay=0.5))
 
     @retry_with_backoff(max_retries=3, base_delay=0.5)
+
+    存在 deadline（见 app.common.deadline）时，每次尝试前检查；
+    下一次退避等待会越过 deadline 时不再睡眠，直接抛 DeadlineExceededError。
     """
     if cfg is None:
         cfg = BackoffConfig(**cfg_kwargs)
@@ -60,6 +68,7 @@ def retry_with_backoff(
             last_exc: BaseException | None = None
 
             for attempt in range(cfg.max_retries):
+                check_deadline(func.__name__)
                 try:
                     return func(*args, **kwargs)
                 except cfg.retry_exceptions as e:
@@ -67,15 +76,26 @@ def retry_with_backoff(
 
                     # 最后一次重试失败，抛出异常
                     if attempt == cfg.max_retries - 1:
-                        logging.error(f"[RETRY] final failure after {cfg.max_retries} attempts: {e}")
+                        logger.error(f"[RETRY] final failure after {cfg.max_retries} attempts: {e}")
                         raise
 
                     sleep_time = _calc_sleep(delay, cfg)
-                    logging.error(
+                    remaining = time_remaining()
+                    if remaining is not None and sleep_time >= remaining:
+                        logger.error(
+                            f"[RETRY] func={func.__name__}, attempt={attempt+1}/{cfg.max_retries}, "
+                            f"give up, deadline in {remaining:.2f}s < sleep={sleep_time:.2f}s, err={e}"
+                        )
+                        raise DeadlineExceededError(
+                            f"{func.__name__} retry aborted: deadline exceeded"
+                        ) from e
+
+                    logger.error(
                         f"[RETRY] func={func.__name__}, attempt={attempt+1}/{cfg.max_retries}, "
                         f"sleep={sleep_time:.2f}s, err={e}"
                     )
-                    time.sleep(sleep_time)
+                    with span("backoff_sleep", func=func.__name__):
+                        time.sleep(sleep_time)
                     delay *= cfg.factor
 
             if last_exc is not None:
@@ -0,0 +1,109 @@
+# app/common/task_queue.py
+# 任务队列相关的 Redis key 与消息格式，controller / worker / reaper 共用
+from __future__ import annotations
+import os
+import random
+import time
+from datetime import datetime, time as dt_time, timedelta
+
+from app.common import json_codec
+
+TASK_QUEUE_READY_KEY = "doc_llm:task_queue:ready"
+TASK_QUEUE_PROCESSING_KEY = "doc_llm:task_queue:processing"
+TASK_QUEUE_DEFERRED_KEY = "doc_llm:task_queue:deferred"
+# processing 队列里每个任务的心跳截止时间（ZSET，member=task_id，score=unix 秒），reaper 按 score 范围查询超时任务
+TASK_PROCESSING_DEADLINES_KEY = "doc_llm:zset:processing_deadlines"
+# task_id -> processing 队列中的原始消息，reaper 回收时用它 LREM
+TASK_PROCESSING_PAYLOAD_KEY = "doc_llm:hash:processing_payload"
+# 延迟任务（ZSET，member=delayed_member，score=可入队的 unix 秒）：reaper 回收后的退避、指定 not_before 的任务，
+# 到期后由 scheduler 无条件搬进 ready 队列
+TASK_QUEUE_DELAYED_KEY = "doc_llm:task_queue:delayed"
+# 低优先级批量任务（同上格式）：到期后还要在 run_window 时间窗内、且 ready 队列有余量时才搬进 ready 队列
+TASK_QUEUE_BULK_KEY = "doc_llm:task_queue:bulk"
+
+# 任务从 worker 取出开始的处理时间预算（秒），超过后放弃处理，0 表示不限制。
+# 排队时间不计入，积压时排在后面的任务不会还没轮到就过期
+TASK_DEADLINE_SECONDS = int(os.getenv("TASK_DEADLINE_SECONDS", "1800"))
+# 超过该时长没有心跳的 processing 任务视为卡死，由 reaper 回收
+PROCESSING_TIMEOUT_SECONDS = int(os.getenv("PROCESSING_TIMEOUT_SECONDS", "600"))
+# 每个任务最多被回收重试的次数，用完后进入 dead_letter，不再占用 worker
+MAX_TASK_RETRIES = int(os.getenv("MAX_TASK_RETRIES", "3"))
+# 回收后重新入队前的退避：base * 2^(retry_count-1)，上限 max
+RETRY_BACKOFF_BASE_SECONDS = float(os.getenv("RETRY_BACKOFF_BASE_SECONDS", "60"))
+RETRY_BACKOFF_MAX_SECONDS = float(os.getenv("RETRY_BACKOFF_MAX_SECONDS", "1800"))
+
+
+def build_task_payload(task_id: int, task_name: str | None) -> str:
+    """构造队列消息，带上入队时间（用于统计排队时长）"""
+    payload = {
+        "task_id": task_id,
+        "task_name": task_name,
+        "enqueued_at": int(time.time()),
+    }
+    return json_codec.dumps(payload)
+
+
+def build_delayed_member(task_id: int, task_name: str | None, run_window: str | None = None) -> str:
+    """
+    延迟 / 批量 ZSET 的 member：不带入队时间，搬进 ready 队列时再用 build_task_payload 生成，
+    等待期间不计入排队时长；同一任务重复写入只会更新 score
+    """
+    member = {"task_id": task_id, "task_name": task_name}
+    if run_window:
+        member["run_window"] = run_window
+    return json_codec.dumps(member)
+
+
+def parse_task_payload(raw: bytes | str) -> dict:
+    """解析队列消息，格式不合法时抛异常"""
+    return json_codec.loads(raw)
+
+
+def task_deadline(now: float | None = None) -> float | None:
+    """worker 取出任务时计算本次执行的 deadline：当前时间 + TASK_DEADLINE_SECONDS，不限制时为 None"""
+    if TASK_DEADLINE_SECONDS <= 0:
+        return None
+    return (now if now is not None else time.time()) + TASK_DEADLINE_SECONDS
+
+
+def processing_deadline(now: float | None = None) -> int:
+    """processing 任务的心跳截止时间：当前时间 + PROCESSING_TIMEOUT_SECONDS"""
+    return int(now if now is not None else time.time()) + PROCESSING_TIMEOUT_SECONDS
+
+
+def retry_backoff_seconds(retry_count: int) -> float:
+    """第 retry_count 次回收后的等待时间，带 ±20% 抖动，避免一批任务同时回到队列"""
+    delay = min(RETRY_BACKOFF_BASE_SECONDS * 2 ** max(retry_count - 1, 0), RETRY_BACKOFF_MAX_SECONDS)
+    return random.uniform(delay * 0.8, delay * 1.2)
+
+
+def parse_run_window(value: str) -> tuple[dt_time, dt_time]:
+    """解析 "HH:MM-HH:MM"（本地时间，结束早于开始表示跨零点），格式不合法时抛 ValueError"""
+    try:
+        start_str, end_str = value.split("-")
+        start = datetime.strptime(start_str.strip(), "%H:%M").time()
+        end = datetime.strptime(end_str.strip(), "%H:%M").time()
+    except ValueError:
+        raise ValueError(f"run_window 格式应为 HH:MM-HH:MM: {value!r}")
+    if start == end:
+        raise ValueError(f"run_window 开始与结束不能相同: {value!r}")
+    return start, end
+
+
+def in_run_window(value: str, now: datetime) -> bool:
+    start, end = parse_run_window(value)
+    current = now.time()
+    if start < end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def next_run_window_start(value: str, now: datetime) -> datetime:
+    """now 之后最近一次时间窗开始的时刻（now 已在窗口内时返回 now）"""
+    if in_run_window(value, now):
+        return now
+    start, _ = parse_run_window(value)
+    candidate = datetime.combine(now.date(), start)
+    if candidate <= now:
+        candidate += timedelta(days=1)
+    return candidate
@@ -0,0 +1,139 @@
+# app/common/tracing.py
+# 任务处理各阶段的耗时 span，通过 contextvar 归到当前任务的 trace 下：
+#   - 各阶段耗时汇总写进任务结果 meta.timings_ms
+#   - 设置 TRACE_EXPORT_FILE 时，每个任务的完整 span 列表以一行 JSON 追加到文件，便于离线分析
+#   - 设置 TRACE_OTEL_ENABLED=1 且安装了 opentelemetry-api 时，同时生成 OpenTelemetry span
+#     （exporter 由 opentelemetry-instrument / OTEL_* 环境变量配置）
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Iterator, Optional
+
+from .metrics import registry as metrics_registry
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:  # 可选依赖
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "")
+TRACE_OTEL_ENABLED = os.getenv("TRACE_OTEL_ENABLED", "0") == "1"
+
+_otel_tracer = otel_trace.get_tracer("doc_llm") if (TRACE_OTEL_ENABLED and otel_trace) else None
+_export_lock = threading.Lock()
+
+
+@dataclass
+class SpanRecord:
+    name: str
+    start: float            # unix 时间戳，秒
+    duration_ms: float
+    parent: Optional[str] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+class TaskTrace:
+    """一次任务处理产生的所有 span"""
+
+    def __init__(self, name: str, attributes: dict[str, Any]):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes
+        self.spans: list[SpanRecord] = []
+        # 累加型计数（如 LLM token 用量），随结果写进 meta.usage
+        self.counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, record: SpanRecord) -> None:
+        with self._lock:
+            self.spans.append(record)
+
+    def count(self, name: str, value: int) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stage_timings_ms(self) -> dict[str, float]:
+        """按 span 名称汇总耗时（同名多次，如重试中的多次 LLM 调用，累加）"""
+        totals: dict[str, float] = {}
+        with self._lock:
+            for record in self.spans:
+                totals[record.name] = totals.get(record.name, 0.0) + record.duration_ms
+        return {name: round(ms, 1) for name, ms in totals.items()}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = [asdict(record) for record in self.spans]
+            counters = dict(self.counters)
+        return {
+            "trace_id": self.trace_id, "name": self.name, "attributes": self.attributes,
+            "counters": counters, "spans": spans,
+        }
+
+
+_current_trace: ContextVar[Optional[TaskTrace]] = ContextVar("doc_llm_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("doc_llm_span", default=None)
+
+
+def current_trace() -> Optional[TaskTrace]:
+    """当前调用链所属的 trace，不在 trace_scope 内时为 None"""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[None]:
+    """
+    记录 with 块的耗时。任何地方都可以调用：
+    不在 trace_scope 内时只上报 doc_llm_stage_seconds 指标。
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    otel_cm = _otel_tracer.start_as_current_span(name, attributes=attributes) if _otel_tracer else nullcontext()
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        with otel_cm:
+            yield
+    except BaseException as e:
+        attributes["error"] = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - t0
+        _current_span.reset(token)
+        metrics_registry.observe("doc_llm_stage_seconds", duration, stage=name)
+        if trace is not None:
+            trace.add(SpanRecord(name, start, round(duration * 1000, 3), parent, attributes))
+
+
+@contextmanager
+def trace_scope(name: str, **attributes: Any) -> Iterator[TaskTrace]:
+    """开启一个任务级 trace，结束时导出"""
+    trace = TaskTrace(name, attributes)
+    token = _current_trace.set(trace)
+    try:
+        with span(name, **attributes):
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        export_trace(trace)
+
+
+def export_trace(trace: TaskTrace) -> None:
+    """JSON 导出：一行一个 trace，写失败只记日志"""
+    if not TRACE_EXPORT_FILE:
+        return
+    line = json.dumps(trace.to_dict(), ensure_ascii=False, default=str)
+    try:
+        with _export_lock, open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError:
+        logger.exception(f"export trace to {TRACE_EXPORT_FILE} failed")
@@ -1,6 +1,22 @@
 # app/llm/__init__.py
-from .llm_client import chat_with_model, init_llm
-from .doc_check_llm import run_doc_check, parse_doc_check_answer, run_doc_check_structured
+# 按需导入：import app.llm.llm_config 等轻量模块时不连带加载 dashscope
+from importlib import import_module
+
+_EXPORTS = {
+    "init_llm": ".llm_client",
+    "chat_with_model": ".llm_client",
+    "run_doc_check": ".doc_check_llm",
+    "parse_doc_check_answer": ".doc_check_llm",
+    "run_doc_check_structured": ".doc_check_llm",
+}
+
+
+def __getattr__(name: str):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
 
 
 __all__ = [
@@ -9,4 +25,4 @@ __all__ = [
     "run_doc_check",
     "parse_doc_check_answer",
     "run_doc_check_structured",
-]
\ No newline at end of file
+]
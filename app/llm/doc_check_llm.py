@@ -1,22 +1,40 @@
 # app/llm/doc_check_llm.py
-from typing import Optional
-from ..prompt_loader import load_latest_prompt
+from typing import Iterator, Optional
+from ..prompt_loader import load_latest_prompt_version, load_prompt
 from .llm_client import chat_with_model
+from .llm_config import default_model
+import json
+import logging
+import os
 import re
 
+logger = logging.getLogger(__name__)
+
+# 开启后要求模型直接输出 JSON（DashScope response_format=json_object），跳过文本解析；
+# 模型不支持或输出不是合法 JSON 时自动退回文本解析
+LLM_STRUCTURED_OUTPUT = os.getenv("LLM_STRUCTURED_OUTPUT", "0") == "1"
+
+_STRUCTURED_OUTPUT_INSTRUCTION = (
+    "请只输出一个 JSON 对象，不要输出任何其他内容，格式如下：\n"
+    '{"bugs": [{"id": "001", "type": "问题类型", "description": "问题描述", "suggestion": "优化建议"}]}\n'
+    "没有问题时输出 {\"bugs\": []}"
+)
+
 
 def run_doc_check(doc: str,
                   product: Optional[str] = None,
-                  feature: Optional[str] = None) -> str:
+                  feature: Optional[str] = None,
+                  structured: bool = False,
+                  prompt_version: Optional[str] = None,
+                  model: Optional[str] = None) -> str:
     """
-    使用 latest prompt + 文档内容，调用大模型进行“文档检查”。
+    使用指定版本的 prompt（默认 latest）+ 文档内容，调用大模型（默认 ALIYUN_MODEL）进行“文档检查”。
 
-    暂时返回的是模型原始回答字符串，
-    以后可以改成返回结构化 JSON（错误列表等）。
+    返回模型原始回答字符串；structured=True 时要求模型输出 JSON 对象。
     """
-    prompt = load_latest_prompt()
+    prompt = load_prompt(prompt_version)
     if not prompt:
-        raise RuntimeError("No prompt available")
+        raise RuntimeError(f"No prompt available, version={prompt_version or 'latest'}")
     
     user_content_parts = []
     if product:
@@ -27,7 +45,7 @@ def run_doc_check(doc: str,
     
     user_content_parts.append("以下是需要你进行测试/审查的文档内容：")
     user_content_parts.append(doc)
-    print(f"------------------user_content_parts: {user_content_parts}-----------------------")
+    logger.debug(f"run_doc_check product={product!r}, doc_chars={len(doc)}")
 
     user_content = "\n\n".join(user_content_parts)
 
@@ -42,10 +60,64 @@ def run_doc_check(doc: str,
         },
     ]
 
-    answer = chat_with_model(messages)
+    if structured:
+        messages.insert(1, {"role": "system", "content": _STRUCTURED_OUTPUT_INSTRUCTION})
+        return chat_with_model(messages, response_format={"type": "json_object"}, model=model)
+
+    answer = chat_with_model(messages, model=model)
     return answer
 
 
+# 每个 bug 从“问题编号：”开始（不要求在行首，允许 markdown 加粗），到下一个“问题编号：”为止
+_BUG_START_RE = re.compile(r"问题编号[ \t*_]*[:：]")
+# 编号可以和“问题编号：”不在同一行
+_BUG_ID_RE = re.compile(r"\s*[#﹟]?\s*(\d+)")
+# 字段行：允许前面带 **、#、- 等 markdown 修饰和 “1.” “2)” “3、” 这类列表序号，中英文冒号都接受
+_FIELD_RE = re.compile(r"[>#*\-\s]*(?:\d+[.)、．][>#*\-\s]*)?(问题类型|问题描述|优化建议)[\s*_]*[:：]\s*(.*)")
+# 只有列表序号 / markdown 修饰的行（下一个 bug 的 “2.” 前缀）
+_LIST_MARKER_RE = re.compile(r"[>#*\-\s]*(?:\d+[.)、．])?[>#*\-\s]*")
+_FIELD_NAMES = {"问题类型": "type", "问题描述": "description", "优化建议": "suggestion"}
+
+
+def _parse_bug_segment(answer: str, start: int, end: int) -> dict:
+    """解析 answer[start:end]（一个“问题编号：”之后到下一个之前的内容）"""
+    id_match = _BUG_ID_RE.match(answer, start, end)
+    bug = {"id": id_match.group(1) if id_match else None}
+    lines = answer[id_match.end() if id_match else start:end].splitlines()
+    # 紧挨下一个“问题编号”的列表序号属于下一个 bug
+    if lines and _LIST_MARKER_RE.fullmatch(lines[-1]):
+        lines.pop()
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        name = _FIELD_NAMES.get(line[:4]) if line[4:5] == "：" else None
+        if name:
+            # 最常见的“问题类型：xxx”，不走正则
+            bug[name] = line[5:].strip().rstrip("*").strip()
+            continue
+        field = _FIELD_RE.fullmatch(line)
+        if field:
+            bug[_FIELD_NAMES[field.group(1)]] = field.group(2).strip().rstrip("*").strip()
+        else:
+            bug.setdefault("extra", []).append(line)
+    return bug
+
+
+def iter_doc_check_bugs(answer: str) -> Iterator[dict]:
+    """
+    逐个产出模型文本报告里的 bug dict（finditer 找到下一个“问题编号：”才产出上一个）。
+    第一个“问题编号”之前的内容忽略；无法识别的行放进 extra
+    """
+    prev_end = None
+    for match in _BUG_START_RE.finditer(answer):
+        if prev_end is not None:
+            yield _parse_bug_segment(answer, prev_end, match.start())
+        prev_end = match.end()
+    if prev_end is not None:
+        yield _parse_bug_segment(answer, prev_end, len(answer))
+
+
 def parse_doc_check_answer(answer: str) -> dict:
     """
     把大模型返回的“文本报告”解析成结构化 bug 列表。
@@ -62,45 +134,40 @@ def parse_doc_check_answer(answer: str) -> dict:
     Returns:
         dict: 解析后的结构化结果
     """
-    bugs = []
-    # 注意中文、英文类型冒号都要匹配到来
-    segments = re.split(r'问题编号[:：]', answer)
-    print(f"[parse_doc_check_answer] split segments: {len(segments)}")
-    for seg in segments[1:]:
-        seg = seg.strip()
-        if not seg:
-            continue
+    return {
+        "bugs": list(iter_doc_check_bugs(answer)),
+        "raw_answer": answer,
+    }
 
-        m = re.match(r"[#﹟]?\s*(\d+)\s*(.*)", seg, re.S)
-        if m:
-            bug_id =m.group(1)
-            rest = m.group(2).strip()
-        else:
-            bug_id = None
-            rest = seg
-
-        lines = [l.strip() for l in rest.splitlines() if l.strip()]
-        bug = {"id": bug_id}
-        for line in lines:
-            if line.startswith("问题类型"):
-                bug["type"] = line.split("：", 1)[-1].strip()
-            elif line.startswith("问题描述"):
-                bug["description"] = line.split("：", 1)[-1].strip()
-            elif line.startswith("优化建议"):
-                bug["suggestion"] = line.split("：", 1)[-1].strip()
-            else:
-                bug.setdefault("extra", []).append(line)
 
-        bugs.append(bug)
+def parse_structured_answer(answer: str) -> Optional[list[dict]]:
+    """解析 JSON 模式的回答，格式不符合约定时返回 None，由调用方退回文本解析"""
+    try:
+        data = json.loads(answer)
+    except ValueError:
+        return None
+    items = data.get("bugs") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        return None
 
-    return {
-        "bugs": bugs,
-        "raw_answer": answer,}
+    bugs = []
+    for i, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            return None
+        raw_id = str(item.get("id") or "").lstrip("#﹟").strip()
+        bug = {"id": raw_id or f"{i:03d}"}
+        for field in ("type", "description", "suggestion"):
+            if item.get(field) is not None:
+                bug[field] = str(item[field]).strip()
+        bugs.append(bug)
+    return bugs
 
 
 def run_doc_check_structured(doc: str,
                              product: Optional[str] = None,
-                             feature: Optional[str] = None) -> dict:
+                             feature: Optional[str] = None,
+                             prompt_version: Optional[str] = None,
+                             model: Optional[str] = None) -> dict:
     """
     进行文档检测，并返回结构化结果。
 
@@ -108,14 +175,29 @@ def run_doc_check_structured(doc: str,
         doc (str): 待检测文档内容
         product : 产品名称.
         feature : 功能点名称.
+        prompt_version : prompt 版本号，None 表示 latest.
+        model : 模型名称，None 表示 ALIYUN_MODEL.
 
     Returns:
         dict: 结构化检测结果
     """
-    answer = run_doc_check(doc, product, feature)
-    structured_result = parse_doc_check_answer(answer)
+    answer = run_doc_check(
+        doc, product, feature, structured=LLM_STRUCTURED_OUTPUT, prompt_version=prompt_version, model=model
+    )
+    bugs = parse_structured_answer(answer) if LLM_STRUCTURED_OUTPUT else None
+    if bugs is not None:
+        structured_result = {"bugs": bugs, "raw_answer": answer}
+        output_mode = "json"
+    else:
+        if LLM_STRUCTURED_OUTPUT:
+            logger.warning("structured answer is not valid JSON, fallback to text parser")
+        structured_result = parse_doc_check_answer(answer)
+        output_mode = "text"
     structured_result['meta'] = {
         "product": product,
         "feature": feature,
+        "prompt_version": prompt_version or load_latest_prompt_version(),
+        "model": model or default_model(),
+        "output_mode": output_mode,
     }
     return structured_result
\ No newline at end of file
@@ -0,0 +1,174 @@
+# app/llm/doc_diff.py
+# 段落级 diff：只把改动的段落交给大模型，未改动段落的 bug 直接沿用旧结果
+from __future__ import annotations
+import difflib
+import os
+import re
+from typing import Optional
+
+from app.common.tracing import span
+from .doc_check_llm import run_doc_check_structured
+
+# 依赖全文才能判断的问题类型：局部片段里检查不出，局部检查的这类结果丢弃，旧结果按功能点是否被改动段落提到决定是否沿用
+WHOLE_DOC_BUG_TYPES = ("功能点未覆盖",)
+# 改动段落占新文本段落数的比例超过该值时不做局部复检，返回 None 由调用方全文检测
+DIFF_FULL_CHECK_RATIO = float(os.getenv("DIFF_FULL_CHECK_RATIO", "0.5"))
+
+# 问题描述里引用原文的片段：“xxx” "xxx" 「xxx」 『xxx』 ‘xxx’
+_QUOTE_RE = re.compile(r"[“\"「『‘]([^”\"」』’\n]{2,200})[”\"」』’]")
+
+
+def paragraph_spans(text: str) -> list[tuple[int, str]]:
+    """按行切分段落，返回 (段落在原文中的起始偏移, 段落文本)，忽略空行"""
+    spans = []
+    pos = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if stripped:
+            spans.append((pos + line.index(stripped[0]), stripped))
+        pos += len(line)
+    return spans
+
+
+def split_paragraphs(text: str) -> list[str]:
+    """按行切分段落，忽略空行（markdown 文档里一行通常就是一个段落 / 列表项）"""
+    return [paragraph for _, paragraph in paragraph_spans(text)]
+
+
+def _locate(bug: dict, paragraphs: list[str]) -> Optional[tuple[int, int]]:
+    """返回 (段落下标, 引用片段在段落内的偏移)，找不到返回 None"""
+    texts = [bug.get("description") or ""] + list(bug.get("extra") or [])
+    for text in texts:
+        for snippet in _QUOTE_RE.findall(text):
+            for i, paragraph in enumerate(paragraphs):
+                pos = paragraph.find(snippet)
+                if pos >= 0:
+                    return i, pos
+    return None
+
+
+def locate_bug(bug: dict, paragraphs: list[str]) -> Optional[int]:
+    """根据问题描述中引用的原文片段，找到 bug 所在的段落下标，找不到返回 None"""
+    located = _locate(bug, paragraphs)
+    return located[0] if located else None
+
+
+def annotate_offsets(bugs: list[dict], text: str) -> list[dict]:
+    """给每个 bug 补上 offset（引用片段在全文中的字符偏移），定位不到为 None"""
+    spans = paragraph_spans(text)
+    paragraphs = [paragraph for _, paragraph in spans]
+    annotated = []
+    for bug in bugs:
+        located = _locate(bug, paragraphs)
+        offset = spans[located[0]][0] + located[1] if located else None
+        annotated.append({**bug, "offset": offset})
+    return annotated
+
+
+def _is_whole_doc_bug(bug: dict) -> bool:
+    bug_type = bug.get("type") or ""
+    return any(t in bug_type for t in WHOLE_DOC_BUG_TYPES)
+
+
+def _renumber(bugs: list[dict]) -> list[dict]:
+    return [{**bug, "id": f"{i:03d}"} for i, bug in enumerate(bugs, start=1)]
+
+
+def recheck_changed_paragraphs(
+    old_text: str,
+    old_result: dict,
+    new_text: str,
+    product: Optional[str] = None,
+    feature: Optional[str] = None,
+    context: int = 1,
+    prompt_version: Optional[str] = None,
+    model: Optional[str] = None,
+    max_changed_ratio: float = DIFF_FULL_CHECK_RATIO,
+) -> Optional[dict]:
+    """
+    对比新旧文本，只检查新增 / 修改的段落（前后各带 context 段上下文），
+    与旧结果中仍然存在的段落上的 bug 合并。
+
+    - 定位到未改动段落的旧 bug：沿用，offset 按段落在新文本中的位置重算
+    - 定位到已删除 / 已修改段落的旧 bug：丢弃（改动段落会重新检查）
+    - 功能点未覆盖类的旧 bug：引用的功能点出现在改动段落里时丢弃（视为已补上），否则沿用
+    - 其余定位不到段落的旧 bug：沿用
+    - 新检查结果里落在上下文段落（未改动）上的 bug、功能点未覆盖类 bug：丢弃
+
+    Returns:
+        dict: 与 run_doc_check_structured 相同结构，bug 带 offset，meta 中带 diff 统计；
+        raw_answer 只是本次改动段落的回答（没有改动段落时为空），沿用 bug 出自的旧回答放在 meta.diff.base_raw_answer；
+        改动段落占比超过 max_changed_ratio 时返回 None，由调用方全文检测
+    """
+    old_spans = paragraph_spans(old_text)
+    new_spans = paragraph_spans(new_text)
+    old_paragraphs = [paragraph for _, paragraph in old_spans]
+    new_paragraphs = [paragraph for _, paragraph in new_spans]
+    matcher = difflib.SequenceMatcher(None, old_paragraphs, new_paragraphs, autojunk=False)
+    with span("paragraph_diff"):
+        opcodes = matcher.get_opcodes()
+
+    # 未改动段落：旧下标 -> 新下标，用来重算沿用 bug 的 offset
+    old_to_new: dict[int, int] = {}
+    changed_new: set[int] = set()
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            old_to_new.update(zip(range(i1, i2), range(j1, j2)))
+        elif tag in ("replace", "insert"):
+            changed_new.update(range(j1, j2))
+    if new_paragraphs and len(changed_new) > len(new_paragraphs) * max_changed_ratio:
+        return None
+
+    carried = []
+    for bug in old_result.get("bugs") or []:
+        located = _locate(bug, old_paragraphs)
+        if located and located[0] in old_to_new:
+            new_idx = old_to_new[located[0]]
+            carried.append({**bug, "offset": new_spans[new_idx][0] + located[1]})
+        elif _is_whole_doc_bug(bug):
+            mentioned = _locate(bug, new_paragraphs)
+            if mentioned is None or mentioned[0] not in changed_new:
+                carried.extend(annotate_offsets([bug], new_text))
+        elif located is None:
+            carried.extend(annotate_offsets([bug], new_text))
+
+    new_bugs: list[dict] = []
+    raw_answer = ""
+    checked_chars = 0
+    if changed_new:
+        indices = sorted({
+            j
+            for i in changed_new
+            for j in range(i - context, i + context + 1)
+            if 0 <= j < len(new_paragraphs)
+        })
+        snippet = "\n".join(new_paragraphs[j] for j in indices)
+        checked_chars = len(snippet)
+        # 带上功能点清单，改动段落超出功能点的问题能查出来；片段外的功能会被判为未覆盖，这类结果下面丢弃
+        partial = run_doc_check_structured(snippet, product, feature, prompt_version=prompt_version, model=model)
+        raw_answer = partial.get("raw_answer", "")
+        for bug in partial.get("bugs") or []:
+            if _is_whole_doc_bug(bug):
+                continue
+            located = _locate(bug, new_paragraphs)
+            if located and located[0] not in changed_new:
+                continue
+            offset = new_spans[located[0]][0] + located[1] if located else None
+            new_bugs.append({**bug, "offset": offset})
+
+    return {
+        "bugs": _renumber(carried + new_bugs),
+        "raw_answer": raw_answer,
+        "meta": {
+            "diff": {
+                "old_paragraphs": len(old_paragraphs),
+                "new_paragraphs": len(new_paragraphs),
+                "changed_paragraphs": len(changed_new),
+                "checked_chars": checked_chars,
+                "total_chars": len(new_text),
+                "carried_bugs": len(carried),
+                "new_bugs": len(new_bugs),
+                "base_raw_answer": old_result.get("raw_answer", ""),
+            },
+        },
+    }
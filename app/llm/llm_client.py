@@ -1,12 +1,25 @@
 # app/llm/llm_client.py
-# 统一管理大模型调用，提供配置
-import configparser
-from pathlib import Path
+# 统一管理大模型调用，配置和熔断器见 llm_config
+import os
+from typing import Optional
 import dashscope
 import logging
+import requests
 
 from http import HTTPStatus
-from app.common import BackoffConfig, RetryableError, retry_with_backoff
+from app.common import (
+    BackoffConfig,
+    DeadlineExceededError,
+    RetryableError,
+    check_deadline,
+    retry_with_backoff,
+    time_remaining,
+)
+from app.common.tracing import current_trace, span
+from app.common import queue_stats
+from .llm_config import default_model, get_api_key, llm_circuit_breaker
+
+logger = logging.getLogger(__name__)
 
 
 class LLMRetryableError(RetryableError):
@@ -24,45 +37,99 @@ _llm_backoff_config = BackoffConfig(
 )
 
 
-BASE_DIR = Path(__file__).resolve().parents[2]
-CONFIG_FILE = BASE_DIR / "config.cfg"
+# 单次 LLM 请求的超时上限（秒），存在任务 deadline 时取两者较小值
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
 
-config = configparser.ConfigParser()
-config.read(CONFIG_FILE, encoding="utf-8")
 
-ALIYUN_API_KEY = config.get("default", "ALIYUN_API_KEY", fallback=None)
-ALIYUN_MODEL = config.get("default", "ALIYUN_MODEL")
+def init_llm():
+    """进程启动时调用一次，设置 dashscope 默认 api_key（chat_with_model 每次调用也会显式传入）"""
+    api_key = get_api_key()
+    if not api_key:
+        logger.warning("No ALIYUN_API_KEY configured in config.cfg")
+    dashscope.api_key = api_key
 
 
-def init_llm():
-    """在Flask启动时调用一次，设置api_key"""
-    if not ALIYUN_API_KEY:
-        print("[WARN] No ALIYUN_API_KEY configured in config.cfg")
-    dashscope.api_key = ALIYUN_API_KEY
+def _count_usage(usage) -> None:
+    """把 token 用量累加到当前任务的 trace（重试中的多次调用一并计入）"""
+    trace = current_trace()
+    if trace is None or not usage:
+        return
+    for name in ("input_tokens", "output_tokens"):
+        value = usage.get(name) if hasattr(usage, "get") else getattr(usage, name, None)
+        if value:
+            trace.count(name, int(value))
 
 
 @retry_with_backoff(_llm_backoff_config)
-def chat_with_model(messages: list[dict]) -> str:
+def chat_with_model(
+    messages: list[dict],
+    response_format: Optional[dict] = None,
+    model: Optional[str] = None,
+) -> str:
     """调用大模型进行对话
 
     Args:
         messages (list[dict]): 消息列表，格式参考OpenAI Chat API
+        response_format (dict): 结构化输出格式，如 {"type": "json_object"}，None 表示普通文本
+        model (str): 模型名称，None 表示使用配置的 ALIYUN_MODEL（default_model()）
 
     Returns:
         str: 模型回复内容
+
+    Raises:
+        CircuitOpenError: 熔断器打开时直接抛出，不进入退避重试
+        DeadlineExceededError: 任务 deadline 已过
     """
-    if not ALIYUN_API_KEY:
+    api_key = get_api_key()
+    if not api_key:
         raise ValueError("No ALIYUN_API_KEY configured")
 
-    response = dashscope.Generation.call(
-        model=ALIYUN_MODEL,
-        messages=messages,
-    )
+    timeout = LLM_REQUEST_TIMEOUT_SECONDS
+    remaining = time_remaining()
+    if remaining is not None:
+        check_deadline("LLM call")
+        timeout = min(timeout, remaining)
+
+    model = model or default_model()
+    extra_kwargs = {"response_format": response_format} if response_format else {}
+
+    llm_circuit_breaker.before_call()
+    try:
+        with span("llm_call", model=model):
+            response = dashscope.Generation.call(
+                model=model,
+                messages=messages,
+                api_key=api_key,
+                request_timeout=timeout,
+                **extra_kwargs,
+            )
+    except requests.exceptions.RequestException as e:
+        # 被 deadline 截断的超时不计入熔断，但要释放半开探测锁，否则其他调用要等探测锁过期
+        try:
+            check_deadline("LLM call")
+        except DeadlineExceededError:
+            llm_circuit_breaker.release_probe()
+            raise
+        llm_circuit_breaker.record_failure()
+        raise LLMRetryableError(f"LLM request error: {e!r}") from e
+    except Exception:
+        llm_circuit_breaker.record_failure()
+        raise
 
     status = getattr(response, "status_code", None)
-    logging.info(f"[LLM RAW] status={status}, resp={response}")
+    queue_stats.record_event(queue_stats.EVENT_LLM_CALL)
+    if status == HTTPStatus.TOO_MANY_REQUESTS:
+        queue_stats.record_event(queue_stats.EVENT_LLM_THROTTLED)
+    logger.info(
+        f"LLM call finished, status={status}, "
+        f"request_id={getattr(response, 'request_id', None)}, usage={getattr(response, 'usage', None)}"
+    )
+    # 原始回答可能有几十 KB，只采样输出，并由日志配置统一截断
+    logger.debug("[LLM RAW] status=%s, resp=%s", status, response, extra={"sample": True})
 
     if status == HTTPStatus.OK:
+        llm_circuit_breaker.record_success()
+        _count_usage(getattr(response, "usage", None))
         answer = response["output"]["choices"][0]["message"]["content"]
         return answer
     
@@ -75,12 +142,15 @@ def chat_with_model(messages: list[dict]) -> str:
     }
 
     if status in retryable_status:
+        llm_circuit_breaker.record_failure()
         raise LLMRetryableError(
             f"LLM transient error, status={status}, "
             f"code={getattr(response, 'code', None)}, "
             f"message={getattr(response, 'message', None)}"
         )
     
+    # 其余 4xx 是请求本身的问题，后端有正常应答：记为成功，半开探测时关闭熔断器、释放探测锁
+    llm_circuit_breaker.record_success()
     raise RuntimeError(
         f"LLM call failed, status={status}, "
         f"code={getattr(response, 'code', None)}, "
@@ -0,0 +1,49 @@
+# app/llm/llm_config.py
+# LLM 配置和熔断器，不依赖 dashscope SDK：
+#   - config.cfg 在第一次用到时才读取，环境变量 ALIYUN_API_KEY / ALIYUN_MODEL 优先
+#   - controller 的 /health、/ready、熔断状态检查只需要本模块，不会为此加载整套 LLM 依赖
+import configparser
+import os
+import threading
+from pathlib import Path
+
+from app.common import CircuitBreakerConfig, RedisCircuitBreaker
+from app.common.redis_client import lazy_redis
+
+BASE_DIR = Path(__file__).resolve().parents[2]
+CONFIG_FILE = BASE_DIR / "config.cfg"
+
+_config: configparser.ConfigParser | None = None
+_config_lock = threading.Lock()
+
+
+def get_config() -> configparser.ConfigParser:
+    """config.cfg 的解析结果，进程内只读一次"""
+    global _config
+    if _config is None:
+        with _config_lock:
+            if _config is None:
+                config = configparser.ConfigParser()
+                config.read(CONFIG_FILE, encoding="utf-8")
+                _config = config
+    return _config
+
+
+def get_api_key() -> str | None:
+    return os.getenv("ALIYUN_API_KEY") or get_config().get("default", "ALIYUN_API_KEY", fallback=None)
+
+
+def default_model() -> str:
+    """未指定模型时使用的模型名称"""
+    return os.getenv("ALIYUN_MODEL") or get_config().get("default", "ALIYUN_MODEL")
+
+
+# 所有进程共享的 LLM 熔断器：后端整体不可用时快速失败，不再逐个任务退避重试
+llm_circuit_breaker = RedisCircuitBreaker(
+    lazy_redis(),
+    "dashscope",
+    CircuitBreakerConfig(
+        failure_threshold=int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5")),
+        open_seconds=float(os.getenv("LLM_CIRCUIT_OPEN_SECONDS", "30")),
+    ),
+)
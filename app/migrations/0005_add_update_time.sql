@@ -0,0 +1,4 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    ADD COLUMN update_time DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '最后更新时间' AFTER create_time;
@@ -0,0 +1,5 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    ADD COLUMN callback_url VARCHAR(1024) NULL COMMENT '任务结束后回调的地址' AFTER feature,
+    ADD COLUMN callback_batch TINYINT(1) NOT NULL DEFAULT 0 COMMENT '回调方是否接受批量推送' AFTER callback_url;
@@ -0,0 +1,4 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    ADD COLUMN previous_task_id BIGINT NULL COMMENT '上一版本文档的任务ID，设置时只复检改动段落' AFTER feature;
@@ -0,0 +1,5 @@
+USE doc_llm;
+
+-- reaper 兜底扫描 status = 'processing' AND processing_started_at < ? 用
+ALTER TABLE task_doc_llm
+    ADD INDEX idx_status_started (status, processing_started_at);
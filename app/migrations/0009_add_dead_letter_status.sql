@@ -0,0 +1,6 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    MODIFY COLUMN status ENUM('pending','processing','success','failed','dead_letter')
+    NOT NULL DEFAULT 'pending'
+    COMMENT '任务状态';
@@ -0,0 +1,16 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    ADD COLUMN idempotency_key VARCHAR(64) NULL COMMENT '提交幂等键（sha256），同一个键只会创建一个任务' AFTER previous_task_id,
+    ADD UNIQUE KEY uq_idempotency_key (idempotency_key);
+
+-- 事务性 outbox：任务行与入队消息同一事务写入，由 controller / relay 发布到 Redis 后删除
+CREATE TABLE IF NOT EXISTS task_outbox (
+    id          BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '自增主键',
+    task_id     BIGINT UNSIGNED NOT NULL COMMENT '待入队的任务ID',
+    task_name   VARCHAR(255)    NULL COMMENT '任务名称，写进队列消息',
+    create_time DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '写入时间',
+
+    PRIMARY KEY (id),
+    KEY idx_task_id (task_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
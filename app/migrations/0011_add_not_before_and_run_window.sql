@@ -0,0 +1,5 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    ADD COLUMN not_before DATETIME NULL COMMENT '最早开始处理的时间，之前只在延迟队列里等待' AFTER previous_task_id,
+    ADD COLUMN run_window VARCHAR(11) NULL COMMENT '低优先级批量任务的运行时间窗 HH:MM-HH:MM' AFTER not_before;
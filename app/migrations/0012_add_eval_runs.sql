@@ -0,0 +1,40 @@
+USE doc_llm;
+
+ALTER TABLE task_doc_llm
+    ADD COLUMN prompt_version VARCHAR(32) NULL COMMENT '使用的 prompt 版本，NULL 表示最新版本' AFTER run_window,
+    ADD COLUMN model VARCHAR(64) NULL COMMENT '使用的模型，NULL 表示默认模型' AFTER prompt_version;
+
+-- 评测：语料 × prompt 版本 × 模型的所有组合
+CREATE TABLE IF NOT EXISTS eval_run (
+    id               BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '评测ID，自增主键',
+    name             VARCHAR(255)    NOT NULL COMMENT '评测名称',
+    prompt_versions  JSON            NOT NULL COMMENT '参与对比的 prompt 版本列表',
+    models           JSON            NOT NULL COMMENT '参与对比的模型列表',
+    doc_count        INT             NOT NULL COMMENT '语料文档数',
+    max_concurrency  INT             NOT NULL COMMENT '同时在队列 / 处理中的任务数上限',
+    status           ENUM('running', 'finished') NOT NULL DEFAULT 'running' COMMENT '评测状态',
+    report           JSON            NULL COMMENT '对比报告，评测结束时生成',
+    create_time      DATETIME        NOT NULL DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+    finish_time      DATETIME        NULL COMMENT '结束时间',
+
+    PRIMARY KEY (id),
+    KEY idx_eval_status (status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- 评测中的每个组合，cache_key 相同且已成功的组合直接复用已有任务
+CREATE TABLE IF NOT EXISTS eval_run_item (
+    id              BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '自增主键',
+    run_id          BIGINT UNSIGNED NOT NULL COMMENT '所属评测ID',
+    doc_index       INT             NOT NULL COMMENT '文档在语料中的下标',
+    source_task_id  BIGINT UNSIGNED NULL COMMENT '语料来自已有任务时的原任务ID',
+    prompt_version  VARCHAR(32)     NOT NULL COMMENT 'prompt 版本',
+    model           VARCHAR(64)     NOT NULL COMMENT '模型',
+    cache_key       CHAR(64)        NOT NULL COMMENT 'sha256(文档, 产品, 功能点, prompt 版本, 模型)',
+    task_id         BIGINT UNSIGNED NOT NULL COMMENT '执行该组合的任务ID（复用时为已有任务）',
+    reused          TINYINT(1)      NOT NULL DEFAULT 0 COMMENT '是否复用了已有结果',
+    dispatched      TINYINT(1)      NOT NULL DEFAULT 0 COMMENT '任务是否已入队',
+
+    PRIMARY KEY (id),
+    KEY idx_run_dispatched (run_id, dispatched),
+    KEY idx_cache_key (cache_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
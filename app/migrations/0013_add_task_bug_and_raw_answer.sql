@@ -0,0 +1,30 @@
+USE doc_llm;
+
+-- 紧凑结果格式：bugs 按行拆到 task_bug，原始回答压缩后放 task_raw_answer，
+-- task_doc_llm.result 只保留 meta 等小字段。已有任务的 result 保持原样，读取时两种格式都支持
+CREATE TABLE IF NOT EXISTS task_bug (
+    id           BIGINT UNSIGNED NOT NULL AUTO_INCREMENT COMMENT '自增主键',
+    task_id      BIGINT UNSIGNED NOT NULL COMMENT '所属任务ID',
+    seq          INT             NOT NULL COMMENT '在结果 bugs 列表中的下标',
+    product      VARCHAR(100)    NULL COMMENT '任务的产品名称（冗余，便于按产品查询）',
+    bug_type     VARCHAR(64)     NULL COMMENT '问题类型',
+    bug_no       VARCHAR(32)     NULL COMMENT '模型给出的问题编号',
+    description  TEXT            NULL COMMENT '问题描述',
+    suggestion   TEXT            NULL COMMENT '优化建议',
+    `offset`     INT             NULL COMMENT '问题在文档中的字符位置',
+    extra        JSON            NULL COMMENT '其余字段，原样保存',
+
+    PRIMARY KEY (id),
+    KEY idx_bug_task_seq (task_id, seq),
+    KEY idx_bug_product_type (product, bug_type),
+    KEY idx_bug_type (bug_type)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+CREATE TABLE IF NOT EXISTS task_raw_answer (
+    task_id   BIGINT UNSIGNED NOT NULL COMMENT '任务ID',
+    codec     VARCHAR(8)      NOT NULL COMMENT '压缩算法：zstd / zlib',
+    raw_size  INT             NOT NULL COMMENT '压缩前的字节数',
+    data      MEDIUMBLOB      NOT NULL COMMENT '压缩后的原始回答（UTF-8）',
+
+    PRIMARY KEY (task_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
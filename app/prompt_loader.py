@@ -1,9 +1,15 @@
 # app/prompt_loader.py
+import hashlib
+import logging
+from functools import lru_cache
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 APP_DIR = Path(__file__).resolve().parent
 PROMPT_DIR = APP_DIR / "prompt_store"
 PROMPT_LATEST_FILE = PROMPT_DIR / "doc-llm-latest.md"
+PROMPT_VERSION_GLOB = "doc-llm-*.prompt.md"
 
 def load_latest_prompt() -> str | None:
     """加载最新的Prompt内容
@@ -15,8 +21,59 @@ def load_latest_prompt() -> str | None:
         with PROMPT_LATEST_FILE.open("r", encoding="utf-8") as f:
             return f.read()
     except FileNotFoundError:
-        print(f"[WARN] Prompt file not found: {PROMPT_LATEST_FILE}")
+        logger.warning(f"Prompt file not found: {PROMPT_LATEST_FILE}")
         return None
     except Exception as e:
-        print(f"[ERROR] Failed to load prompt file: {repr(e)}")
-        return None
\ No newline at end of file
+        logger.error(f"Failed to load prompt file: {repr(e)}")
+        return None
+
+
+def get_prompt_version(prompt: str) -> str:
+    """
+    返回与 prompt 内容一致的版本号（如 "1.0.2"），
+    prompt_store 里找不到相同内容时返回 "sha-<内容哈希前 8 位>"
+    """
+    for path in sorted(PROMPT_DIR.glob(PROMPT_VERSION_GLOB)):
+        try:
+            if path.read_text(encoding="utf-8") == prompt:
+                return path.name[len("doc-llm-"):-len(".prompt.md")]
+        except OSError:
+            continue
+    return "sha-" + hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+
+
+def load_latest_prompt_version() -> str | None:
+    """最新 prompt 对应的版本号，prompt 不存在时返回 None"""
+    prompt = load_latest_prompt()
+    if not prompt:
+        return None
+    return get_prompt_version(prompt)
+
+
+def _version_file(version: str) -> Path:
+    return PROMPT_DIR / f"doc-llm-{version}.prompt.md"
+
+
+def list_prompt_versions() -> list[str]:
+    """prompt_store 中所有带版本号的 prompt，按版本号排序"""
+    versions = [path.name[len("doc-llm-"):-len(".prompt.md")] for path in PROMPT_DIR.glob(PROMPT_VERSION_GLOB)]
+    return sorted(versions, key=lambda v: tuple(int(p) if p.isdigit() else 0 for p in v.split(".")))
+
+
+@lru_cache(maxsize=32)
+def _load_versioned_prompt(version: str) -> str | None:
+    # 带版本号的 prompt 文件发布后不再修改，可以长期缓存
+    try:
+        return _version_file(version).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        logger.warning(f"Prompt version not found: {version}")
+        return None
+
+
+def load_prompt(version: str | None = None) -> str | None:
+    """加载指定版本的 prompt，version 为空时加载最新版本；版本不存在返回 None"""
+    if not version:
+        return load_latest_prompt()
+    if version not in list_prompt_versions():
+        return None
+    return _load_versioned_prompt(version)
\ No newline at end of file
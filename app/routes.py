@@ -1,14 +1,51 @@
 # app/routes.py
-from flask import jsonify, request, Blueprint, render_template
-from .llm.llm_client import chat_with_model
-from .prompt_loader import load_latest_prompt
-from .llm.doc_check_llm import run_doc_check_structured
-from .services import doc_check_service, file_service
-from app.llm.llm_client import LLMRetryableError
+from flask import jsonify, request, Blueprint, render_template, Response, stream_with_context
+from .llm.llm_config import llm_circuit_breaker
+from .prompt_loader import list_prompt_versions, load_latest_prompt, load_latest_prompt_version
+from .services import doc_check_service, eval_service, file_service, health_service, webhook_service
+from app.common import json_codec
+from app.common.metrics import registry as metrics_registry
+from app.common.models import TaskStatus, TERMINAL_TASK_STATUSES
+from app.common.task_queue import parse_run_window
+from datetime import datetime, timezone
 import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
 
 bp = Blueprint('main', __name__)
 
+TASK_WAIT_MAX_SECONDS = 60
+NDJSON_MIMETYPE = "application/x-ndjson"
+TASK_EVENTS_MAX_SECONDS = 600
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+EVAL_MODEL_NAME_MAX_LENGTH = 64
+BUG_LIST_MAX_LIMIT = 1000
+
+# /doc_check/ 同步等待结果的上限（秒），只在客户端要求等待时生效，超过后返回 202，避免长时间占住 gunicorn 线程
+DOC_CHECK_WAIT_SECONDS = float(os.getenv("DOC_CHECK_WAIT_SECONDS", "25"))
+DOC_CHECK_TASK_NAME = "doc_check"
+# success 任务详情允许客户端缓存的时间（秒），过期后带 If-None-Match 再验证；任务可能被删除 / 重试，不能永久缓存
+TASK_RESULT_MAX_AGE_SECONDS = int(os.getenv("TASK_RESULT_MAX_AGE_SECONDS", "60"))
+
+
+def _conditional_response(payload: dict, resource):
+    """
+    给响应加上 ETag / Last-Modified / Cache-Control，并处理 If-None-Match / If-Modified-Since，
+    命中时返回 304。success 任务结果允许客户端缓存 TASK_RESULT_MAX_AGE_SECONDS 秒，其余每次都要再验证。
+    """
+    response = jsonify(payload)
+    response.set_etag(resource.etag)
+    if resource.last_modified is not None:
+        response.last_modified = datetime.fromtimestamp(resource.last_modified, tz=timezone.utc)
+    if resource.terminal:
+        response.cache_control.public = True
+        response.cache_control.max_age = TASK_RESULT_MAX_AGE_SECONDS
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
 
 @bp.route("/tasks/page/", methods=["GET"])
 def tasks_page():
@@ -24,12 +61,33 @@ def hello():
 
 @bp.route("/health")
 def health():
+    """进程存活检查，不访问任何外部依赖"""
     return "ok", 200
 
 
+@bp.route("/ready")
+def ready():
+    """依赖就绪检查（MySQL / Redis / MinIO），结果缓存几秒；有依赖不可用时返回 503"""
+    result = health_service.readiness()
+    if result["ready"]:
+        return jsonify({"service_code": 2000, "data": result}), 200
+    return jsonify({"service_code": 5002, "msg": "依赖服务不可用", "data": result}), 503
+
+
+@bp.route("/metrics")
+def metrics():
+    """Prometheus 格式的进程内指标（Redis 连接池使用数、等待时间、命令耗时等）"""
+    return Response(
+        metrics_registry.render_prometheus(),
+        mimetype="text/plain; version=0.0.4; charset=utf-8",
+    )
+
+
 @bp.route("/llm_test/")
 def llm_test():
     """测试与大模型的对话功能，只用看是否联通即可"""
+    from .llm.llm_client import chat_with_model
+
     try:
         messages = [
             {'role': 'system', 'content': 'You are a helpful assistant.'},
@@ -38,13 +96,15 @@ def llm_test():
         answer = chat_with_model(messages)
         return jsonify({"answer": answer})
     except Exception as e:
-        print("LLM error:", repr(e))
+        logger.exception(f"LLM error: {e!r}")
         return jsonify({"error": str(e)}), 500
     
 
 @bp.route("/llm_with_prompt/")
 def llm_with_prompt():
     """测试最新的Prompt与大模型对话，只用看是否联通即可"""
+    from .llm.llm_client import chat_with_model
+
     prompt = load_latest_prompt()
     if not prompt:
         return jsonify({"error": "No prompt available"}), 500
@@ -63,7 +123,7 @@ def llm_with_prompt():
         return jsonify({"answer": answer})
     
     except Exception as e:
-        print("LLM with prompt error:", repr(e))
+        logger.exception(f"LLM with prompt error: {e!r}")
         return jsonify({"error": str(e)}), 500
     
 
@@ -72,8 +132,10 @@ def doc_check():
     """
     文档检测接口：
     - 入参：JSON { doc, product, feature }
-    - 逻辑：读取 latest prompt + doc → 调用通义模型
-    - 出参：先返回模型原始回答，后面可以改成结构化 JSON
+    - 逻辑：提交到任务队列由 worker 调用大模型，默认立即返回，不在 gunicorn 线程里等待
+    - 出参：默认返回 202 + task_id，可通过 /tasks/<task_id>/wait/ 等待结果；
+            请求头 Prefer: wait=N 或 ?wait=1 时最多等待 min(N, DOC_CHECK_WAIT_SECONDS) 秒，
+            期间完成则直接返回结构化结果，否则仍返回 202
     """
     data = request.get_json(silent=True) or {}
     doc = data.get("doc", "").strip()
@@ -82,29 +144,82 @@ def doc_check():
 
     if not doc:
         return jsonify({"error": "No doc provided"}), 400
-    
-    try:
-        result = run_doc_check_structured(doc, product, feature)
-        return jsonify(result)
-    except LLMRetryableError as e:
-        logging.warning(f"LLM backend unavailable after retries: {repr(e)}")
+
+    if not llm_circuit_breaker.allows_requests():
+        logger.warning("LLM circuit open, doc_check fail fast")
         return jsonify({"error": "LLM service temporarily unavailable"}), 503
-    
-    except RuntimeError as e:
-        logging.error(f"Doc check runtime error: {repr(e)}")
-        return jsonify({"error": "Doc check failed: " + str(e)}), 502
-    
-    except Exception as e:
-        logging.exception(f"Unexpected doc_check error")
+
+    wait_seconds = _doc_check_wait_seconds()
+
+    try:
+        idempotency_key = _parse_idempotency_key(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        try:
+            task_id = doc_check_service.submit_doc_task(
+                DOC_CHECK_TASK_NAME, doc, product, feature, idempotency_key=idempotency_key
+            )
+        except doc_check_service.DuplicateTaskError as e:
+            # 客户端超时重试：不再新建任务，直接等待已有任务的结果
+            task_id = e.task_id
+        if wait_seconds <= 0:
+            return _doc_check_accepted(task_id)
+
+        task_detail = doc_check_service.wait_task_detail(task_id, wait_seconds)
+    except Exception:
+        logger.exception(f"Unexpected doc_check error")
         return jsonify({"error": "Internal server error"}), 500
 
+    if not task_detail:
+        return jsonify({"error": "Doc check task disappeared", "task_id": task_id}), 500
+    if task_detail["status"] == TaskStatus.success:
+        return jsonify(task_detail["result"])
+    if task_detail["status"] in (TaskStatus.failed, TaskStatus.dead_letter):
+        error = (task_detail["result"] or {}).get("error")
+        logger.error(f"Doc check task {task_id} failed: {error}")
+        return jsonify({"error": f"Doc check failed: {error}", "task_id": task_id}), 502
+    return _doc_check_accepted(task_id)
+
+
+def _doc_check_wait_seconds() -> float:
+    """客户端要求同步等待的秒数（Prefer: wait=N 或 ?wait=1），不超过 DOC_CHECK_WAIT_SECONDS；不要求时为 0"""
+    match = re.search(r"(?:^|[,;\s])wait=(\d+)", request.headers.get("Prefer", ""))
+    if match:
+        return min(float(match.group(1)), DOC_CHECK_WAIT_SECONDS)
+    if _parse_bool(request.args.get("wait")):
+        return DOC_CHECK_WAIT_SECONDS
+    return 0.0
+
+
+def _doc_check_accepted(task_id: int):
+    """202：检测仍在进行，告诉客户端去哪里继续等结果"""
+    wait_url = f"/tasks/{task_id}/wait/"
+    response = jsonify({
+        "task_id": task_id,
+        "status": "accepted",
+        "wait_url": wait_url,
+        "task_url": f"/tasks/{task_id}/",
+    })
+    response.status_code = 202
+    response.headers["Location"] = wait_url
+    return response
+
 
 @bp.route("/tasks/", methods=["POST"])
 def create_doc_task():
     """
     提交文档检查任务
-    入参：JSON { task_name, doc }
+    入参：JSON { task_name, doc, product, feature, callback_url, callback_batch, previous_task_id, idempotency_key,
+                 not_before, run_window }
     出参：JSON { service_code, msg, task_id }
+    幂等：请求头 Idempotency-Key（或字段 idempotency_key）相同的提交只创建一个任务，重复提交返回已有 task_id；
+          不提供时按内容哈希在 IDEMPOTENCY_WINDOW_SECONDS 内去重（文件上传只支持显式幂等键）
+    not_before（可选）：最早开始处理的时间，unix 秒或 ISO 8601（不带时区按服务器本地时间）
+    run_window（可选）：HH:MM-HH:MM，作为低优先级批量任务只在该时间窗内、队列空闲时处理
+    callback_url（可选）：任务结束后把结果 POST 到该地址；callback_batch 为 true 时可与其他任务合并推送
+    previous_task_id（可选）：上一版本文档的任务ID，只复检改动段落，未改动段落的 bug 直接沿用
 
     新的文件上传方式：
         Content-Type: multipart/form-data
@@ -112,6 +227,10 @@ def create_doc_task():
             task_name: 文本
             product: 文本（可选）
             feature: 文本（可选）
+            callback_url: 文本（可选）
+            callback_batch: true/false（可选）
+            previous_task_id: 上一版本任务ID（可选）
+            not_before / run_window: 同 JSON（可选）
             file: 文件
         此时 doc 字段会被写成：minio://doc-llm-bucket/{task_id}_{filename}
     """
@@ -135,21 +254,47 @@ def _create_task_with_file():
         return jsonify({"service_code": 4001, "msg": "task_name 是必填字段"}), 400
     if not file_obj:
         return jsonify({"service_code": 4001, "msg": "file 是必填字段"}), 400
+    try:
+        callback_url = webhook_service.validate_callback_url(form.get("callback_url"))
+    except webhook_service.InvalidCallbackUrlError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    callback_batch = _parse_bool(form.get("callback_batch"))
+    try:
+        previous_task_id = _parse_previous_task_id(form.get("previous_task_id"))
+        idempotency_key = _parse_idempotency_key(form)
+        not_before, run_window = _parse_schedule(form)
+    except ValueError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
     
     task_name = str(task_name).strip()
+    task_id = None
     try:
         placeholder_doc = "__PENDING_FILE__"
-        task_id = doc_check_service.submit_doc_task(task_name=task_name, doc=placeholder_doc, product=product, feature=feature)
+        # 先建任务拿到 task_id 作为文件名前缀，文件落盘并更新 doc 后才入队
+        task_id = doc_check_service.submit_doc_task(
+            task_name=task_name, doc=placeholder_doc, product=product, feature=feature, enqueue=False,
+            callback_url=callback_url, callback_batch=callback_batch, previous_task_id=previous_task_id,
+            idempotency_key=idempotency_key, not_before=not_before, run_window=run_window,
+        )
         doc_path = file_service.save_task_file(task_id, file_obj)
-        doc_check_service.update_task_doc(task_id, doc_path)
+        doc_check_service.attach_task_file(task_id, task_name, doc_path)
         return jsonify({
             "service_code": 2000,
             "msg": "任务创建成功（文件已上传）",
             "task_id": task_id,
             "doc": doc_path,
         })
+    except doc_check_service.DuplicateTaskError as e:
+        return _duplicate_task_response(e.task_id)
+    except doc_check_service.TaskNotFoundError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
     except Exception as e:
-        logging.exception("Failed to create doc task with file")
+        logger.exception("Failed to create doc task with file")
+        if task_id is not None:
+            try:
+                doc_check_service.fail_task(task_id, "文件上传失败: " + str(e))
+            except Exception:
+                logger.exception(f"Failed to mark task {task_id} as failed")
         return jsonify({
             "service_code": 5001,
             "msg": "任务创建失败: " + str(e),
@@ -167,66 +312,358 @@ def _create_task_with_json():
         return jsonify({"service_code": 4001, "msg": "doc 是必填字段"}), 400
     if task_name is None or not str(task_name).strip():
         return jsonify({"service_code": 4001, "msg": "task_name 是必填字段"}), 400
+    try:
+        callback_url = webhook_service.validate_callback_url(data.get("callback_url"))
+    except webhook_service.InvalidCallbackUrlError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    callback_batch = _parse_bool(data.get("callback_batch"))
+    try:
+        previous_task_id = _parse_previous_task_id(data.get("previous_task_id"))
+        idempotency_key = _parse_idempotency_key(data)
+        not_before, run_window = _parse_schedule(data)
+    except ValueError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
     
     doc = str(doc).strip()
     task_name = str(task_name).strip()
 
     try:
-        task_id = doc_check_service.submit_doc_task(task_name, doc, product, feature)
+        task_id = doc_check_service.submit_doc_task(
+            task_name, doc, product, feature,
+            callback_url=callback_url, callback_batch=callback_batch, previous_task_id=previous_task_id,
+            idempotency_key=idempotency_key, not_before=not_before, run_window=run_window,
+        )
         return jsonify({
             "service_code": 2000,
             "msg": "任务创建成功",
             "task_id": task_id,
         })
+    except doc_check_service.DuplicateTaskError as e:
+        return _duplicate_task_response(e.task_id)
+    except doc_check_service.TaskNotFoundError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
     except Exception as e:
-        logging.exception("Failed to create doc task")
+        logger.exception("Failed to create doc task")
         return jsonify({
             "service_code": 5001,
             "msg": "任务创建失败: " + str(e),
         }), 500
     
 
+def _duplicate_task_response(task_id: int):
+    """幂等键重复：返回已有任务，客户端按成功处理"""
+    return jsonify({
+        "service_code": 2000,
+        "msg": "重复提交，返回已有任务",
+        "task_id": task_id,
+        "duplicate": True,
+    })
+
+
+def _parse_idempotency_key(data) -> str | None:
+    """请求头 Idempotency-Key 优先，其次是请求体 / 表单里的 idempotency_key"""
+    value = request.headers.get("Idempotency-Key") or data.get("idempotency_key")
+    if value is None or not str(value).strip():
+        return None
+    value = str(value).strip()
+    if len(value) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        raise ValueError(f"idempotency_key 长度不能超过 {IDEMPOTENCY_KEY_MAX_LENGTH}")
+    return value
+
+
+def _parse_not_before(value) -> datetime | None:
+    """unix 秒或 ISO 8601，统一转成服务器本地时间（与 create_time 一致）"""
+    if value is None or str(value).strip() == "":
+        return None
+    value = str(value).strip()
+    try:
+        return datetime.fromtimestamp(float(value))
+    except (ValueError, OverflowError, OSError):
+        pass
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"not_before 格式不合法: {value!r}")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+def _parse_schedule(data) -> tuple[datetime | None, str | None]:
+    """解析 not_before / run_window，格式不合法时抛 ValueError"""
+    not_before = _parse_not_before(data.get("not_before"))
+    run_window = data.get("run_window")
+    if run_window is None or not str(run_window).strip():
+        return not_before, None
+    start, end = parse_run_window(str(run_window).strip())
+    return not_before, f"{start:%H:%M}-{end:%H:%M}"
+
+
+def _parse_bool(value) -> bool:
+    """兼容 JSON bool 和表单里的 "true"/"1" 字符串"""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def _parse_previous_task_id(value) -> int | None:
+    """previous_task_id 可为空，非空时必须是正整数"""
+    if value is None or not str(value).strip():
+        return None
+    try:
+        task_id = int(str(value).strip())
+    except ValueError:
+        raise ValueError("previous_task_id 必须是整数") from None
+    if task_id <= 0:
+        raise ValueError("previous_task_id 必须是正整数")
+    return task_id
+
+
+@bp.route("/tasks/batch/", methods=["POST"])
+def create_doc_tasks_batch():
+    """
+    批量提交文档检查任务
+    入参：JSON { tasks: [{ task_name, doc, product, feature }, ...], callback_url, callback_batch, idempotency_key,
+                 not_before, run_window }
+    出参：JSON { service_code, msg, task_ids }
+    幂等键作用于整批，重复提交时返回与第一次相同的 task_ids
+    not_before / run_window 作用于整批，适合在限流额度空闲时段跑大批量语料
+    """
+    data = request.get_json(silent=True) or {}
+    tasks = data.get("tasks")
+    if not tasks or not isinstance(tasks, list):
+        return jsonify({"service_code": 4001, "msg": "tasks 必须是非空列表"}), 400
+
+    cleaned = []
+    for i, item in enumerate(tasks):
+        if not isinstance(item, dict):
+            return jsonify({"service_code": 4001, "msg": f"tasks[{i}] 格式错误"}), 400
+        doc = item.get("doc")
+        task_name = item.get("task_name")
+        if doc is None or not str(doc).strip():
+            return jsonify({"service_code": 4001, "msg": f"tasks[{i}].doc 是必填字段"}), 400
+        if task_name is None or not str(task_name).strip():
+            return jsonify({"service_code": 4001, "msg": f"tasks[{i}].task_name 是必填字段"}), 400
+        cleaned.append({
+            "task_name": str(task_name).strip(),
+            "doc": str(doc).strip(),
+            "product": item.get("product"),
+            "feature": item.get("feature"),
+        })
+
+    try:
+        callback_url = webhook_service.validate_callback_url(data.get("callback_url"))
+    except webhook_service.InvalidCallbackUrlError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    try:
+        idempotency_key = _parse_idempotency_key(data)
+        not_before, run_window = _parse_schedule(data)
+    except ValueError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+
+    try:
+        task_ids = doc_check_service.submit_doc_tasks(
+            cleaned, callback_url=callback_url, callback_batch=_parse_bool(data.get("callback_batch")),
+            idempotency_key=idempotency_key, not_before=not_before, run_window=run_window,
+        )
+        return jsonify({
+            "service_code": 2000,
+            "msg": f"成功创建 {len(task_ids)} 个任务",
+            "task_ids": task_ids,
+        })
+    except Exception as e:
+        logger.exception("Failed to create doc tasks in batch")
+        return jsonify({
+            "service_code": 5001,
+            "msg": "任务创建失败: " + str(e),
+        }), 500
+
+
 @bp.route("/tasks/<int:task_id>/", methods=["GET"])
 def get_doc_task(task_id: int):
+    """
+    任务详情
+    入参：query fields（可选，逗号分隔，如 task_id,status,result.bugs），只返回指定字段
+    """
+    if task_id <= 0:
+        return jsonify({"service_code": 4001, "msg": "无效的 task_id"}), 400
+    try:
+        fields = doc_check_service.parse_fields(request.args.get("fields"))
+    except doc_check_service.InvalidFieldsError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    try:
+        resource = doc_check_service.get_task_detail_cached(task_id, fields)
+        if not resource:
+            return jsonify({"service_code": 4004, "msg": "任务不存在"}), 404
+        return _conditional_response({
+            "service_code": 2000,
+            "msg": "任务获取成功",
+            "task": resource.body,
+        }, resource)
+    except Exception as e:
+        logger.exception("Failed to get doc task")
+        return jsonify({
+            "service_code": 5001,
+            "msg": "任务获取失败: " + str(e),
+        }), 500
+    
+
+@bp.route("/tasks/<int:task_id>/wait/", methods=["GET"])
+def wait_doc_task(task_id: int):
+    """
+    长轮询：任务进入 success/failed 或超时后返回任务详情
+    入参：query timeout（秒，默认 30，最大 60）；fields（可选，同任务详情）
+    出参：JSON { service_code, msg, task, done }
+    """
     if task_id <= 0:
         return jsonify({"service_code": 4001, "msg": "无效的 task_id"}), 400
     try:
-        task_detail = doc_check_service.get_task_detail(task_id)
+        timeout = min(max(float(request.args.get("timeout", 30)), 0), TASK_WAIT_MAX_SECONDS)
+    except ValueError:
+        return jsonify({"service_code": 4001, "msg": "timeout 必须是数字"}), 400
+    try:
+        fields = doc_check_service.parse_fields(request.args.get("fields"))
+    except doc_check_service.InvalidFieldsError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+
+    try:
+        task_detail = doc_check_service.wait_task_detail(task_id, timeout)
         if not task_detail:
             return jsonify({"service_code": 4004, "msg": "任务不存在"}), 404
         return jsonify({
             "service_code": 2000,
             "msg": "任务获取成功",
-            "task": task_detail,
+            "task": doc_check_service.project_task(task_detail, fields),
+            "done": task_detail["status"] in TERMINAL_TASK_STATUSES,
         })
     except Exception as e:
-        logging.exception("Failed to get doc task")
+        logger.exception("Failed to wait doc task")
         return jsonify({
             "service_code": 5001,
             "msg": "任务获取失败: " + str(e),
         }), 500
-    
+
+
+@bp.route("/tasks/events/", methods=["GET"])
+def stream_task_events():
+    """
+    SSE：订阅多个任务的状态变化，全部终态或超时后关闭
+    入参：query task_ids=1,2,3；timeout（秒，默认 300，最大 600）
+    出参：text/event-stream，每条 event: task，data: { task_id, status }
+    """
+    try:
+        task_ids = [int(x) for x in request.args.get("task_ids", "").split(",") if x.strip()]
+        timeout = min(max(float(request.args.get("timeout", 300)), 0), TASK_EVENTS_MAX_SECONDS)
+    except ValueError:
+        return jsonify({"service_code": 4001, "msg": "task_ids / timeout 格式错误"}), 400
+    if not task_ids:
+        return jsonify({"service_code": 4001, "msg": "task_ids 是必填字段"}), 400
+
+    def generate():
+        for event in doc_check_service.iter_task_events(task_ids, timeout):
+            if event is None:
+                yield ": keepalive\n\n"
+                continue
+            yield f"event: task\ndata: {json_codec.dumps(event)}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
+
 
 @bp.route("/tasks/", methods=["GET"])
 def list_doc_tasks():
     """
     获取所有任务列表
+    任务多时可以流式返回，边读库边输出，不在内存里拼完整响应：
+        ?format=ndjson 或 Accept: application/x-ndjson  -> 每行一个任务
+        ?format=stream                                 -> 与普通响应结构相同的分块 JSON
+    ?fields=task_id,status,result.bugs 只返回指定字段，未选 result.raw_answer 时不读取也不解压原始回答
     """
     try:
-        tasks = doc_check_service.list_all_tasks()
-        return jsonify({
+        fields = doc_check_service.parse_fields(request.args.get("fields"))
+    except doc_check_service.InvalidFieldsError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    stream_format = request.args.get("format")
+    if stream_format is None and request.accept_mimetypes.best == NDJSON_MIMETYPE:
+        stream_format = "ndjson"
+    if stream_format in ("ndjson", "stream"):
+        return _stream_task_list(stream_format, fields)
+
+    try:
+        resource = doc_check_service.list_all_tasks_cached(fields)
+        return _conditional_response({
             "service_code": 2000,
             "msg": "任务列表获取成功",
-            "tasks": tasks,
-        })
+            "tasks": resource.body,
+        }, resource)
     except Exception as e:
-        logging.exception("Failed to list doc tasks")
+        logger.exception("Failed to list doc tasks")
         return jsonify({
             "service_code": 5001,
             "msg": "任务列表获取失败: " + str(e),
         }), 500
     
 
+def _stream_task_list(stream_format: str, fields=None) -> Response:
+    """流式任务列表；开始输出后无法再改状态码，中途出错只能记录日志并截断响应"""
+    tasks = doc_check_service.iter_all_tasks(fields)
+
+    def generate_ndjson():
+        for task in tasks:
+            yield json_codec.dumps_bytes(task) + b"\n"
+
+    def generate_array():
+        yield '{"service_code":2000,"msg":"任务列表获取成功","tasks":['.encode("utf-8")
+        first = True
+        for task in tasks:
+            yield (b"" if first else b",") + json_codec.dumps_bytes(task)
+            first = False
+        yield b"]}\n"
+
+    def guarded(gen):
+        try:
+            yield from gen
+        except Exception:
+            logger.exception("Failed to stream doc tasks")
+
+    if stream_format == "ndjson":
+        return Response(stream_with_context(guarded(generate_ndjson())), mimetype=NDJSON_MIMETYPE)
+    return Response(stream_with_context(guarded(generate_array())), mimetype="application/json")
+
+
+@bp.route("/bugs/", methods=["GET"])
+def list_bugs():
+    """
+    按产品 / 问题类型查询 bug（走 task_bug 索引，只包含紧凑格式保存的结果）
+    入参：query product、type（均可选）；limit（默认 100，最大 1000）；after_id（上一页最后一个 bug_id）
+    出参：JSON { service_code, msg, bugs, next_after_id }
+    """
+    product = request.args.get("product") or None
+    bug_type = request.args.get("type") or None
+    try:
+        limit = min(int(request.args.get("limit", 100)), BUG_LIST_MAX_LIMIT)
+        after_id = int(request.args.get("after_id", 0))
+    except ValueError:
+        return jsonify({"service_code": 4001, "msg": "limit / after_id 必须是整数"}), 400
+    if limit <= 0 or after_id < 0:
+        return jsonify({"service_code": 4001, "msg": "limit 必须大于 0，after_id 不能为负"}), 400
+
+    try:
+        bugs = doc_check_service.list_bugs(product, bug_type, limit, after_id)
+    except Exception as e:
+        logger.exception("Failed to list bugs")
+        return jsonify({"service_code": 5001, "msg": "bug 查询失败: " + str(e)}), 500
+    return jsonify({
+        "service_code": 2000,
+        "msg": "bug 查询成功",
+        "bugs": bugs,
+        "next_after_id": bugs[-1]["bug_id"] if len(bugs) == limit else None,
+    })
+
+
 @bp.route("/tasks/delete/", methods=["POST"])
 def delete_doc_tasks():
     """
@@ -247,33 +684,84 @@ def delete_doc_tasks():
             "deleted_count": deleted_count,
         })
     except Exception as e:
-        logging.exception("Failed to delete doc tasks")
+        logger.exception("Failed to delete doc tasks")
         return jsonify({
             "service_code": 5001,
             "msg": "任务删除失败: " + str(e),
         }), 500
     
 
+@bp.route("/tasks/dead_letter/", methods=["GET"])
+def list_dead_letter_tasks():
+    """
+    查看超过重试上限被隔离的任务
+    入参：query ?limit=100&offset=0
+    出参：JSON { service_code, msg, tasks }
+    """
+    try:
+        limit = min(int(request.args.get("limit", 100)), 1000)
+        offset = int(request.args.get("offset", 0))
+    except ValueError:
+        return jsonify({"service_code": 4001, "msg": "limit / offset 必须是整数"}), 400
+    if limit <= 0 or offset < 0:
+        return jsonify({"service_code": 4001, "msg": "limit 必须大于 0，offset 不能为负"}), 400
+
+    try:
+        tasks = doc_check_service.list_dead_letter_tasks(limit, offset)
+    except Exception as e:
+        logger.exception("Failed to list dead letter tasks")
+        return jsonify({"service_code": 5001, "msg": "dead_letter 任务获取失败: " + str(e)}), 500
+    return jsonify({"service_code": 2000, "msg": "dead_letter 任务获取成功", "tasks": tasks})
+
+
+@bp.route("/tasks/dead_letter/replay/", methods=["POST"])
+def replay_dead_letter_tasks():
+    """
+    重放 dead_letter 任务：清零重试次数并重新入队
+    入参：JSON { task_ids: [int, int, ...] }
+    出参：JSON { service_code, msg, replayed_task_ids }
+    """
+    data = request.get_json(silent=True) or {}
+    task_ids = data.get("task_ids")
+    if not task_ids or not isinstance(task_ids, list) or not all(isinstance(t, int) for t in task_ids):
+        return jsonify({"service_code": 4001, "msg": "task_ids 必须是非空整数列表"}), 400
+
+    try:
+        replayed = doc_check_service.replay_dead_letter_tasks(task_ids)
+    except Exception as e:
+        logger.exception("Failed to replay dead letter tasks")
+        return jsonify({"service_code": 5001, "msg": "dead_letter 任务重放失败: " + str(e)}), 500
+    return jsonify({
+        "service_code": 2000,
+        "msg": f"成功重放 {len(replayed)} 个任务",
+        "replayed_task_ids": replayed,
+    })
+
+
 @bp.route("/task/retry/", methods=["POST"])
 def retry_task():
     """
     手动重试某个任务
-    入参：JSON { task_id }
+    入参：JSON { task_id, not_before }，not_before（可选）为重试的最早时间，格式同提交任务
     出参：JSON { service_code, msg }
     """
     data = request.get_json(silent=True) or {}
     task_id = data.get("task_id")
     if not task_id:
         return jsonify({"service_code": 4001, "msg": "task_id 是必填字段"}), 400
+    try:
+        not_before = _parse_not_before(data.get("not_before"))
+    except ValueError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
 
     try:
-        task = doc_check_service.retry_task(task_id)
+        task = doc_check_service.retry_task(task_id, not_before=not_before)
     except doc_check_service.TaskNotFoundError as e:
         return jsonify({"service_code": 4040, "msg": "任务不存在"}), 404
     except doc_check_service.InvalidTaskStatusError as e:
         return jsonify({"service_code": 4003, "msg": str(e)}), 400
     except Exception:
-        logging.exception("retry_task error")
+        logger.exception("retry_task error")
         return jsonify({"service_code": 5000, "msg": "内部错误"}), 500
     
     return jsonify({
@@ -281,4 +769,111 @@ def retry_task():
         "msg": "任务已重试，已重新放入队列",
         "task": task.to_dict()
     }), 200
-        
\ No newline at end of file
+        
+
+
+@bp.route("/prompts/", methods=["GET"])
+def list_prompts():
+    """
+    prompt_store 中可用的 prompt 版本
+    出参：JSON { service_code, versions, latest }
+    """
+    return jsonify({
+        "service_code": 2000,
+        "versions": list_prompt_versions(),
+        "latest": load_latest_prompt_version(),
+    })
+
+
+def _parse_str_list(value, field: str, max_length: int) -> list[str]:
+    if value is None:
+        return []
+    if not isinstance(value, list) or not all(isinstance(v, str) and v.strip() for v in value):
+        raise ValueError(f"{field} 必须是非空字符串列表")
+    if any(len(v.strip()) > max_length for v in value):
+        raise ValueError(f"{field} 中的值长度不能超过 {max_length}")
+    return [v.strip() for v in value]
+
+
+@bp.route("/eval_runs/", methods=["POST"])
+def create_eval_run():
+    """
+    创建评测：语料 × prompt 版本 × 模型的每个组合作为一个任务入队，已跑过的组合直接复用结果
+    入参：JSON { name, prompt_versions: ["1.0.2", "latest", ...], models: [...]（可选，默认配置的模型）,
+                 task_ids: [int, ...] 和 / 或 docs: [{ task_name, doc, product, feature }, ...],
+                 max_concurrency（可选）}
+    出参：JSON { service_code, msg, eval_run }
+    """
+    data = request.get_json(silent=True) or {}
+    name = data.get("name")
+    if not name or not str(name).strip():
+        return jsonify({"service_code": 4001, "msg": "name 是必填字段"}), 400
+    try:
+        prompt_versions = _parse_str_list(data.get("prompt_versions"), "prompt_versions", 32)
+        models = _parse_str_list(data.get("models"), "models", EVAL_MODEL_NAME_MAX_LENGTH)
+    except ValueError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    if not prompt_versions:
+        return jsonify({"service_code": 4001, "msg": "prompt_versions 不能为空"}), 400
+
+    task_ids = data.get("task_ids") or []
+    if not isinstance(task_ids, list) or not all(isinstance(t, int) and t > 0 for t in task_ids):
+        return jsonify({"service_code": 4001, "msg": "task_ids 必须是正整数列表"}), 400
+    docs = data.get("docs") or []
+    if not isinstance(docs, list):
+        return jsonify({"service_code": 4001, "msg": "docs 必须是列表"}), 400
+    cleaned = []
+    for i, item in enumerate(docs):
+        if not isinstance(item, dict) or not str(item.get("doc") or "").strip():
+            return jsonify({"service_code": 4001, "msg": f"docs[{i}].doc 是必填字段"}), 400
+        cleaned.append({
+            "task_name": str(item.get("task_name") or f"doc-{i}").strip(),
+            "doc": str(item["doc"]).strip(),
+            "product": item.get("product"),
+            "feature": item.get("feature"),
+        })
+    if not task_ids and not cleaned:
+        return jsonify({"service_code": 4001, "msg": "task_ids 和 docs 至少提供一个"}), 400
+
+    max_concurrency = data.get("max_concurrency")
+    if max_concurrency is not None and (not isinstance(max_concurrency, int) or max_concurrency <= 0):
+        return jsonify({"service_code": 4001, "msg": "max_concurrency 必须是正整数"}), 400
+
+    try:
+        run = eval_service.create_eval_run(
+            str(name).strip()[:255], prompt_versions, models,
+            task_ids=task_ids, docs=cleaned, max_concurrency=max_concurrency,
+        )
+    except eval_service.InvalidEvalRunError as e:
+        return jsonify({"service_code": 4001, "msg": str(e)}), 400
+    except Exception as e:
+        logger.exception("Failed to create eval run")
+        return jsonify({"service_code": 5001, "msg": "评测创建失败: " + str(e)}), 500
+    return jsonify({"service_code": 2000, "msg": "评测已创建", "eval_run": run.to_dict()})
+
+
+@bp.route("/eval_runs/<int:run_id>/", methods=["GET"])
+def get_eval_run(run_id: int):
+    """
+    评测详情和进度，结束后带对比报告
+    出参：JSON { service_code, eval_run }
+    """
+    try:
+        detail = eval_service.get_eval_run(run_id)
+    except eval_service.EvalRunNotFoundError:
+        return jsonify({"service_code": 4004, "msg": "评测不存在"}), 404
+    return jsonify({"service_code": 2000, "eval_run": detail})
+
+
+@bp.route("/eval_runs/<int:run_id>/report/", methods=["GET"])
+def get_eval_report(run_id: int):
+    """
+    对比报告：每个 prompt 版本 × 模型组合的 bug 数、类型分布、耗时、token 用量，以及组合间的一致性；
+    评测未结束时按已完成的结果生成，带 partial=true
+    出参：JSON { service_code, report }
+    """
+    try:
+        report = eval_service.get_eval_report(run_id)
+    except eval_service.EvalRunNotFoundError:
+        return jsonify({"service_code": 4004, "msg": "评测不存在"}), 404
+    return jsonify({"service_code": 2000, "report": report})
@@ -1,24 +1,17 @@
 # app/services/doc_check_service.py
 from __future__ import annotations
-import json
+import hashlib
 import os
-from typing import Optional, Dict, Any
-import redis
-from app.services import task_service
-from app.common.models import TaskStatus, TaskDocLLM
+import queue
+import time
+from datetime import datetime
+from typing import Optional, Dict, Any, Iterator
+from sqlalchemy.exc import IntegrityError
+from app.services import task_service, task_cache, task_events, task_outbox, task_result
+from app.common.models import TaskStatus, TaskDocLLM, TERMINAL_TASK_STATUSES
 
-REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
-
-redis_client = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=0,
-    password=REDIS_PASSWORD,
-)
-
-TASK_QUEUE_READY_KEY = "doc_llm:task_queue:ready"
+# 客户端没带幂等键时，按内容哈希去重的时间窗口（秒）：窗口内内容完全相同的提交视为同一请求的重试，0 表示关闭
+IDEMPOTENCY_WINDOW_SECONDS = int(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "600"))
 
 
 class TaskNotFoundError(Exception):
@@ -31,26 +24,145 @@ class InvalidTaskStatusError(Exception):
     pass
 
 
-def submit_doc_task(task_name: str, doc: str, product: str | None, feature: str | None) -> int:
+class InvalidFieldsError(ValueError):
+    """fields 参数不合法"""
+    pass
+
+
+class DuplicateTaskError(Exception):
+    """幂等键对应的任务已存在，task_id 为已有任务"""
+
+    def __init__(self, task_id: int):
+        super().__init__(f"任务已存在: {task_id}")
+        self.task_id = task_id
+
+
+def client_idempotency_key(key: str) -> str:
+    """客户端提供的幂等键统一哈希成定长，避免超长或特殊字符"""
+    return hashlib.sha256(f"client:{key}".encode("utf-8")).hexdigest()
+
+
+def content_idempotency_key(*parts) -> str | None:
+    """按提交内容 + 时间窗口生成幂等键，窗口关闭时返回 None"""
+    if IDEMPOTENCY_WINDOW_SECONDS <= 0:
+        return None
+    digest = hashlib.sha256(f"content:{int(time.time()) // IDEMPOTENCY_WINDOW_SECONDS}".encode("utf-8"))
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def submit_doc_task(
+    task_name: str,
+    doc: str,
+    product: str | None,
+    feature: str | None,
+    enqueue: bool = True,
+    callback_url: str | None = None,
+    callback_batch: bool = False,
+    previous_task_id: int | None = None,
+    idempotency_key: str | None = None,
+    not_before: datetime | None = None,
+    run_window: str | None = None,
+) -> int:
     """
     提交一个文档检查任务：
-    1）在 MySQL 中创建任务（pending）
-    2）往 Redis 队列写入任务消息
+    1）在 MySQL 中创建任务（pending），同一事务写入 outbox（enqueue=False 时跳过，由调用方在 doc 就绪后调用 attach_task_file）
+    2）提交后立即把 outbox 消息发布到 Redis 队列，失败由 relay 兜底
     3）返回 task_id
+    callback_url 不为空时，任务结束后会把结果 POST 到该地址
+    previous_task_id 不为空时视为该任务文档的新版本，worker 只复检改动段落
+    idempotency_key 为客户端提供的幂等键；不提供且 doc 已就绪时按内容哈希去重（已失败的任务不参与去重）。
+    同一个键已有任务时抛 DuplicateTaskError
+    not_before 不为空时任务先进延迟队列，到时间后才入队；
+    run_window（HH:MM-HH:MM）不为空时作为低优先级批量任务，只在时间窗内且队列空闲时入队
     """
-    task: TaskDocLLM = task_service.create_task(task_name, doc, product, feature)
+    if idempotency_key:
+        key = client_idempotency_key(idempotency_key)
+    elif enqueue:
+        key = content_idempotency_key(
+            task_name, doc, product, feature, previous_task_id, callback_url, not_before, run_window
+        )
+    else:
+        key = None  # doc 还是占位符，不能按内容去重
 
-    payload = {
-        "task_id": task.task_id,
-        "task_name": task_name,
-    }
-    redis_client.lpush(TASK_QUEUE_READY_KEY, json.dumps(payload, ensure_ascii=False))
+    if key is not None:
+        existing = task_service.get_task_by_idempotency_key(key)
+        # 按内容去重只合并正在处理或已成功的任务；失败的任务释放幂等键，重新提交会创建新任务
+        if existing and not (
+            not idempotency_key and task_service.release_failed_idempotency_key(existing.task_id)
+        ):
+            raise DuplicateTaskError(existing.task_id)
+    if previous_task_id is not None and not task_service.get_task_by_id(previous_task_id):
+        raise TaskNotFoundError(f"上一版本任务 {previous_task_id} 不存在")
 
+    try:
+        task: TaskDocLLM = task_service.create_task(
+            task_name, doc, product, feature,
+            callback_url=callback_url, callback_batch=callback_batch, previous_task_id=previous_task_id,
+            idempotency_key=key, enqueue=enqueue, not_before=not_before, run_window=run_window,
+        )
+    except IntegrityError:
+        # 并发提交同一个键：唯一索引保证只有一个成功
+        existing = task_service.get_task_by_idempotency_key(key) if key is not None else None
+        if not existing:
+            raise
+        raise DuplicateTaskError(existing.task_id)
+
+    if enqueue:
+        task_outbox.publish([task.task_id])
     return task.task_id
 
 
-def retry_task(task_id: int) -> TaskDocLLM:
-    """校验任务存在 & 状态为 failed，将任务状态改回 pending，再次推入 Redis 队列"""
+def submit_doc_tasks(
+    tasks: list[dict],
+    callback_url: str | None = None,
+    callback_batch: bool = False,
+    idempotency_key: str | None = None,
+    not_before: datetime | None = None,
+    run_window: str | None = None,
+) -> list[int]:
+    """
+    批量提交任务，tasks 中每项包含 task_name / doc / product / feature，共用一个回调地址和调度参数。
+    idempotency_key 为整批的幂等键，按下标派生每一项的键；重复提交的项返回已有任务ID
+    """
+    task_ids = []
+    for index, item in enumerate(tasks):
+        try:
+            task_id = submit_doc_task(
+                item["task_name"],
+                item["doc"],
+                item.get("product"),
+                item.get("feature"),
+                callback_url=callback_url,
+                callback_batch=callback_batch,
+                idempotency_key=f"{idempotency_key}:{index}" if idempotency_key else None,
+                not_before=not_before,
+                run_window=run_window,
+            )
+        except DuplicateTaskError as e:
+            task_id = e.task_id
+        task_ids.append(task_id)
+    return task_ids
+
+
+def attach_task_file(task_id: int, task_name: str, doc_path: str) -> None:
+    """
+    文件上传完成后调用：doc 字段与 outbox 消息同一事务提交，再发布到队列。
+    worker 拿到的任务一定已有真实 doc，不会再占着任务槽轮询等待上传。
+    """
+    update_task_doc(task_id, doc_path, enqueue=True)
+    task_outbox.publish([task_id])
+
+
+def fail_task(task_id: int, error_msg: str) -> None:
+    """控制面侧直接把还未开始处理的任务置为 failed（如文件上传失败）"""
+    task_service.mark_task_failed(task_id, error_msg, from_status=TaskStatus.pending)
+
+
+def retry_task(task_id: int, not_before: datetime | None = None) -> TaskDocLLM:
+    """校验任务存在 & 状态为 failed，将任务状态改回 pending，再次推入 Redis 队列（not_before 不为空时到时间再入队）"""
     task: TaskDocLLM = task_service.get_task_by_id(task_id)
     if not task:
         raise TaskNotFoundError(f"任务 {task_id} 不存在")
@@ -58,19 +170,74 @@ def retry_task(task_id: int) -> TaskDocLLM:
     if task.status != TaskStatus.failed:
         raise InvalidTaskStatusError(f"任务 {task_id} 当前状态为 {task.status}，不允许重试")
     
-    retry_result = task_service.mark_task_pending(task_id)
+    retry_result = task_service.mark_task_pending(task_id, enqueue=True, not_before=not_before)
     if not retry_result:
         raise Exception(f"任务 {task_id} 重试失败，更新状态出错")
 
-    payload = {
-        "task_id": task_id,
-        "task_name": task.task_name,
-    }
-    redis_client.lpush(TASK_QUEUE_READY_KEY, json.dumps(payload, ensure_ascii=False))
+    task_outbox.publish([task_id])
 
     return task
 
 
+# fields 参数可选的顶层字段（详情和列表的并集），result 可以写成 result.<key> 只取其中几项
+TASK_FIELDS = frozenset({
+    "task_id", "task_name", "create_time", "update_time", "previous_task_id",
+    "doc", "status", "result", "product", "feature",
+})
+
+
+def parse_fields(spec: str | None) -> Optional[dict[str, Optional[frozenset]]]:
+    """
+    解析 fields=task_id,status,result.bugs 形式的字段投影，返回 {顶层字段: None 或 result 子字段集合}；
+    未指定时返回 None，表示返回全部字段
+    """
+    if spec is None or not spec.strip():
+        return None
+    fields: dict[str, Optional[set]] = {}
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, sub = item.partition(".")
+        if key not in TASK_FIELDS or (sub and key != "result"):
+            raise InvalidFieldsError(f"不支持的字段: {item}")
+        if not sub:
+            fields[key] = None
+        elif key not in fields or fields[key] is not None:
+            fields.setdefault(key, set()).add(sub)
+    return {key: frozenset(sub) if sub is not None else None for key, sub in fields.items()}
+
+
+def fields_signature(fields: dict[str, Optional[frozenset]]) -> str:
+    """字段投影的规范化表示，用作缓存 key 的一部分"""
+    return ",".join(sorted(
+        key if sub is None else ",".join(f"{key}.{s}" for s in sorted(sub))
+        for key, sub in fields.items()
+    ))
+
+
+def result_parts(fields: Optional[dict[str, Optional[frozenset]]]) -> tuple[str, ...]:
+    """投影需要从子表加载的结果字段"""
+    if fields is None or fields.get("result", ()) is None:
+        return task_result.RESULT_PARTS
+    return tuple(part for part in task_result.RESULT_PARTS if part in fields.get("result", ()))
+
+
+def project_task(item: dict, fields: Optional[dict[str, Optional[frozenset]]]) -> dict:
+    """按字段投影裁剪任务 dict"""
+    if fields is None:
+        return item
+    projected = {}
+    for key, sub in fields.items():
+        if key not in item:
+            continue
+        value = item[key]
+        if sub is not None and isinstance(value, dict):
+            value = {k: value[k] for k in sub if k in value}
+        projected[key] = value
+    return projected
+
+
 def get_task_detail(task_id: int) -> Optional[Dict[str, Any]]:
     """获取任务详情"""
     task = task_service.get_task_by_id(task_id)
@@ -81,39 +248,172 @@ def get_task_detail(task_id: int) -> Optional[Dict[str, Any]]:
         "task_id": task.task_id,
         "task_name": task.task_name,
         "create_time": task.create_time.isoformat() if task.create_time else None,
+        "update_time": task.update_time.isoformat() if task.update_time else None,
+        "previous_task_id": task.previous_task_id,
         "doc": task.doc,
         "status": task.status,
-        "result": task.result,
+        "result": task_service.get_task_result(task),
     }
 
 
-def list_all_tasks() -> list[dict]:
+def get_task_detail_cached(
+    task_id: int, fields: Optional[dict[str, Optional[frozenset]]] = None
+) -> Optional[task_cache.CachedResource]:
+    """读穿缓存获取任务详情，附带 ETag / Last-Modified 信息；缓存的是完整详情，fields 在取出后投影"""
+    resource = task_cache.get_detail(task_id)
+    if resource is None:
+        # 代数必须在读库之前取，读库期间发生的失效才能让这次回填作废
+        generation = task_cache.detail_generation(task_id)
+        detail = get_task_detail(task_id)
+        if detail is None:
+            return None
+        resource = task_cache.put_detail(task_id, detail, _to_timestamp(detail["update_time"]), generation)
+    if fields is None:
+        return resource
+    return task_cache.derive(resource, project_task(resource.body, fields))
+
+
+def wait_task_detail(task_id: int, timeout: float) -> Optional[Dict[str, Any]]:
+    """
+    长轮询：等待任务进入终态或超时，返回最新任务详情。
+    先订阅再读当前状态，避免读完状态到开始订阅之间的事件丢失。
+    """
+    with task_events.hub.subscription([task_id]) as events:
+        resource = get_task_detail_cached(task_id)
+        if resource is None or resource.body["status"] in TERMINAL_TASK_STATUSES:
+            return resource.body if resource else None
+        try:
+            events.get(timeout=timeout)
+        except queue.Empty:
+            pass
+
+    # 超时也回查一次，防止事件丢失导致返回过期状态
+    resource = get_task_detail_cached(task_id)
+    return resource.body if resource else None
+
+
+def iter_task_events(task_ids: list[int], timeout: float, keepalive: float = 15.0) -> Iterator[Optional[dict]]:
+    """
+    SSE 用：先产出每个任务的当前状态，再产出后续终态事件，全部终态或超时后结束。
+    空闲 keepalive 秒产出一次 None，调用方据此写心跳。
+    """
+    pending = set(task_ids)
+    with task_events.hub.subscription(task_ids) as events:
+        for task_id in task_ids:
+            resource = get_task_detail_cached(task_id)
+            status = resource.body["status"] if resource else None
+            yield {"task_id": task_id, "status": status}
+            if status is None or status in TERMINAL_TASK_STATUSES:
+                pending.discard(task_id)
+
+        end_at = time.monotonic() + timeout
+        while pending:
+            remaining = end_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = events.get(timeout=min(keepalive, remaining))
+            except queue.Empty:
+                yield None
+                continue
+            yield {"task_id": event["task_id"], "status": event["status"]}
+            if event["status"] in TERMINAL_TASK_STATUSES:
+                pending.discard(event["task_id"])
+
+
+def _task_list_item(task: TaskDocLLM, result: Optional[dict]) -> dict:
+    return {
+        "task_id": task.task_id,
+        "task_name": task.task_name,
+        "create_time": task.create_time.isoformat() if task.create_time else None,
+        "update_time": task.update_time.isoformat() if task.update_time else None,
+        "doc": task.doc,
+        "status": task.status,
+        "result": result,
+        "product": task.product,
+        "feature": task.feature,
+    }
+
+
+def _task_list_items(tasks: list[TaskDocLLM], fields: Optional[dict[str, Optional[frozenset]]]) -> list[dict]:
+    """组装列表项，只加载投影需要的结果字段（如不需要 raw_answer 时不读不解压）"""
+    results = task_service.load_results(tasks, result_parts(fields)) if fields is None or "result" in fields else {}
+    return [_task_list_item(task, results.get(task.task_id)) for task in tasks]
+
+
+def list_all_tasks(fields: Optional[dict[str, Optional[frozenset]]] = None) -> list[dict]:
     """获取所有任务"""
-    tasks = task_service.get_all_tasks()
+    items = _task_list_items(task_service.get_all_tasks(), fields)
+    return [project_task(item, fields) for item in items]
+
+
+def iter_all_tasks(fields: Optional[dict[str, Optional[frozenset]]] = None) -> Iterator[dict]:
+    """流式获取所有任务，用于 NDJSON / 分块 JSON 响应，不在内存里拼完整列表"""
+    for batch in task_service.iter_task_batches():
+        for item in _task_list_items(batch, fields):
+            yield project_task(item, fields)
+
+
+def list_all_tasks_cached(fields: Optional[dict[str, Optional[frozenset]]] = None) -> task_cache.CachedResource:
+    """读穿缓存获取任务列表，任何任务状态变化都会让缓存失效；不同的字段投影分开缓存"""
+    version = task_cache.list_version()
+    variant = fields_signature(fields) if fields is not None else ""
+    cached = task_cache.get_list(version, variant)
+    if cached is not None:
+        return cached
+
+    items = _task_list_items(task_service.get_all_tasks(), fields)
+    timestamps = [ts for ts in (_to_timestamp(t["update_time"]) for t in items) if ts is not None]
+    tasks = [project_task(item, fields) for item in items]
+    return task_cache.put_list(version, tasks, max(timestamps) if timestamps else None, variant)
+
+
+def _to_timestamp(iso_str: str | None) -> float | None:
+    """isoformat 字符串（本地时间）转 unix 时间戳"""
+    if not iso_str:
+        return None
+    return datetime.fromisoformat(iso_str).timestamp()
+
+
+def list_dead_letter_tasks(limit: int = 100, offset: int = 0) -> list[dict]:
+    """列出被隔离的 dead_letter 任务（不含文档正文）"""
     return [
         {
             "task_id": task.task_id,
             "task_name": task.task_name,
             "create_time": task.create_time.isoformat() if task.create_time else None,
-            "doc": task.doc,
-            "status": task.status,
-            "result": task.result,
+            "update_time": task.update_time.isoformat() if task.update_time else None,
             "product": task.product,
             "feature": task.feature,
+            "retry_count": task.retry_count,
+            "error": (task.result or {}).get("error"),
         }
-        for task in tasks
+        for task in task_service.list_dead_letter_tasks(limit, offset)
     ]
 
 
+def list_bugs(product: str | None, bug_type: str | None, limit: int = 100, after_id: int = 0) -> list[dict]:
+    """按产品 / 问题类型查询 bug，after_id 为上一页最后一个 bug_id"""
+    return task_service.query_bugs(product, bug_type, limit, after_id)
+
+
+def replay_dead_letter_tasks(task_ids: list[int]) -> list[int]:
+    """把 dead_letter 任务清零重试次数后重新入队，返回实际重放的任务ID（其他状态的任务忽略）"""
+    replayed = [task.task_id for task in task_service.replay_dead_letter_tasks(task_ids)]
+    if replayed:
+        task_outbox.publish(replayed)
+    return replayed
+
+
 def delete_tasks(task_ids: list[int]) -> int:
     """删除指定任务ID的任务，返回删除的任务数量"""
     return task_service.delete_tasks(task_ids)
 
 
-def update_task_doc(task_id: int, doc: str) -> None:
-    """更新任务的 doc 字段"""
+def update_task_doc(task_id: int, doc: str, enqueue: bool = False) -> None:
+    """更新任务的 doc 字段，enqueue=True 时同一事务写入 outbox"""
     task = task_service.get_task_by_id(task_id)
     if not task:
         raise TaskNotFoundError(f"任务 {task_id} 不存在")
     
-    task_service.update_task_doc(task_id, doc)
\ No newline at end of file
+    task_service.update_task_doc(task_id, doc, enqueue=enqueue)
\ No newline at end of file
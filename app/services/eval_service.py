@@ -0,0 +1,344 @@
+# app/services/eval_service.py
+# 评测：同一批语料在多个 prompt 版本 × 模型组合下的检测结果对比
+#   - 创建评测时一次性生成所有组合的任务（pending，不入队），已有成功结果的组合直接复用旧任务
+#   - scheduler（leader）每轮调用 dispatch_eval_runs，按 max_concurrency 控制同时在队列 / 处理中的任务数，
+#     通过 outbox 入队；全部结束后生成对比报告写回 eval_run.report
+#   - 报告：每个组合的 bug 数、类型分布、耗时、token 用量，以及组合之间的一致性
+from __future__ import annotations
+import hashlib
+import itertools
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+
+from app.common.db import get_session
+from app.common.models import (
+    EvalRun,
+    EvalRunItem,
+    EvalRunStatus,
+    TaskDocLLM,
+    TaskStatus,
+    TERMINAL_TASK_STATUSES,
+)
+from app.llm.llm_config import default_model
+from app.prompt_loader import list_prompt_versions, load_latest_prompt_version
+from app.services import task_cache, task_outbox, task_result
+from app.worker.doc_loader import PENDING_MARK
+
+logger = logging.getLogger(__name__)
+
+EVAL_DEFAULT_CONCURRENCY = int(os.getenv("EVAL_DEFAULT_CONCURRENCY", "4"))
+# 单个评测最多的组合数（文档数 × prompt 版本数 × 模型数）
+EVAL_MAX_COMBINATIONS = int(os.getenv("EVAL_MAX_COMBINATIONS", "2000"))
+# 查询缓存命中时每批的 cache_key 数
+_CACHE_LOOKUP_BATCH = 500
+
+
+class EvalRunNotFoundError(Exception):
+    """评测不存在"""
+    pass
+
+
+class InvalidEvalRunError(Exception):
+    """评测参数不合法（版本不存在、语料为空、组合过多等）"""
+    pass
+
+
+def combination_key(doc: str, product: str | None, feature: str | None, prompt_version: str, model: str) -> str:
+    digest = hashlib.sha256()
+    for part in (doc, product or "", feature or "", prompt_version, model):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _combo_label(prompt_version: str, model: str) -> str:
+    return f"{prompt_version}@{model}"
+
+
+def _load_corpus(task_ids: list[int] | None, docs: list[dict] | None) -> list[dict]:
+    """语料统一成 [{name, doc, product, feature, source_task_id}]"""
+    corpus = []
+    if task_ids:
+        with get_session() as session:
+            tasks = {t.task_id: t for t in session.scalars(select(TaskDocLLM).where(TaskDocLLM.task_id.in_(task_ids)))}
+        missing = [task_id for task_id in task_ids if task_id not in tasks]
+        if missing:
+            raise InvalidEvalRunError(f"语料任务不存在: {missing}")
+        for task_id in task_ids:
+            task = tasks[task_id]
+            if task.doc.strip() == PENDING_MARK:
+                raise InvalidEvalRunError(f"语料任务 {task_id} 的文件尚未上传完成")
+            corpus.append({
+                "name": task.task_name, "doc": task.doc, "product": task.product,
+                "feature": task.feature, "source_task_id": task_id,
+            })
+    for item in docs or []:
+        corpus.append({
+            "name": item["task_name"], "doc": item["doc"], "product": item.get("product"),
+            "feature": item.get("feature"), "source_task_id": None,
+        })
+    return corpus
+
+
+def _cached_task_ids(session, keys: list[str]) -> dict[str, int]:
+    """cache_key -> 已成功的任务ID"""
+    cached: dict[str, int] = {}
+    for start in range(0, len(keys), _CACHE_LOOKUP_BATCH):
+        rows = session.execute(
+            select(EvalRunItem.cache_key, EvalRunItem.task_id)
+            .join(TaskDocLLM, TaskDocLLM.task_id == EvalRunItem.task_id)
+            .where(
+                EvalRunItem.cache_key.in_(keys[start:start + _CACHE_LOOKUP_BATCH]),
+                TaskDocLLM.status == TaskStatus.success,
+            )
+        ).all()
+        cached.update({row.cache_key: row.task_id for row in rows})
+    return cached
+
+
+def create_eval_run(
+    name: str,
+    prompt_versions: list[str],
+    models: list[str] | None = None,
+    task_ids: list[int] | None = None,
+    docs: list[dict] | None = None,
+    max_concurrency: int | None = None,
+) -> EvalRun:
+    """
+    创建评测并派发第一批任务。
+    prompt_versions 中的 "latest" 解析为当前最新版本号；models 为空时使用默认模型。
+    语料为已有任务（task_ids，复用其 doc / 产品 / 功能点）和 / 或直接上传的文档（docs）
+    """
+    available = list_prompt_versions()
+    versions = []
+    for version in prompt_versions:
+        version = load_latest_prompt_version() if version == "latest" else version
+        if version not in available:
+            raise InvalidEvalRunError(f"prompt 版本不存在: {version}，可选: {available}")
+        if version not in versions:
+            versions.append(version)
+    models = list(dict.fromkeys(models or [default_model()]))
+    corpus = _load_corpus(task_ids, docs)
+    if not corpus:
+        raise InvalidEvalRunError("语料为空")
+    combinations = len(corpus) * len(versions) * len(models)
+    if combinations > EVAL_MAX_COMBINATIONS:
+        raise InvalidEvalRunError(f"组合数 {combinations} 超过上限 {EVAL_MAX_COMBINATIONS}")
+
+    combos = [
+        (doc_index, doc, version, model, combination_key(doc["doc"], doc["product"], doc["feature"], version, model))
+        for doc_index, doc in enumerate(corpus)
+        for version in versions
+        for model in models
+    ]
+    with get_session() as session:
+        run = EvalRun(
+            name=name, prompt_versions=versions, models=models, doc_count=len(corpus),
+            max_concurrency=max_concurrency or EVAL_DEFAULT_CONCURRENCY, status=EvalRunStatus.running,
+        )
+        session.add(run)
+        session.flush()
+
+        # 已有成功结果的组合直接复用；同一评测里重复的文档共用一个任务
+        task_by_key = _cached_task_ids(session, list({combo[4] for combo in combos}))
+        for doc_index, doc, version, model, key in combos:
+            reused = key in task_by_key
+            if not reused:
+                task = TaskDocLLM(
+                    task_name=f"[eval {run.id}] {doc['name']} {_combo_label(version, model)}"[:255],
+                    doc=doc["doc"], product=doc["product"], feature=doc["feature"],
+                    prompt_version=version, model=model, status=TaskStatus.pending,
+                )
+                session.add(task)
+                session.flush()
+                task_by_key[key] = task.task_id
+            session.add(EvalRunItem(
+                run_id=run.id, doc_index=doc_index, source_task_id=doc["source_task_id"],
+                prompt_version=version, model=model, cache_key=key, task_id=task_by_key[key],
+                reused=reused, dispatched=reused,
+            ))
+    task_cache.invalidate()
+    logger.info(f"eval run {run.id} created: {len(corpus)} docs x {versions} x {models}")
+    dispatch_eval_runs(run.id)
+    return run
+
+
+def _in_flight_count(session, run_id: int) -> int:
+    # 复用的组合不占并发：缓存命中的任务已结束，同一评测里的重复组合由第一次出现的组合负责派发
+    return session.scalar(
+        select(func.count(func.distinct(EvalRunItem.task_id)))
+        .join(TaskDocLLM, TaskDocLLM.task_id == EvalRunItem.task_id)
+        .where(
+            EvalRunItem.run_id == run_id,
+            EvalRunItem.dispatched.is_(True),
+            EvalRunItem.reused.is_(False),
+            TaskDocLLM.status.not_in(TERMINAL_TASK_STATUSES),
+        )
+    ) or 0
+
+
+def dispatch_eval_runs(run_id: int | None = None) -> int:
+    """
+    给进行中的评测补充派发任务，使每个评测在队列 / 处理中的任务数不超过 max_concurrency；
+    全部结束的评测生成报告。返回本轮派发的任务数
+    """
+    published: list[int] = []
+    with get_session() as session:
+        query = select(EvalRun).where(EvalRun.status == EvalRunStatus.running).with_for_update(skip_locked=True)
+        if run_id is not None:
+            query = query.where(EvalRun.id == run_id)
+        for run in session.scalars(query).all():
+            budget = run.max_concurrency - _in_flight_count(session, run.id)
+            undispatched = session.scalars(
+                select(EvalRunItem)
+                .where(EvalRunItem.run_id == run.id, EvalRunItem.dispatched.is_(False))
+                .order_by(EvalRunItem.id)
+                .limit(max(budget, 0) + 1)
+            ).all()
+            names = dict(session.execute(
+                select(TaskDocLLM.task_id, TaskDocLLM.task_name)
+                .where(TaskDocLLM.task_id.in_([item.task_id for item in undispatched[:budget]]))
+            ).all()) if budget > 0 else {}
+            for item in undispatched[:max(budget, 0)]:
+                item.dispatched = True
+                task_outbox.add(session, item.task_id, names.get(item.task_id))
+                published.append(item.task_id)
+
+            if not undispatched and budget == run.max_concurrency:
+                run.report = _build_report(session, run)
+                run.status = EvalRunStatus.finished
+                run.finish_time = datetime.now()
+                logger.info(f"eval run {run.id} finished")
+    if published:
+        task_outbox.publish(published)
+        logger.info(f"dispatched {len(published)} eval tasks")
+    return len(published)
+
+
+def _percentile(values: list[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(int(len(values) * q), len(values) - 1)], 1)
+
+
+def _build_report(session, run: EvalRun) -> dict:
+    rows = session.execute(
+        select(
+            EvalRunItem.doc_index, EvalRunItem.prompt_version, EvalRunItem.model, EvalRunItem.reused,
+            TaskDocLLM.task_id, TaskDocLLM.status, TaskDocLLM.result,
+        )
+        .join(TaskDocLLM, TaskDocLLM.task_id == EvalRunItem.task_id)
+        .where(EvalRunItem.run_id == run.id)
+    ).all()
+    # 报告只用 bugs 和 meta，不读原始回答
+    results = task_result.expand_results(session, {row.task_id: row.result for row in rows}, parts=("bugs",))
+
+    combos: dict[str, dict] = {}
+    # 组合 -> {doc_index: bug 列表}，只记录成功的文档，用于一致性对比
+    bugs_by_doc: dict[str, dict[int, list[dict]]] = {}
+    for row in rows:
+        label = _combo_label(row.prompt_version, row.model)
+        combo = combos.setdefault(label, {
+            "prompt_version": row.prompt_version, "model": row.model, "docs": 0, "reused": 0,
+            "status": Counter(), "bugs": 0, "types": Counter(), "latency_ms": [],
+            "input_tokens": 0, "output_tokens": 0,
+        })
+        combo["docs"] += 1
+        combo["reused"] += int(row.reused)
+        combo["status"][row.status.value] += 1
+        result = results[row.task_id]
+        if row.status != TaskStatus.success or not result:
+            continue
+        bugs = result.get("bugs") or []
+        meta = result.get("meta") or {}
+        bugs_by_doc.setdefault(label, {})[row.doc_index] = bugs
+        combo["bugs"] += len(bugs)
+        combo["types"].update(bug.get("type") or "未分类" for bug in bugs)
+        latency = (meta.get("timings_ms") or {}).get("check_document")
+        if latency is not None:
+            combo["latency_ms"].append(latency)
+        usage = meta.get("usage") or {}
+        combo["input_tokens"] += usage.get("input_tokens", 0)
+        combo["output_tokens"] += usage.get("output_tokens", 0)
+
+    summary = {}
+    for label, combo in combos.items():
+        succeeded = combo["status"].get(TaskStatus.success.value, 0)
+        summary[label] = {
+            "prompt_version": combo["prompt_version"],
+            "model": combo["model"],
+            "docs": combo["docs"],
+            "succeeded": succeeded,
+            "reused": combo["reused"],
+            "status": dict(combo["status"]),
+            "bugs_total": combo["bugs"],
+            "bugs_per_doc": round(combo["bugs"] / succeeded, 2) if succeeded else None,
+            "type_distribution": dict(combo["types"].most_common()),
+            "latency_ms_p50": _percentile(combo["latency_ms"], 0.5),
+            "latency_ms_p95": _percentile(combo["latency_ms"], 0.95),
+            "input_tokens": combo["input_tokens"],
+            "output_tokens": combo["output_tokens"],
+        }
+
+    agreement = []
+    for a, b in itertools.combinations(sorted(bugs_by_doc), 2):
+        common = sorted(set(bugs_by_doc[a]) & set(bugs_by_doc[b]))
+        if not common:
+            continue
+        jaccards, count_diffs = [], []
+        for doc_index in common:
+            types_a = {bug.get("type") for bug in bugs_by_doc[a][doc_index]}
+            types_b = {bug.get("type") for bug in bugs_by_doc[b][doc_index]}
+            union = types_a | types_b
+            jaccards.append(len(types_a & types_b) / len(union) if union else 1.0)
+            count_diffs.append(abs(len(bugs_by_doc[a][doc_index]) - len(bugs_by_doc[b][doc_index])))
+        agreement.append({
+            "a": a,
+            "b": b,
+            "docs_compared": len(common),
+            "type_jaccard_mean": round(sum(jaccards) / len(jaccards), 3),
+            "bug_count_diff_mean": round(sum(count_diffs) / len(count_diffs), 2),
+        })
+    return {"eval_run_id": run.id, "combinations": summary, "agreement": agreement}
+
+
+def get_eval_run(run_id: int) -> dict:
+    """评测详情：基本信息 + 各状态的任务数；结束后带报告"""
+    with get_session() as session:
+        run = session.get(EvalRun, run_id)
+        if not run:
+            raise EvalRunNotFoundError(f"评测 {run_id} 不存在")
+        counts = session.execute(
+            select(TaskDocLLM.status, func.count())
+            .join(EvalRunItem, EvalRunItem.task_id == TaskDocLLM.task_id)
+            .where(EvalRunItem.run_id == run_id)
+            .group_by(TaskDocLLM.status)
+        ).all()
+        reused = session.scalar(
+            select(func.count()).where(EvalRunItem.run_id == run_id, EvalRunItem.reused.is_(True))
+        )
+        detail = run.to_dict()
+        detail["progress"] = {
+            "combinations": sum(count for _, count in counts),
+            "reused": reused,
+            **{status.value: count for status, count in counts},
+        }
+        detail["report"] = run.report
+    return detail
+
+
+def get_eval_report(run_id: int) -> dict:
+    """对比报告；评测未结束时按当前已完成的结果实时生成"""
+    with get_session() as session:
+        run = session.get(EvalRun, run_id)
+        if not run:
+            raise EvalRunNotFoundError(f"评测 {run_id} 不存在")
+        if run.report is not None:
+            return run.report
+        return {**_build_report(session, run), "partial": True}
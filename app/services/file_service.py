@@ -1,28 +1,73 @@
 # app/services/file_service.py
 
+from __future__ import annotations
 import io
+import os
+import threading
+import urllib3
 from minio import Minio
 from minio.error import S3Error
 from werkzeug.datastructures import FileStorage
 
-MINIO_ENDPOINT = "host.docker.internal:9000"
-MINIO_ACCESS_KEY = "root"
-MINIO_SECRET_KEY = "xiao1234"
-MINIO_BUCKET = "doc-llm-bucket"
-MINIO_SECURE = False
+from app.common import check_deadline, time_remaining
 
-_minio_client = Minio(
-    MINIO_ENDPOINT,
-    access_key=MINIO_ACCESS_KEY,
-    secret_key=MINIO_SECRET_KEY,
-    secure=MINIO_SECURE,
-)
+MINIO_ENDPOINT = os.getenv("MINIO_ENDPOINT", "host.docker.internal:9000")
+MINIO_ACCESS_KEY = os.getenv("MINIO_ACCESS_KEY", "root")
+MINIO_SECRET_KEY = os.getenv("MINIO_SECRET_KEY", "xiao1234")
+MINIO_BUCKET = os.getenv("MINIO_BUCKET", "doc-llm-bucket")
+MINIO_SECURE = os.getenv("MINIO_SECURE", "0") == "1"
+# 指定 region 时不再向服务端查询 bucket 所在区域
+MINIO_REGION = os.getenv("MINIO_REGION") or None
+MINIO_CONNECT_TIMEOUT_SECONDS = float(os.getenv("MINIO_CONNECT_TIMEOUT_SECONDS", "5"))
+MINIO_READ_TIMEOUT_SECONDS = float(os.getenv("MINIO_READ_TIMEOUT_SECONDS", "60"))
+MINIO_DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+_minio_client: Minio | None = None
+_minio_lock = threading.Lock()
+
+
+def get_minio_client() -> Minio:
+    """进程内共享的 MinIO 客户端，首次使用时创建"""
+    global _minio_client
+    if _minio_client is None:
+        with _minio_lock:
+            if _minio_client is None:
+                _minio_client = Minio(
+                    MINIO_ENDPOINT,
+                    access_key=MINIO_ACCESS_KEY,
+                    secret_key=MINIO_SECRET_KEY,
+                    secure=MINIO_SECURE,
+                    region=MINIO_REGION,
+                    http_client=urllib3.PoolManager(
+                        timeout=urllib3.Timeout(
+                            connect=MINIO_CONNECT_TIMEOUT_SECONDS,
+                            read=MINIO_READ_TIMEOUT_SECONDS,
+                        ),
+                        retries=urllib3.Retry(
+                            total=3,
+                            backoff_factor=0.2,
+                            status_forcelist=[500, 502, 503, 504],
+                        ),
+                    ),
+                )
+    return _minio_client
+
+
+def _reset_after_fork() -> None:
+    # urllib3 连接池不能跨进程共享，子进程重新创建客户端
+    global _minio_client, _minio_lock
+    _minio_client = None
+    _minio_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def _ensure_bucket():
     """确保 bucket 存在"""
-    if not _minio_client.bucket_exists(MINIO_BUCKET):
-        _minio_client.make_bucket(MINIO_BUCKET)
+    client = get_minio_client()
+    if not client.bucket_exists(MINIO_BUCKET):
+        client.make_bucket(MINIO_BUCKET)
 
 
 def save_task_file(task_id: int, file_obj: FileStorage) -> str:
@@ -46,7 +91,7 @@ def save_task_file(task_id: int, file_obj: FileStorage) -> str:
         data = io.BytesIO(data_bytes)
 
     try:
-        _minio_client.put_object(
+        get_minio_client().put_object(
             MINIO_BUCKET,
             object_name,
             data,
@@ -68,10 +113,24 @@ def download_file(bucket: str, object_name: str) -> bytes:
     调用方式：
         content = download_file("doc-llm-bucket", "15_readme.txt")
         text = content.decode("utf-8")
+
+    存在任务 deadline 时分块读取，每块之间检查 deadline，超时抛 DeadlineExceededError。
     """
+    check_deadline("minio download")
     try:
-        response = _minio_client.get_object(bucket, object_name)
-        data = response.read()
-        return data
+        response = get_minio_client().get_object(bucket, object_name)
     except S3Error as e:
-        raise RuntimeError(f"Download from minio failed: {e}") from e
\ No newline at end of file
+        raise RuntimeError(f"Download from minio failed: {e}") from e
+
+    try:
+        if time_remaining() is None:
+            return response.read()
+
+        chunks = []
+        for chunk in response.stream(MINIO_DOWNLOAD_CHUNK_SIZE):
+            chunks.append(chunk)
+            check_deadline("minio download")
+        return b"".join(chunks)
+    finally:
+        response.close()
+        response.release_conn()
\ No newline at end of file
@@ -0,0 +1,90 @@
+# app/services/health_service.py
+# /ready 用的依赖检查：MySQL、Redis、MinIO 是否可用
+#   - 三项并发检查，整体超过 READY_CHECK_TIMEOUT_SECONDS 未返回的记为超时，探针不会被卡住
+#   - 结果在进程内缓存 READY_CACHE_SECONDS 秒，探针频繁调用也不会放大到依赖上
+# /health 只表示进程存活，不走这里
+from __future__ import annotations
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from sqlalchemy import text
+
+from app.common.db import get_engine
+from app.common.redis_client import get_redis
+from app.services import file_service
+
+logger = logging.getLogger(__name__)
+
+READY_CACHE_SECONDS = float(os.getenv("READY_CACHE_SECONDS", "5"))
+READY_CHECK_TIMEOUT_SECONDS = float(os.getenv("READY_CHECK_TIMEOUT_SECONDS", "2"))
+
+
+def _check_mysql() -> None:
+    with get_engine().connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+
+def _check_redis() -> None:
+    get_redis().ping()
+
+
+def _check_minio() -> None:
+    if not file_service.get_minio_client().bucket_exists(file_service.MINIO_BUCKET):
+        raise RuntimeError(f"bucket {file_service.MINIO_BUCKET} not found")
+
+
+CHECKS = {
+    "mysql": _check_mysql,
+    "redis": _check_redis,
+    "minio": _check_minio,
+}
+
+_cache_lock = threading.Lock()
+_cache: tuple[float, dict] | None = None
+
+
+def _timed(check) -> dict:
+    start = time.perf_counter()
+    try:
+        check()
+        error = None
+    except Exception as e:
+        error = repr(e)
+    return {
+        "ok": error is None,
+        "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+        "error": error,
+    }
+
+
+def run_checks(timeout: float = READY_CHECK_TIMEOUT_SECONDS) -> dict:
+    """执行全部依赖检查，返回 {"ready": bool, "checks": {name: {ok, latency_ms, error}}}"""
+    executor = ThreadPoolExecutor(max_workers=len(CHECKS), thread_name_prefix="ready_check")
+    futures = {name: executor.submit(_timed, check) for name, check in CHECKS.items()}
+    wait(futures.values(), timeout=timeout)
+    # 不等待超时的检查线程，它们受各自客户端的超时约束，结束后自行退出
+    executor.shutdown(wait=False)
+
+    checks = {}
+    for name, future in futures.items():
+        if future.done():
+            checks[name] = future.result()
+        else:
+            checks[name] = {"ok": False, "latency_ms": timeout * 1000, "error": "timeout"}
+    ready = all(c["ok"] for c in checks.values())
+    if not ready:
+        failed = {name: c["error"] for name, c in checks.items() if not c["ok"]}
+        logger.warning(f"[READY] dependency check failed: {failed}")
+    return {"ready": ready, "checks": checks}
+
+
+def readiness() -> dict:
+    """带缓存的检查结果；并发请求只有一个真正执行检查"""
+    global _cache
+    with _cache_lock:
+        if _cache is None or time.monotonic() - _cache[0] > READY_CACHE_SECONDS:
+            _cache = (time.monotonic(), run_checks())
+        return _cache[1]
@@ -0,0 +1,235 @@
+# app/services/near_dup_service.py
+# 近似重复文档检测：同产品 / 功能点 / prompt 版本 / 模型下，找到高度相似的历史成功任务并复用结果
+# 文档修订（指定上一版本任务）也在这里处理，只复检改动段落
+from __future__ import annotations
+import hashlib
+import logging
+import os
+from typing import Optional
+
+import redis
+
+from app.common.minhash import (
+    estimate_similarity,
+    lsh_band_keys,
+    minhash_signature,
+    pack_signature,
+    unpack_signature,
+)
+from app.common.models import TaskStatus
+from app.common.redis_client import lazy_redis
+from app.common.tracing import span
+from app.llm import run_doc_check_structured
+from app.llm.doc_diff import annotate_offsets, recheck_changed_paragraphs
+from app.llm.llm_config import default_model
+from app.prompt_loader import load_latest_prompt_version
+from app.services import task_service
+from app.worker import doc_loader
+
+logger = logging.getLogger(__name__)
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "1") == "1"
+# 相似度达到该值才视为近似重复，走 diff 局部复检
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+# 相似度达到该值且与原文实际相同（忽略空白）时直接复用旧结果，不再调用大模型
+NEAR_DUP_REUSE_THRESHOLD = float(os.getenv("NEAR_DUP_REUSE_THRESHOLD", "0.98"))
+NEAR_DUP_INDEX_TTL_SECONDS = int(os.getenv("NEAR_DUP_INDEX_TTL_SECONDS", str(30 * 24 * 3600)))
+NEAR_DUP_MAX_CANDIDATES = 20
+
+# v2：签名改为 one permutation hashing、scope 总是带上实际模型；旧版本的 key 不再读取，按 TTL 自然过期
+NEAR_DUP_SIG_KEY = "doc_llm:neardup:v2:sig:{task_id}"
+NEAR_DUP_BAND_KEY = "doc_llm:neardup:v2:band:{scope}:{band}"
+
+redis_client = lazy_redis()
+
+
+def _scope(
+    product: Optional[str], feature: Optional[str], prompt_version: Optional[str], model: Optional[str] = None
+) -> str:
+    """只在相同产品 / 功能点 / prompt 版本 / 模型之间复用结果；model 为空时按当前默认模型，默认模型切换后不会复用旧模型的结果"""
+    raw = f"{product or ''}\x1f{feature or ''}\x1f{prompt_version or ''}\x1f{model or default_model()}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def find_near_duplicate(
+    sig: list[int],
+    product: Optional[str],
+    feature: Optional[str],
+    prompt_version: Optional[str],
+    exclude_task_id: Optional[int] = None,
+    model: Optional[str] = None,
+) -> Optional[tuple[int, float]]:
+    """LSH 分桶取候选，再用签名估算相似度，返回 (task_id, similarity)，没有则 None"""
+    scope = _scope(product, feature, prompt_version, model)
+    pipe = redis_client.pipeline(transaction=False)
+    for band in lsh_band_keys(sig):
+        pipe.smembers(NEAR_DUP_BAND_KEY.format(scope=scope, band=band))
+    candidates: set[int] = set()
+    for members in pipe.execute():
+        candidates.update(int(m) for m in members)
+    candidates.discard(exclude_task_id)
+    if not candidates:
+        return None
+
+    candidate_ids = sorted(candidates, reverse=True)[:NEAR_DUP_MAX_CANDIDATES]
+    raws = redis_client.mget([NEAR_DUP_SIG_KEY.format(task_id=tid) for tid in candidate_ids])
+    best: Optional[tuple[int, float]] = None
+    for task_id, raw in zip(candidate_ids, raws):
+        if raw is None:
+            continue
+        similarity = estimate_similarity(sig, unpack_signature(raw))
+        if similarity >= NEAR_DUP_THRESHOLD and (best is None or similarity > best[1]):
+            best = (task_id, similarity)
+    return best
+
+
+def index_task(
+    task_id: int,
+    sig: list[int],
+    product: Optional[str],
+    feature: Optional[str],
+    prompt_version: Optional[str],
+    model: Optional[str] = None,
+) -> None:
+    """把成功任务的签名写入索引，后续相似文档可以命中"""
+    scope = _scope(product, feature, prompt_version, model)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.set(NEAR_DUP_SIG_KEY.format(task_id=task_id), pack_signature(sig), ex=NEAR_DUP_INDEX_TTL_SECONDS)
+    for band in lsh_band_keys(sig):
+        key = NEAR_DUP_BAND_KEY.format(scope=scope, band=band)
+        pipe.sadd(key, task_id)
+        pipe.expire(key, NEAR_DUP_INDEX_TTL_SECONDS)
+    pipe.execute()
+
+
+def _load_source_text(source) -> Optional[str]:
+    try:
+        return doc_loader.load_doc_for_task(source)
+    except (doc_loader.DocPathError, doc_loader.DocPendingError, RuntimeError) as e:
+        logger.warning(f"load source task {source.task_id} doc failed, skip reuse: {e!r}")
+        return None
+
+
+def _same_text(a: str, b: str) -> bool:
+    """忽略空白差异后文本完全相同"""
+    return " ".join(a.split()) == " ".join(b.split())
+
+
+def _reuse_from(
+    source_task_id: int, similarity: float, doc: str, product, feature, prompt_version=None, model=None
+) -> Optional[dict]:
+    """
+    基于相似的历史任务得出结果：与原文实际相同才直接复用，否则只复检改动段落。
+    MinHash 相似度只是估计值（64 个排列时 95% 相似的文档约有 16% 的概率估出 ≥0.98），
+    不能单凭它跳过大模型调用
+    """
+    source = task_service.get_task_by_id(source_task_id)
+    if not source or source.status != TaskStatus.success or not source.result:
+        return None
+    source_text = _load_source_text(source)
+    if source_text is None:
+        return None
+    source_result = task_service.get_task_result(source)
+
+    if similarity >= NEAR_DUP_REUSE_THRESHOLD and _same_text(source_text, doc):
+        result = {
+            "bugs": annotate_offsets(list(source_result.get("bugs") or []), doc),
+            "raw_answer": source_result.get("raw_answer", ""),
+            "meta": {},
+        }
+        mode = "reuse"
+    else:
+        result = recheck_changed_paragraphs(
+            source_text, source_result, doc, product, feature, prompt_version=prompt_version, model=model
+        )
+        if result is None:
+            return None
+        mode = "partial"
+
+    result["meta"]["near_duplicate"] = {
+        "source_task_id": source_task_id,
+        "similarity": round(similarity, 4),
+        "mode": mode,
+    }
+    return result
+
+
+def _check_revision(
+    previous_task_id: int, doc: str, product, feature, prompt_version=None, model=None
+) -> Optional[dict]:
+    """文档修订：对比上一版本，只复检改动段落；上一版本不可用或改动过多时返回 None 走全文检测"""
+    source = task_service.get_task_by_id(previous_task_id)
+    if not source or source.status != TaskStatus.success or not source.result:
+        logger.warning(f"previous task {previous_task_id} has no successful result, fallback to full check")
+        return None
+    if source.product != product or source.feature != feature:
+        # 功能点清单变了，旧的覆盖类结论不再成立
+        logger.warning(f"previous task {previous_task_id} product/feature changed, fallback to full check")
+        return None
+
+    source_text = _load_source_text(source)
+    if source_text is None:
+        return None
+    # 上一版本的原始回答随结果带到 meta.diff.base_raw_answer
+    source_result = task_service.get_task_result(source, parts=("bugs", "raw_answer"))
+    result = recheck_changed_paragraphs(
+        source_text, source_result, doc, product, feature, prompt_version=prompt_version, model=model
+    )
+    if result is None:
+        logger.info(f"most paragraphs changed since task {previous_task_id}, fallback to full check")
+        return None
+    result["meta"]["revision_of"] = previous_task_id
+    return result
+
+
+def check_document(
+    task_id: int,
+    doc: str,
+    product: Optional[str],
+    feature: Optional[str],
+    previous_task_id: Optional[int] = None,
+    prompt_version: Optional[str] = None,
+    model: Optional[str] = None,
+) -> dict:
+    """
+    带历史结果复用的文档检测，返回结构同 run_doc_check_structured，bug 额外带 offset。
+    指定 previous_task_id 时按修订处理，只复检改动段落；
+    否则命中相似任务时复用 / 局部复检；都不满足时全文检测。完成后把本任务加入近似重复索引。
+    prompt_version / model 为空时使用最新 prompt 和默认模型，只在相同版本和模型的任务之间复用
+    """
+    explicit_version = prompt_version
+    prompt_version = prompt_version or load_latest_prompt_version()
+    result = None
+    if previous_task_id is not None:
+        result = _check_revision(previous_task_id, doc, product, feature, explicit_version, model)
+
+    sig = minhash_signature(doc) if NEAR_DUP_ENABLED else None
+    if result is None and sig is not None:
+        match = None
+        try:
+            with span("near_dup_lookup"):
+                match = find_near_duplicate(
+                    sig, product, feature, prompt_version, exclude_task_id=task_id, model=model
+                )
+        except redis.RedisError as e:
+            # 查重只是优化，失败时退回全文检测
+            logger.warning(f"task {task_id} near duplicate lookup failed, fallback to full check: {e!r}")
+        if match:
+            logger.info(f"task {task_id} near duplicate of task {match[0]}, similarity={match[1]:.3f}")
+            result = _reuse_from(match[0], match[1], doc, product, feature, explicit_version, model)
+
+    if result is None:
+        result = run_doc_check_structured(doc, product, feature, prompt_version=explicit_version, model=model)
+        result["bugs"] = annotate_offsets(result.get("bugs") or [], doc)
+    else:
+        result["meta"].update({
+            "product": product, "feature": feature, "prompt_version": prompt_version, "model": model or default_model(),
+        })
+
+    if sig is not None:
+        try:
+            with span("near_dup_index"):
+                index_task(task_id, sig, product, feature, prompt_version, model)
+        except redis.RedisError:
+            logger.exception(f"task {task_id} near duplicate indexing failed")
+    return result
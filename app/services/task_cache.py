@@ -0,0 +1,197 @@
+# app/services/task_cache.py
+# 任务详情 / 列表的 Redis 读穿缓存，任务状态变化时失效
+# 详情缓存带每个任务的代数（generation）：读库前记下代数，写缓存时代数已变（期间有失效）就放弃写入，
+# 避免读到旧数据的请求在失效之后把旧值写回缓存
+from __future__ import annotations
+import hashlib
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any
+
+import redis
+
+from app.common import json_codec
+from app.common.models import TaskStatus
+from app.common.redis_client import lazy_redis
+
+logger = logging.getLogger(__name__)
+
+TASK_DETAIL_CACHE_KEY = "doc_llm:cache:task:{task_id}"
+TASK_DETAIL_GENERATION_KEY = "doc_llm:cache:task_gen:{task_id}"
+TASK_LIST_CACHE_KEY = "doc_llm:cache:task_list:{version}"
+TASK_LIST_VERSION_KEY = "doc_llm:cache:task_list:version"
+
+# 非终态任务详情的缓存时间（秒），状态变化时会主动失效，TTL 只是兜底
+TASK_CACHE_TTL_SECONDS = int(os.getenv("TASK_CACHE_TTL_SECONDS", "5"))
+# success 任务结果很少再变（删除 / 重试时主动失效），缓存时间可以很长；0 表示不过期
+TASK_CACHE_TERMINAL_TTL_SECONDS = int(os.getenv("TASK_CACHE_TERMINAL_TTL_SECONDS", "86400"))
+TASK_LIST_CACHE_TTL_SECONDS = int(os.getenv("TASK_LIST_CACHE_TTL_SECONDS", "30"))
+# 代数 key 只需要比一次“读库 + 写缓存”活得久，每次失效时续期
+TASK_CACHE_GENERATION_TTL_SECONDS = int(os.getenv("TASK_CACHE_GENERATION_TTL_SECONDS", "86400"))
+
+# 代数未变才写入详情缓存；代数 key 不存在视为 0。返回是否写入
+_PUT_DETAIL_SCRIPT = """
+local generation = redis.call('GET', KEYS[2]) or '0'
+if generation ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+redis_client = lazy_redis()
+# 脚本在第一次写缓存时注册，import 时不触发 Redis 连接
+_put_detail_script = None
+
+
+@dataclass
+class CachedResource:
+    """缓存的响应体以及生成条件请求头所需的信息"""
+    body: Any
+    etag: str
+    last_modified: float | None = None  # unix 时间戳
+    terminal: bool = False              # success 任务，客户端可以短时间缓存，过期后用 ETag 再验证
+
+
+def _make_etag(body_json: bytes) -> str:
+    return hashlib.sha1(body_json).hexdigest()
+
+
+def _dump(resource: CachedResource) -> bytes:
+    return json_codec.dumps_bytes(
+        {
+            "body": resource.body,
+            "etag": resource.etag,
+            "last_modified": resource.last_modified,
+            "terminal": resource.terminal,
+        }
+    )
+
+
+def _load(raw: bytes | None) -> CachedResource | None:
+    if raw is None:
+        return None
+    data = json_codec.loads(raw)
+    return CachedResource(
+        body=data["body"],
+        etag=data["etag"],
+        last_modified=data.get("last_modified"),
+        terminal=data.get("terminal", False),
+    )
+
+
+def _build(body: Any, last_modified: float | None, terminal: bool = False) -> CachedResource:
+    body_json = json_codec.dumps_bytes(body, sort_keys=True)
+    return CachedResource(body=body, etag=_make_etag(body_json), last_modified=last_modified, terminal=terminal)
+
+
+def _safe_get(key: str) -> bytes | None:
+    try:
+        return redis_client.get(key)
+    except redis.RedisError:
+        logger.exception(f"task cache read failed, key={key}")
+        return None
+
+
+def _safe_set(key: str, value: str, ttl: int) -> None:
+    try:
+        redis_client.set(key, value, ex=ttl or None)
+    except redis.RedisError:
+        logger.exception(f"task cache write failed, key={key}")
+
+
+def get_detail(task_id: int) -> CachedResource | None:
+    return _load(_safe_get(TASK_DETAIL_CACHE_KEY.format(task_id=task_id)))
+
+
+def detail_generation(task_id: int) -> int | None:
+    """读库之前调用，记下当前代数交给 put_detail；Redis 不可用时返回 None（put_detail 不写缓存）"""
+    try:
+        raw = redis_client.get(TASK_DETAIL_GENERATION_KEY.format(task_id=task_id))
+    except redis.RedisError:
+        logger.exception(f"task cache generation read failed, task_id={task_id}")
+        return None
+    return int(raw) if raw is not None else 0
+
+
+def put_detail(task_id: int, detail: dict, last_modified: float | None, generation: int | None) -> CachedResource:
+    """
+    写入任务详情缓存，success 任务用长 TTL 并标记为 terminal。
+    generation 为读库前 detail_generation 的返回值，此后任务被失效过则不写入，只返回本次构造的响应
+    """
+    global _put_detail_script
+    terminal = detail.get("status") == TaskStatus.success
+    resource = _build(detail, last_modified, terminal)
+    if generation is None:
+        return resource
+    ttl = TASK_CACHE_TERMINAL_TTL_SECONDS if terminal else TASK_CACHE_TTL_SECONDS
+    try:
+        if _put_detail_script is None:
+            _put_detail_script = redis_client.register_script(_PUT_DETAIL_SCRIPT)
+        _put_detail_script(
+            keys=[TASK_DETAIL_CACHE_KEY.format(task_id=task_id), TASK_DETAIL_GENERATION_KEY.format(task_id=task_id)],
+            args=[generation, _dump(resource), ttl],
+        )
+    except redis.RedisError:
+        logger.exception(f"task cache write failed, task_id={task_id}")
+    return resource
+
+
+def list_version() -> int:
+    raw = _safe_get(TASK_LIST_VERSION_KEY)
+    return int(raw) if raw is not None else 0
+
+
+def _list_key(version: int, variant: str) -> str:
+    key = TASK_LIST_CACHE_KEY.format(version=version)
+    if variant:
+        # 字段投影可能很长，只取摘要
+        key += ":" + hashlib.sha1(variant.encode("utf-8")).hexdigest()[:16]
+    return key
+
+
+def get_list(version: int, variant: str = "") -> CachedResource | None:
+    return _load(_safe_get(_list_key(version, variant)))
+
+
+def put_list(version: int, tasks: list[dict], last_modified: float | None, variant: str = "") -> CachedResource:
+    """
+    列表缓存按版本号分 key，任何任务变化都会递增版本号，旧 key 自然过期；
+    variant 区分同一版本的不同字段投影
+    """
+    resource = _build(tasks, last_modified)
+    _safe_set(_list_key(version, variant), _dump(resource), TASK_LIST_CACHE_TTL_SECONDS)
+    return resource
+
+
+def derive(resource: CachedResource, body: Any) -> CachedResource:
+    """由缓存的完整响应派生出裁剪后的响应（字段投影），ETag 按新的响应体重新计算"""
+    return _build(body, resource.last_modified, resource.terminal)
+
+
+def invalidate(task_ids: int | list[int] | None = None) -> None:
+    """
+    任务写操作提交后调用：删除对应详情缓存、递增其代数（让正在读库的请求放弃回填），并递增列表版本号。
+    task_ids 为 None 时只失效列表（如新建任务）。
+    """
+    if task_ids is None:
+        task_ids = []
+    elif isinstance(task_ids, int):
+        task_ids = [task_ids]
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        for task_id in task_ids:
+            generation_key = TASK_DETAIL_GENERATION_KEY.format(task_id=task_id)
+            pipe.incr(generation_key)
+            pipe.expire(generation_key, TASK_CACHE_GENERATION_TTL_SECONDS)
+            pipe.delete(TASK_DETAIL_CACHE_KEY.format(task_id=task_id))
+        pipe.incr(TASK_LIST_VERSION_KEY)
+        pipe.execute()
+    except redis.RedisError:
+        logger.exception(f"task cache invalidation failed, task_ids={task_ids}")
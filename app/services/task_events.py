@@ -0,0 +1,107 @@
+# app/services/task_events.py
+# 任务状态变化的 Redis pub/sub 通知：worker 发布，controller 的长轮询 / SSE 订阅
+from __future__ import annotations
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+import redis
+
+from app.common import json_codec
+from app.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+TASK_EVENT_CHANNEL = "doc_llm:task_events:{task_id}"
+TASK_EVENT_PATTERN = "doc_llm:task_events:*"
+
+
+def publish_task_event(task_id: int, status: str) -> None:
+    """任务状态变化后发布通知，发布失败不影响主流程（订阅方超时后会回查数据库）"""
+    message = json_codec.dumps({"task_id": task_id, "status": status, "ts": time.time()})
+    try:
+        get_redis().publish(TASK_EVENT_CHANNEL.format(task_id=task_id), message)
+    except redis.RedisError:
+        logger.exception(f"publish task event failed, task_id={task_id}")
+
+
+class TaskEventHub:
+    """
+    每个进程一个后台线程、一条 pub/sub 连接（按 pattern 订阅所有任务），
+    再把事件分发给进程内的等待者。等待者再多也不会多占 Redis 连接。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waiters: dict[int, set[queue.Queue]] = {}
+        self._thread: threading.Thread | None = None
+        self._ready = threading.Event()
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            # gunicorn fork 之后子进程里线程不存在，需要重新启动
+            if self._thread is None or not self._thread.is_alive():
+                self._ready.clear()
+                self._thread = threading.Thread(target=self._run, name="doc_llm_task_events", daemon=True)
+                self._thread.start()
+        self._ready.wait(timeout=5)
+
+    def _run(self) -> None:
+        while True:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.psubscribe(TASK_EVENT_PATTERN)
+                # 等订阅确认后再放行等待者，避免订阅完成前的事件丢失
+                pubsub.get_message(timeout=5)
+                self._ready.set()
+                while True:
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get("type") == "pmessage":
+                        self._dispatch(message["data"])
+            except Exception:
+                logger.exception("task event listener failed, reconnect in 1s")
+                self._ready.clear()
+                time.sleep(1)
+            finally:
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+
+    def _dispatch(self, raw: bytes) -> None:
+        try:
+            event = json_codec.loads(raw)
+            task_id = int(event["task_id"])
+        except Exception:
+            logger.warning(f"invalid task event: {raw!r}")
+            return
+        with self._lock:
+            waiters = list(self._waiters.get(task_id, ()))
+        for q in waiters:
+            q.put(event)
+
+    @contextmanager
+    def subscription(self, task_ids: Iterable[int]) -> Iterator[queue.Queue]:
+        """在 with 块内接收指定任务的事件（放到返回的 queue 里）"""
+        task_ids = list(task_ids)
+        q: queue.Queue = queue.Queue()
+        self._ensure_started()
+        with self._lock:
+            for task_id in task_ids:
+                self._waiters.setdefault(task_id, set()).add(q)
+        try:
+            yield q
+        finally:
+            with self._lock:
+                for task_id in task_ids:
+                    waiters = self._waiters.get(task_id)
+                    if waiters is not None:
+                        waiters.discard(q)
+                        if not waiters:
+                            del self._waiters[task_id]
+
+
+hub = TaskEventHub()
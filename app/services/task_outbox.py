@@ -0,0 +1,76 @@
+# app/services/task_outbox.py
+# 事务性 outbox：任务状态变更与“需要入队”在同一个 MySQL 事务里落库，再发布到 Redis。
+# 提交后 controller 立即发布一次（正常路径无额外延迟），进程在提交与发布之间崩溃时由 relay 兜底。
+# 发布与删除之间崩溃会重复投递，worker 只处理 pending 任务，重复消息会被直接丢弃。
+# 设置了 not_before 的任务进延迟队列，设置了 run_window 的批量任务进 bulk 队列，由 scheduler 到期后搬进 ready 队列。
+from __future__ import annotations
+import logging
+import time
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from app.common.db import get_session
+from app.common.models import TaskDocLLM, TaskOutbox
+from app.common.redis_client import lazy_redis
+from app.common.task_queue import (
+    TASK_QUEUE_BULK_KEY,
+    TASK_QUEUE_DELAYED_KEY,
+    TASK_QUEUE_READY_KEY,
+    build_delayed_member,
+    build_task_payload,
+)
+
+logger = logging.getLogger(__name__)
+
+redis_client = lazy_redis()
+
+
+def add(session: Session, task_id: int, task_name: str | None) -> None:
+    """在调用方的事务里登记一条待入队消息"""
+    session.add(TaskOutbox(task_id=task_id, task_name=task_name))
+
+
+def _select_rows():
+    """outbox 行连同任务的调度字段；只锁 outbox 行"""
+    return (
+        select(TaskOutbox.id, TaskOutbox.task_id, TaskOutbox.task_name, TaskDocLLM.not_before, TaskDocLLM.run_window)
+        .join(TaskDocLLM, TaskDocLLM.task_id == TaskOutbox.task_id, isouter=True)
+        .with_for_update(of=TaskOutbox, skip_locked=True)
+    )
+
+
+def _publish_rows(session: Session, rows) -> int:
+    if not rows:
+        return 0
+    now = time.time()
+    pipe = redis_client.pipeline(transaction=False)
+    for row in rows:
+        due = row.not_before.timestamp() if row.not_before else now
+        if row.run_window:
+            pipe.zadd(TASK_QUEUE_BULK_KEY, {build_delayed_member(row.task_id, row.task_name, row.run_window): due})
+        elif due > now:
+            pipe.zadd(TASK_QUEUE_DELAYED_KEY, {build_delayed_member(row.task_id, row.task_name): due})
+        else:
+            pipe.lpush(TASK_QUEUE_READY_KEY, build_task_payload(row.task_id, row.task_name))
+    pipe.execute()
+    session.execute(delete(TaskOutbox).where(TaskOutbox.id.in_([row.id for row in rows])))
+    return len(rows)
+
+
+def publish(task_ids: list[int]) -> int:
+    """提交后立即发布指定任务的消息；失败只记录日志，留给 relay 重试"""
+    try:
+        with get_session() as session:
+            rows = session.execute(_select_rows().where(TaskOutbox.task_id.in_(task_ids))).all()
+            return _publish_rows(session, rows)
+    except Exception:
+        logger.exception(f"failed to publish outbox for tasks {task_ids}, relay will retry")
+        return 0
+
+
+def relay_pending(limit: int) -> int:
+    """按写入顺序发布最多 limit 条积压消息，多个 relay 并发时用 SKIP LOCKED 各取各的"""
+    with get_session() as session:
+        rows = session.execute(_select_rows().order_by(TaskOutbox.id).limit(limit)).all()
+        return _publish_rows(session, rows)
@@ -0,0 +1,198 @@
+# app/services/task_result.py
+# 任务结果的紧凑存储：
+#   - bugs 拆成 task_bug 行，按 (product, bug_type) 建索引，可以直接按类型 / 产品查询
+#   - raw_answer 压缩（安装了 zstandard 用 zstd，否则 zlib）后放 task_raw_answer，只在请求时解压
+#   - task_doc_llm.result 只保留 meta 等小字段，外加 COMPACT_MARKER 标记
+# 读取时按需拼回原来的 {"bugs", "raw_answer", "meta", ...} 结构；旧任务的完整 JSON 结果原样返回
+from __future__ import annotations
+import os
+import zlib
+from typing import Iterable, Optional
+
+from sqlalchemy import delete, select
+
+from app.common.models import TaskBug, TaskRawAnswer
+
+try:
+    import zstandard
+except ImportError:  # 可选依赖
+    zstandard = None
+
+# 新结果是否写成紧凑格式，关闭后仍按完整 JSON 写入 result（两种格式读取都支持）
+TASK_RESULT_COMPACT = os.getenv("TASK_RESULT_COMPACT", "1") == "1"
+RAW_ANSWER_CODEC = os.getenv("RAW_ANSWER_CODEC", "zstd" if zstandard is not None else "zlib")
+RAW_ANSWER_ZSTD_LEVEL = int(os.getenv("RAW_ANSWER_ZSTD_LEVEL", "6"))
+RAW_ANSWER_ZLIB_LEVEL = int(os.getenv("RAW_ANSWER_ZLIB_LEVEL", "6"))
+
+# 拆到子表的结果字段
+RESULT_PARTS = ("bugs", "raw_answer")
+# 紧凑格式的标记字段，值为 {"bug_count": n}，拼回结果时去掉
+COMPACT_MARKER = "_compact"
+
+BUG_TYPE_MAX_LENGTH = 64
+BUG_NO_MAX_LENGTH = 32
+# 有独立列的 bug 字段：bug dict 键 -> (列名, 类型, 最大长度)
+_BUG_COLUMNS = {
+    "id": ("bug_no", str, BUG_NO_MAX_LENGTH),
+    "type": ("bug_type", str, BUG_TYPE_MAX_LENGTH),
+    "description": ("description", str, None),
+    "suggestion": ("suggestion", str, None),
+    "offset": ("offset", int, None),
+}
+
+
+def compress_raw_answer(answer: str) -> tuple[str, bytes]:
+    """返回 (codec, 压缩后的字节)"""
+    data = answer.encode("utf-8")
+    if RAW_ANSWER_CODEC == "zstd" and zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=RAW_ANSWER_ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, RAW_ANSWER_ZLIB_LEVEL)
+
+
+def decompress_raw_answer(codec: str, data: bytes) -> str:
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("raw answer is zstd compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"unknown raw answer codec: {codec}")
+
+
+def _bug_row(task_id: int, seq: int, product: Optional[str], bug: dict) -> TaskBug:
+    """
+    有独立列的字段写进列，其余字段（以及类型不符、超长、显式为 None 的值）原样放 extra，
+    保证 _bug_dict 能还原出同样的 bug
+    """
+    columns, extra = {}, {}
+    for key, value in bug.items():
+        spec = _BUG_COLUMNS.get(key)
+        if spec is None or value is None or not isinstance(value, spec[1]) or isinstance(value, bool):
+            extra[key] = value
+        elif spec[2] is not None and len(value) > spec[2]:
+            extra[key] = value
+            if key == "type":
+                # 超长类型仍写截断后的值，按类型查询时能命中
+                columns["bug_type"] = value[:BUG_TYPE_MAX_LENGTH]
+        else:
+            columns[spec[0]] = value
+    return TaskBug(task_id=task_id, seq=seq, product=product, extra=extra or None, **columns)
+
+
+def _bug_dict(row: TaskBug) -> dict:
+    bug = {}
+    for key, (column, _, _) in _BUG_COLUMNS.items():
+        value = getattr(row, column)
+        if value is not None and key != "offset":
+            bug[key] = value
+    if row.extra:
+        bug.update(row.extra)
+    if row.offset is not None:
+        bug["offset"] = row.offset
+    return bug
+
+
+def is_compact(result: Optional[dict]) -> bool:
+    return bool(result) and COMPACT_MARKER in result
+
+
+def store_result(session, task, result: dict) -> None:
+    """在调用方事务里写入成功任务的结果（重复写入时先清掉旧的子表行）"""
+    delete_results(session, [task.task_id])
+    if not TASK_RESULT_COMPACT:
+        task.result = result
+        return
+
+    bugs = result.get("bugs") or []
+    session.add_all(_bug_row(task.task_id, seq, task.product, bug) for seq, bug in enumerate(bugs))
+    raw_answer = result.get("raw_answer")
+    if raw_answer:
+        codec, data = compress_raw_answer(raw_answer)
+        session.add(TaskRawAnswer(
+            task_id=task.task_id, codec=codec, raw_size=len(raw_answer.encode("utf-8")), data=data,
+        ))
+    compact = {k: v for k, v in result.items() if k not in RESULT_PARTS}
+    compact[COMPACT_MARKER] = {"bug_count": len(bugs)}
+    task.result = compact
+
+
+def delete_results(session, task_ids: list[int]) -> None:
+    """删除任务对应的子表行（任务删除 / 结果重写时调用）"""
+    if not task_ids:
+        return
+    session.execute(delete(TaskBug).where(TaskBug.task_id.in_(task_ids)))
+    session.execute(delete(TaskRawAnswer).where(TaskRawAnswer.task_id.in_(task_ids)))
+
+
+def expand_results(
+    session,
+    results: dict[int, Optional[dict]],
+    parts: Iterable[str] = RESULT_PARTS,
+) -> dict[int, Optional[dict]]:
+    """
+    把 {task_id: task.result} 拼回完整结构，只加载 parts 里的子表字段（不需要原始回答时不读也不解压）。
+    紧凑格式和旧的完整 JSON 格式都按 parts 裁剪，返回结构一致
+    """
+    parts = set(parts)
+    # 旧格式且要全部字段时原样返回，不复制
+    trim = not parts.issuperset(RESULT_PARTS)
+    expanded: dict[int, Optional[dict]] = {}
+    compact_ids = []
+    for task_id, result in results.items():
+        if not result:
+            expanded[task_id] = result
+        elif COMPACT_MARKER in result:
+            expanded[task_id] = {k: v for k, v in result.items() if k != COMPACT_MARKER}
+            compact_ids.append(task_id)
+        elif trim:
+            expanded[task_id] = {
+                k: v for k, v in result.items() if k not in RESULT_PARTS or k in parts
+            }
+        else:
+            expanded[task_id] = result
+    if not compact_ids:
+        return expanded
+
+    if "bugs" in parts:
+        for task_id in compact_ids:
+            expanded[task_id]["bugs"] = []
+        rows = session.scalars(
+            select(TaskBug).where(TaskBug.task_id.in_(compact_ids)).order_by(TaskBug.task_id, TaskBug.seq)
+        )
+        for row in rows:
+            expanded[row.task_id]["bugs"].append(_bug_dict(row))
+    if "raw_answer" in parts:
+        for task_id in compact_ids:
+            expanded[task_id]["raw_answer"] = ""
+        rows = session.scalars(select(TaskRawAnswer).where(TaskRawAnswer.task_id.in_(compact_ids)))
+        for row in rows:
+            expanded[row.task_id]["raw_answer"] = decompress_raw_answer(row.codec, row.data)
+    return expanded
+
+
+def load_result(session, task, parts: Iterable[str] = RESULT_PARTS) -> Optional[dict]:
+    """单个任务的完整结果"""
+    return expand_results(session, {task.task_id: task.result}, parts)[task.task_id]
+
+
+def query_bugs(
+    session,
+    product: Optional[str] = None,
+    bug_type: Optional[str] = None,
+    limit: int = 100,
+    after_id: int = 0,
+) -> list[dict]:
+    """
+    按产品 / 问题类型查询 bug（走 idx_bug_product_type / idx_bug_type，二级索引隐含主键，按 id 翻页不用额外排序）。
+    只覆盖紧凑格式写入的任务，旧的完整 JSON 结果不在 task_bug 里
+    """
+    stmt = select(TaskBug).where(TaskBug.id > after_id)
+    if product is not None:
+        stmt = stmt.where(TaskBug.product == product)
+    if bug_type is not None:
+        stmt = stmt.where(TaskBug.bug_type == bug_type)
+    rows = session.scalars(stmt.order_by(TaskBug.id).limit(limit))
+    return [
+        {"bug_id": row.id, "task_id": row.task_id, "product": row.product, **_bug_dict(row)}
+        for row in rows
+    ]
@@ -1,26 +1,80 @@
 # app/services/task_service.py
 from __future__ import annotations
-from typing import Optional
-from sqlalchemy import select, delete, update, func
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, Optional
+from sqlalchemy import and_, or_, select, delete, update, func
+from app.common import queue_stats
 from app.common.db import get_session
-from app.common.models import TaskDocLLM, TaskStatus
+from app.common.models import FAILED_TASK_STATUSES, TaskDocLLM, TaskStatus
+from app.common.task_queue import MAX_TASK_RETRIES
+from app.services import task_cache, task_events, task_outbox, task_result, webhook_service
 
 
-def create_task(task_name: str, doc: str, product: str | None, feature: str | None) -> TaskDocLLM:
-    """创建新的文档检查任务"""
+def create_task(
+    task_name: str,
+    doc: str,
+    product: str | None,
+    feature: str | None,
+    callback_url: str | None = None,
+    callback_batch: bool = False,
+    previous_task_id: int | None = None,
+    idempotency_key: str | None = None,
+    enqueue: bool = False,
+    not_before: datetime | None = None,
+    run_window: str | None = None,
+) -> TaskDocLLM:
+    """
+    创建新的文档检查任务
+    enqueue=True 时在同一事务里写入 outbox，提交后由调用方 / relay 发布到队列；
+    idempotency_key 重复时抛 IntegrityError
+    not_before / run_window 决定发布到延迟队列还是批量队列
+    """
     with get_session() as session:
         new_task = TaskDocLLM(
             task_name=task_name,
             doc=doc,
             product=product,
             feature=feature,
+            callback_url=callback_url,
+            callback_batch=callback_batch,
+            previous_task_id=previous_task_id,
+            idempotency_key=idempotency_key,
+            not_before=not_before,
+            run_window=run_window,
             status=TaskStatus.pending,
         )
         session.add(new_task)
         session.flush()
-        return new_task
+        if enqueue:
+            task_outbox.add(session, new_task.task_id, task_name)
+    task_cache.invalidate()
+    return new_task
     
 
+def get_task_by_idempotency_key(idempotency_key: str) -> Optional[TaskDocLLM]:
+    """根据幂等键获取任务"""
+    with get_session() as session:
+        return session.scalar(
+            select(TaskDocLLM).where(TaskDocLLM.idempotency_key == idempotency_key)
+        )
+
+
+def release_failed_idempotency_key(task_id: int) -> bool:
+    """任务以失败结束时清掉幂等键，让同样的内容可以重新提交；任务不是失败状态时不改动，返回 False"""
+    with get_session() as session:
+        stmt = (
+            update(TaskDocLLM).where(
+                TaskDocLLM.task_id == task_id,
+                TaskDocLLM.status.in_(FAILED_TASK_STATUSES),
+            ).values(
+                idempotency_key=None
+            )
+        )
+        result = session.execute(stmt)
+        session.commit()
+        return result.rowcount == 1
+
+
 def get_task_by_id(task_id: int) -> Optional[TaskDocLLM]:
     """根据任务ID获取任务"""
     with get_session() as session:
@@ -30,6 +84,40 @@ def get_task_by_id(task_id: int) -> Optional[TaskDocLLM]:
         return task
     
 
+def iter_task_batches(batch_size: int = 500) -> Iterator[list[TaskDocLLM]]:
+    """按创建时间倒序流式读取所有任务，每次只从数据库取 batch_size 行"""
+    with get_session() as session:
+        result = session.scalars(
+            select(TaskDocLLM)
+            .order_by(TaskDocLLM.create_time.desc())
+            .execution_options(yield_per=batch_size)
+        )
+        for batch in result.partitions():
+            yield list(batch)
+
+
+def load_results(
+    tasks: list[TaskDocLLM], parts: Iterable[str] = task_result.RESULT_PARTS
+) -> dict[int, Optional[dict]]:
+    """
+    批量拼回任务的完整结果 {task_id: result}，紧凑格式从子表读取，parts 为需要的子表字段。
+    用单独的 session，流式读取任务的游标还没读完时也可以调用
+    """
+    with get_session() as session:
+        return task_result.expand_results(session, {task.task_id: task.result for task in tasks}, parts)
+
+
+def get_task_result(task: TaskDocLLM, parts: Iterable[str] = task_result.RESULT_PARTS) -> Optional[dict]:
+    """单个任务的完整结果"""
+    return load_results([task], parts)[task.task_id]
+
+
+def query_bugs(product: str | None, bug_type: str | None, limit: int, after_id: int = 0) -> list[dict]:
+    """按产品 / 问题类型查询 bug"""
+    with get_session() as session:
+        return task_result.query_bugs(session, product, bug_type, limit, after_id)
+
+
 def get_all_tasks() -> list[TaskDocLLM]:
     """获取所有任务"""
     with get_session() as session:
@@ -53,8 +141,11 @@ def update_task_status(
             return False
 
         task.status = status
-        if result is not None:
+        if result is not None and status == TaskStatus.success:
+            task_result.store_result(session, task, result)
+        elif result is not None:
             task.result = result
+    task_cache.invalidate(task_id)
     return True
 
 
@@ -66,7 +157,10 @@ def delete_tasks(task_ids: list[int]) -> int:
         result = session.execute(
             delete(TaskDocLLM).where(TaskDocLLM.task_id.in_(task_ids))
         )
-        return result.rowcount
+        deleted = result.rowcount
+        task_result.delete_results(session, list(task_ids))
+    task_cache.invalidate(list(task_ids))
+    return deleted
     
 
 def mark_task_processing(task_id: int) -> bool:
@@ -83,25 +177,78 @@ def mark_task_processing(task_id: int) -> bool:
         )
         result = session.execute(stmt)
         session.commit()
-        return result.rowcount == 1
+        changed = result.rowcount == 1
+    if changed:
+        task_cache.invalidate(task_id)
+    return changed
     
 
+def touch_task_processing(task_id: int) -> bool:
+    """worker 心跳：刷新 processing_started_at，防止慢但仍存活的任务被 reaper 回收"""
+    with get_session() as session:
+        stmt = (
+            update(TaskDocLLM).where(
+                TaskDocLLM.task_id == task_id,
+                TaskDocLLM.status == TaskStatus.processing,
+            ).values(
+                processing_started_at=func.now()
+            )
+        )
+        result = session.execute(stmt)
+        session.commit()
+        return result.rowcount == 1
+
+
 def mark_task_success(task_id: int, result: dict) -> bool:
     """worker 任务成功完成时调用：processing -> success"""
-    return update_task_status(task_id, TaskStatus.success, result)
+    return _finish_task(task_id, TaskStatus.success, result)
 
 
-def mark_task_failed(task_id: int, error_msg: str) -> bool:
-    """任务失败 -> failed，把错误信息写进 result"""
+def mark_task_failed(task_id: int, error_msg: str, from_status: TaskStatus = TaskStatus.processing) -> bool:
+    """任务失败 from_status -> failed，把错误信息写进 result"""
     result = {
         "success": False,
         "error": error_msg,
     }
-    return update_task_status(task_id, TaskStatus.failed, result)
+    return _finish_task(task_id, TaskStatus.failed, result, from_status)
 
 
-def mark_task_pending(task_id: int) -> bool:
-    """将任务状态改回 pending，用于重试"""
+def _finish_task(
+    task_id: int, status: TaskStatus, result: dict, from_status: TaskStatus = TaskStatus.processing
+) -> bool:
+    """
+    任务进入终态：写结果，失效缓存，发布事件，有回调地址时投递 webhook 任务。
+    只在任务仍处于 from_status 时生效，已被 reaper 回收 / 重试 / 其他 worker 完成的任务返回 False，
+    不覆盖结果，也不重复发事件和 webhook
+    """
+    with get_session() as session:
+        task = session.scalar(
+            select(TaskDocLLM).where(
+                TaskDocLLM.task_id == task_id,
+                TaskDocLLM.status == from_status,
+            ).with_for_update()
+        )
+        if not task:
+            return False
+
+        task.status = status
+        if status == TaskStatus.success:
+            task_result.store_result(session, task, result)
+        else:
+            task.result = result
+        callback_url = task.callback_url
+        callback_batch = task.callback_batch
+
+    task_cache.invalidate(task_id)
+    task_events.publish_task_event(task_id, status.value)
+    queue_stats.record_event(queue_stats.EVENT_TASK_COMPLETED)
+    if callback_url:
+        webhook_service.enqueue_delivery(task_id, status.value, callback_url, callback_batch)
+    return True
+
+
+def mark_task_pending(task_id: int, enqueue: bool = False, not_before: datetime | None = None) -> bool:
+    """将任务状态改回 pending，用于重试；enqueue=True 时同一事务里写入 outbox，not_before 为重试的最早时间"""
     with get_session() as session:
         task = session.scalar(
             select(TaskDocLLM).where(TaskDocLLM.task_id == task_id)
@@ -110,9 +257,33 @@ def mark_task_pending(task_id: int) -> bool:
             return False
         task.status = TaskStatus.pending
         task.result = None
+        task.not_before = not_before
+        if enqueue:
+            task_outbox.add(session, task_id, task.task_name)
+    task_cache.invalidate(task_id)
     return True
 
 
+def release_task(task_id: int) -> bool:
+    """worker 主动放弃任务（如 LLM 熔断）：processing -> pending，不计入重试次数"""
+    with get_session() as session:
+        stmt = (
+            update(TaskDocLLM).where(
+                TaskDocLLM.task_id == task_id,
+                TaskDocLLM.status == TaskStatus.processing,
+            ).values(
+                status=TaskStatus.pending,
+                processing_started_at=None,
+            )
+        )
+        result = session.execute(stmt)
+        session.commit()
+        changed = result.rowcount == 1
+    if changed:
+        task_cache.invalidate(task_id)
+    return changed
+
+
 def get_pending_task(task_id: int) -> Optional[TaskDocLLM]:
     """只返回 pending 状态的任务，其他状态直接 None"""
     with get_session() as session:
@@ -127,8 +298,8 @@ def get_pending_task(task_id: int) -> Optional[TaskDocLLM]:
         return task
     
 
-def update_task_doc(task_id: int, doc: str) -> None:
-    """更新任务的 doc 字段"""
+def update_task_doc(task_id: int, doc: str, enqueue: bool = False) -> None:
+    """更新任务的 doc 字段；enqueue=True 时同一事务里写入 outbox"""
     with get_session() as session:
         task = session.scalar(
             select(TaskDocLLM).where(TaskDocLLM.task_id == task_id)
@@ -136,26 +307,134 @@ def update_task_doc(task_id: int, doc: str) -> None:
         if not task:
             raise ValueError(f"任务 {task_id} 不存在")
         task.doc = doc
+        if enqueue:
+            task_outbox.add(session, task_id, task.task_name)
+    task_cache.invalidate(task_id)
 
 
-def reclaim_task(task_id: int, timeout_dt) -> bool:
+def reclaim_tasks(task_ids: list[int], timeout_dt) -> tuple[dict[int, int], list[int]]:
     """
-    将超时的任务重新放回队列
+    批量回收超时的任务，返回 ({放回 pending 的任务ID: 新的 retry_count}, 重试预算已用完的任务ID)。
+    预算用完的任务保持 processing，由调用方通过 dead_letter_task 隔离。
     :param timeout_dt: datetime对象，代表“必须早于此时间才会被恢复”
     """
+    if not task_ids:
+        return {}, []
+    conditions = (
+        TaskDocLLM.status == TaskStatus.processing,
+        TaskDocLLM.processing_started_at < timeout_dt,
+    )
     with get_session() as session:
-        stmt = (
-            update(TaskDocLLM).where(
-                TaskDocLLM.task_id == task_id,
-                TaskDocLLM.status == TaskStatus.processing,
-                TaskDocLLM.processing_started_at < timeout_dt
-            ).values(
-                status=TaskStatus.pending,
-                retry_count=TaskDocLLM.retry_count + 1,
-                processing_started_at=None,
-                result=None
+        # 先锁住符合条件的行，再按主键批量更新，这样能准确知道哪些任务被回收了
+        rows = session.execute(
+            select(TaskDocLLM.task_id, TaskDocLLM.retry_count)
+            .where(TaskDocLLM.task_id.in_(task_ids), *conditions)
+            .with_for_update()
+        ).all()
+        reclaimed = {row.task_id: row.retry_count + 1 for row in rows if row.retry_count < MAX_TASK_RETRIES}
+        exhausted = [row.task_id for row in rows if row.retry_count >= MAX_TASK_RETRIES]
+        if reclaimed:
+            session.execute(
+                update(TaskDocLLM).where(TaskDocLLM.task_id.in_(list(reclaimed)), *conditions).values(
+                    status=TaskStatus.pending,
+                    retry_count=TaskDocLLM.retry_count + 1,
+                    processing_started_at=None,
+                    result=None,
+                )
             )
-        )
-        result = session.execute(stmt)
-        session.commit()
-        return result.rowcount == 1
\ No newline at end of file
+    if reclaimed:
+        task_cache.invalidate(list(reclaimed))
+    return reclaimed, exhausted
+
+
+def dead_letter_task(task_id: int, reason: str) -> bool:
+    """重试预算用完 -> dead_letter，结果里记录原因，走终态的事件 / webhook 通知"""
+    result = {
+        "success": False,
+        "error": reason,
+        "dead_letter": True,
+    }
+    return _finish_task(task_id, TaskStatus.dead_letter, result)
+
+
+def list_dead_letter_tasks(limit: int, offset: int = 0) -> list[TaskDocLLM]:
+    """按进入 dead_letter 的时间倒序列出被隔离的任务"""
+    with get_session() as session:
+        return list(session.scalars(
+            select(TaskDocLLM)
+            .where(TaskDocLLM.status == TaskStatus.dead_letter)
+            .order_by(TaskDocLLM.update_time.desc(), TaskDocLLM.task_id.desc())
+            .limit(limit)
+            .offset(offset)
+        ))
+
+
+def replay_dead_letter_tasks(task_ids: list[int]) -> list[TaskDocLLM]:
+    """dead_letter -> pending 并清零重试次数，同一事务里写入 outbox，返回实际被重放的任务"""
+    with get_session() as session:
+        tasks = list(session.scalars(
+            select(TaskDocLLM)
+            .where(TaskDocLLM.task_id.in_(task_ids), TaskDocLLM.status == TaskStatus.dead_letter)
+            .with_for_update()
+        ))
+        for task in tasks:
+            task.status = TaskStatus.pending
+            task.retry_count = 0
+            task.result = None
+            task.processing_started_at = None
+            task_outbox.add(session, task.task_id, task.task_name)
+    if tasks:
+        task_cache.invalidate([task.task_id for task in tasks])
+    return tasks
+
+
+def processing_timeout_threshold(timeout_seconds: float) -> datetime:
+    """
+    心跳超时的判定时间点：processing_started_at 早于它的任务视为卡死。
+    processing_started_at 由数据库 func.now() 写入（MySQL 会话时区），这里同样取数据库时钟再减去超时，
+    不和 worker 本机的 UTC / 本地时间混用
+    """
+    with get_session() as session:
+        db_now = session.scalar(select(func.now()))
+    return db_now - timedelta(seconds=timeout_seconds)
+
+
+def find_stuck_tasks(
+    timeout_dt: datetime,
+    limit: int,
+    after: tuple[datetime, int] | None = None,
+) -> list[tuple[int, str, datetime]]:
+    """
+    按 (status, processing_started_at) 索引查找 processing_started_at 早于 timeout_dt 的任务，
+    最早卡住的先返回；after 为上一批最后一行的 (processing_started_at, task_id)，
+    返回 [(task_id, task_name, processing_started_at)]
+    """
+    conditions = [
+        TaskDocLLM.status == TaskStatus.processing,
+        TaskDocLLM.processing_started_at < timeout_dt,
+    ]
+    if after is not None:
+        after_started_at, after_task_id = after
+        conditions.append(or_(
+            TaskDocLLM.processing_started_at > after_started_at,
+            and_(TaskDocLLM.processing_started_at == after_started_at, TaskDocLLM.task_id > after_task_id),
+        ))
+    with get_session() as session:
+        rows = session.execute(
+            select(TaskDocLLM.task_id, TaskDocLLM.task_name, TaskDocLLM.processing_started_at)
+            .where(*conditions)
+            .order_by(TaskDocLLM.processing_started_at, TaskDocLLM.task_id)
+            .limit(limit)
+        ).all()
+    return [(row.task_id, row.task_name, row.processing_started_at) for row in rows]
+
+
+def get_task_statuses(task_ids: list[int]) -> dict[int, TaskStatus]:
+    """批量查询任务状态，不存在的任务不出现在结果里"""
+    if not task_ids:
+        return {}
+    with get_session() as session:
+        rows = session.execute(
+            select(TaskDocLLM.task_id, TaskDocLLM.status).where(TaskDocLLM.task_id.in_(task_ids))
+        ).all()
+    return {row.task_id: row.status for row in rows}
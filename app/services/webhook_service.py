@@ -0,0 +1,89 @@
+# app/services/webhook_service.py
+# 任务结束后的 webhook 投递任务入队，实际投递由 app/worker/webhook_dispatcher.py 完成
+from __future__ import annotations
+import ipaddress
+import logging
+import os
+import socket
+import time
+from urllib.parse import urlparse
+
+import redis
+
+from app.common import json_codec
+from app.common.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_QUEUE_KEY = "doc_llm:webhook:queue"
+# 已取出、还在投递的任务（LIST），投递成功或进死信后才删除
+WEBHOOK_PROCESSING_KEY = "doc_llm:webhook:processing"
+# 投递租约（ZSET，member=原始消息，score=到期 unix 秒），到期仍在 processing 列表里的任务重新入队
+WEBHOOK_LEASES_KEY = "doc_llm:webhook:leases"
+WEBHOOK_DEAD_KEY = "doc_llm:webhook:dead"
+# 允许解析到内网 / 本机地址的回调主机名（逗号分隔），其余主机只能解析到公网地址
+WEBHOOK_ALLOWED_HOSTS = frozenset(
+    h.strip().lower() for h in os.getenv("WEBHOOK_ALLOWED_HOSTS", "").split(",") if h.strip()
+)
+
+
+class InvalidCallbackUrlError(ValueError):
+    """callback_url 不合法"""
+    pass
+
+
+def _is_public_address(address: str) -> bool:
+    ip = ipaddress.ip_address(address.split("%", 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def check_callback_host(url: str) -> None:
+    """
+    解析回调地址的主机，解析结果里有内网 / 本机 / 链路本地等非公网地址时抛 InvalidCallbackUrlError，
+    防止借回调让 worker 访问内部服务。WEBHOOK_ALLOWED_HOSTS 里的主机不检查
+    """
+    parsed = urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if not host:
+        raise InvalidCallbackUrlError(f"callback_url 缺少主机名: {url}")
+    if host in WEBHOOK_ALLOWED_HOSTS:
+        return
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        infos = socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)
+    except (OSError, ValueError) as e:
+        raise InvalidCallbackUrlError(f"callback_url 主机无法解析: {host}") from e
+    for info in infos:
+        if not _is_public_address(info[4][0]):
+            raise InvalidCallbackUrlError(f"callback_url 不能指向内网或本机地址: {host}")
+
+
+def validate_callback_url(url: str | None) -> str | None:
+    """校验回调地址，只接受 http / https 且主机解析到公网地址，空值返回 None"""
+    if url is None or not str(url).strip():
+        return None
+    url = str(url).strip()
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.netloc:
+        raise InvalidCallbackUrlError(f"callback_url 必须是 http/https 地址: {url}")
+    if len(url) > 1024:
+        raise InvalidCallbackUrlError("callback_url 过长，最多 1024 字符")
+    check_callback_host(url)
+    return url
+
+
+def enqueue_delivery(task_id: int, status: str, callback_url: str, batch: bool) -> None:
+    """写入投递队列，入队失败只记日志，不影响任务本身的状态"""
+    job = {
+        "task_id": task_id,
+        "status": status,
+        "callback_url": callback_url,
+        "batch": bool(batch),
+        "enqueued_at": time.time(),
+    }
+    try:
+        get_redis().lpush(WEBHOOK_QUEUE_KEY, json_codec.dumps(job))
+    except redis.RedisError:
+        logger.exception(f"enqueue webhook delivery failed, task_id={task_id}")
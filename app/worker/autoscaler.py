@@ -0,0 +1,148 @@
+# app/worker/autoscaler.py
+# 根据 queue_stats 快照计算 doc-llm-worker 的目标副本数：
+#   - 基础目标：ceil((ready + processing) / 每个副本的并发)，并发默认取快照里 worker 上报的线程数
+#     （WORKER_PROCESSES × WORKER_THREADS），也可以用 AUTOSCALER_TARGET_TASKS_PER_WORKER 固定
+#   - ready 队列最老任务等待超过 AUTOSCALER_MAX_QUEUE_AGE_SECONDS 时至少再加一个副本
+#   - LLM 被限流（429 比例超过上限）或熔断未关闭时不扩容：瓶颈在下游，加副本只会放大 429
+# 迟滞：扩容信号持续 scale_up_stable_seconds、缩容信号持续 scale_down_stable_seconds 才生效，
+# 缩容取稳定窗口内的最大建议值；相对变化小于 tolerance 时不动；单次最多调整 max_step 个副本
+# 决策逻辑不依赖 docker，ComposeScaler 只负责执行，离线时可以只输出建议值
+from __future__ import annotations
+import logging
+import math
+import os
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass, field
+
+from app.common.queue_stats import QueueSnapshot
+from app.worker.supervisor import WORKER_PROCESSES, WORKER_THREADS
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class AutoscalerConfig:
+    min_replicas: int = int(os.getenv("AUTOSCALER_MIN_REPLICAS", "1"))
+    max_replicas: int = int(os.getenv("AUTOSCALER_MAX_REPLICAS", "8"))
+    # 每个副本（容器）可接受的“在途 + 排队”任务数，0 表示按副本实际的并发推算（见 tasks_per_replica）
+    target_tasks_per_worker: float = float(os.getenv("AUTOSCALER_TARGET_TASKS_PER_WORKER", "0"))
+    max_queue_age_seconds: float = float(os.getenv("AUTOSCALER_MAX_QUEUE_AGE_SECONDS", "120"))
+    scale_up_stable_seconds: float = float(os.getenv("AUTOSCALER_SCALE_UP_STABLE_SECONDS", "60"))
+    scale_down_stable_seconds: float = float(os.getenv("AUTOSCALER_SCALE_DOWN_STABLE_SECONDS", "300"))
+    tolerance: float = float(os.getenv("AUTOSCALER_TOLERANCE", "0.1"))
+    max_step: int = int(os.getenv("AUTOSCALER_MAX_STEP", "2"))
+    throttle_ratio_ceiling: float = float(os.getenv("AUTOSCALER_THROTTLE_RATIO_CEILING", "0.05"))
+
+
+def tasks_per_replica(snapshot: QueueSnapshot, cfg: AutoscalerConfig) -> float:
+    """
+    每个副本能同时处理的任务数：优先用配置值，其次用存活副本上报的平均并发，
+    还没有 worker 上报时按本机的 WORKER_PROCESSES × WORKER_THREADS 估算
+    """
+    if cfg.target_tasks_per_worker > 0:
+        return cfg.target_tasks_per_worker
+    if snapshot.capacity and snapshot.live_hosts:
+        return snapshot.capacity / snapshot.live_hosts
+    return WORKER_PROCESSES * WORKER_THREADS
+
+
+def desired_replicas(
+    snapshot: QueueSnapshot,
+    current: int,
+    cfg: AutoscalerConfig,
+    circuit_closed: bool = True,
+) -> int:
+    """不带迟滞的瞬时建议值"""
+    backlog = snapshot.ready + snapshot.processing
+    desired = math.ceil(backlog / tasks_per_replica(snapshot, cfg)) if backlog else 0
+    if current and abs(desired / current - 1) <= cfg.tolerance:
+        desired = current
+    if snapshot.ready and snapshot.oldest_ready_age_seconds > cfg.max_queue_age_seconds:
+        desired = max(desired, current + 1)
+    if desired > current and (not circuit_closed or snapshot.llm_throttle_ratio > cfg.throttle_ratio_ceiling):
+        desired = current
+    return max(cfg.min_replicas, min(desired, cfg.max_replicas))
+
+
+@dataclass
+class ScaleDecision:
+    current: int
+    recommended: int    # 瞬时建议值
+    target: int         # 经过迟滞后的目标值
+    reason: str
+
+    @property
+    def changed(self) -> bool:
+        return self.target != self.current
+
+
+@dataclass
+class Autoscaler:
+    cfg: AutoscalerConfig = field(default_factory=AutoscalerConfig)
+    # (时间, 建议值)，只保留最长稳定窗口内的记录
+    _history: deque = field(default_factory=deque)
+
+    def step(
+        self,
+        snapshot: QueueSnapshot,
+        current: int,
+        now: float | None = None,
+        circuit_closed: bool = True,
+    ) -> ScaleDecision:
+        now = now if now is not None else time.monotonic()
+        recommended = desired_replicas(snapshot, current, self.cfg, circuit_closed)
+        self._history.append((now, recommended))
+        horizon = max(self.cfg.scale_up_stable_seconds, self.cfg.scale_down_stable_seconds)
+        # 保留一条不晚于窗口起点的记录，它代表窗口开始时的建议值
+        while len(self._history) > 1 and self._history[1][0] <= now - horizon:
+            self._history.popleft()
+
+        if recommended > current:
+            # 扩容：窗口内的建议值都高于当前值才扩，取其中最小的
+            window = self._window(now, self.cfg.scale_up_stable_seconds)
+            if window is None or min(window) <= current:
+                return ScaleDecision(current, recommended, current, "scale up pending stabilization")
+            target = min(min(window), current + self.cfg.max_step)
+            return ScaleDecision(current, recommended, target, "scale up")
+        if recommended < current:
+            # 缩容：取窗口内最大的建议值，抖动期间不会缩
+            window = self._window(now, self.cfg.scale_down_stable_seconds)
+            if window is None or max(window) >= current:
+                return ScaleDecision(current, recommended, current, "scale down pending stabilization")
+            target = max(max(window), current - self.cfg.max_step)
+            return ScaleDecision(current, recommended, target, "scale down")
+        return ScaleDecision(current, recommended, current, "steady")
+
+    def _window(self, now: float, seconds: float) -> list[int] | None:
+        """覆盖最近 seconds 的建议值；历史还不够覆盖整个窗口时返回 None"""
+        start = now - seconds
+        if not self._history or self._history[0][0] > start:
+            return None
+        in_effect = [value for ts, value in self._history if ts <= start][-1]
+        return [in_effect] + [value for ts, value in self._history if ts > start]
+
+    def reset(self) -> None:
+        """副本数被外部改动后清空历史，重新开始计时"""
+        self._history.clear()
+
+
+class ComposeScaler:
+    """通过 docker compose 调整服务副本数（要求服务没有固定 container_name）"""
+
+    def __init__(self, service: str = "doc-llm-worker", compose_args: list[str] | None = None):
+        self.service = service
+        self.compose_args = compose_args or []
+
+    def _compose(self, *args: str) -> str:
+        cmd = ["docker", "compose", *self.compose_args, *args]
+        return subprocess.run(cmd, check=True, capture_output=True, text=True).stdout
+
+    def current_replicas(self) -> int:
+        return len(self._compose("ps", "-q", self.service).split())
+
+    def scale(self, replicas: int) -> None:
+        # --no-recreate：只增删容器，已在跑的副本不重启；被缩掉的副本上未完成的任务由 reaper 超时回收
+        self._compose("up", "-d", "--no-recreate", "--scale", f"{self.service}={replicas}", self.service)
+        logger.info(f"[AUTOSCALER] scaled {self.service} to {replicas} replicas")
@@ -1,57 +1,111 @@
 # # app/worker/doc_llm_test_worker.py
 import logging
-import time
-import redis
-import json
+import threading
 import os
 
-from app.services import task_service
-from app.llm import run_doc_check_structured
+from app.common import (
+    CircuitOpenError,
+    CircuitState,
+    DeadlineExceededError,
+    deadline_scope,
+)
+from app.common import queue_stats
+from app.common.redis_client import lazy_redis
+from app.common.tracing import current_trace, span, trace_scope
+from app.common.task_queue import (
+    TASK_PROCESSING_DEADLINES_KEY,
+    TASK_PROCESSING_PAYLOAD_KEY,
+    TASK_QUEUE_DEFERRED_KEY,
+    TASK_QUEUE_PROCESSING_KEY,
+    TASK_QUEUE_READY_KEY,
+    parse_task_payload,
+    processing_deadline,
+    task_deadline,
+)
+from app.services import near_dup_service, task_service
+from app.llm.llm_config import llm_circuit_breaker
 from app.worker import doc_loader
 
-TASK_QUEUE_READY_KEY = "doc_llm:task_queue:ready"
-TASK_QUEUE_PROCESSING_KEY = "doc_llm:task_queue:processing"
-TASK_PROCESSING_TS_KEY = "doc_llm:hash:processing_ts"
+logger = logging.getLogger(__name__)
 
-REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
+CIRCUIT_OPEN_POLL_SECONDS = 5
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("WORKER_HEARTBEAT_INTERVAL_SECONDS", "60"))
+# 阻塞取任务的超时，也决定了优雅退出时空闲线程最多多久才发现 stop_event
+WORKER_POLL_TIMEOUT_SECONDS = int(os.getenv("WORKER_POLL_TIMEOUT_SECONDS", "10"))
 
-redis_client = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=0,
-    password=REDIS_PASSWORD,
-)
+redis_client = lazy_redis()
+
+
+class TaskHeartbeat:
+    """
+    任务处理期间的心跳线程：定期推后 Redis 中的处理截止时间并刷新 MySQL 的 processing_started_at，
+    让 reaper 只回收真正卡死的任务，而不是慢但仍在运行的任务。
+    """
+
+    def __init__(self, task_id: int, interval: float = HEARTBEAT_INTERVAL_SECONDS):
+        self.task_id = task_id
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"doc_llm_heartbeat_{task_id}", daemon=True
+        )
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                # xx：任务已被 reaper 回收时不再写回
+                redis_client.zadd(TASK_PROCESSING_DEADLINES_KEY, {self.task_id: processing_deadline()}, xx=True)
+                task_service.touch_task_processing(self.task_id)
+                queue_stats.worker_heartbeat()
+            except Exception:
+                logger.exception(f"heartbeat for task {self.task_id} failed")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
 
+    def __exit__(self, exc_type, exc, tb):
+        self._stop.set()
+        self._thread.join()
+        return False
 
-def process_task(task_id: int):
-    """处理文档检查任务"""
-    logging.info(f"start process task {task_id}")
-    task = task_service.get_pending_task(task_id)
+
+def process_task(task_id: int, deadline: float | None = None):
+    """处理文档检查任务，deadline 为 unix 时间戳，超过后放弃处理"""
+    with deadline_scope(deadline), trace_scope("process_task", task_id=task_id):
+        _process_task(task_id)
+
+
+def _process_task(task_id: int):
+    logger.info(f"start process task {task_id}")
+    with span("get_pending_task"):
+        task = task_service.get_pending_task(task_id)
     if not task:
-        logging.warning(f"task {task_id} not found or not pending")
+        logger.warning(f"task {task_id} not found or not pending")
         return
-    
-    ok = task_service.mark_task_processing(task_id)
+
+    with span("mark_task_processing"):
+        ok = task_service.mark_task_processing(task_id)
     if not ok:
-        logging.warning(f"failed to mark task {task_id} as processing")
+        logger.warning(f"failed to mark task {task_id} as processing")
         return
     
+    with TaskHeartbeat(task_id):
+        _run_task(task_id, task)
+
+
+def _run_task(task_id: int, task):
     try:
         try:
-            doc_text = doc_loader.load_doc_for_task(task)
-        except doc_loader.DocPendingError as e:
-            logging.info(f"task {task_id} doc pending, waiting...")
-            try:
-                task = wait_for_doc_ready(task_id)
+            with span("load_doc"):
                 doc_text = doc_loader.load_doc_for_task(task)
-            except Exception as e2:
-                logging.error(f"task {task_id} pending wait failed: {e2}")
-                task_service.mark_task_failed(task_id, str(e2))
-                return
+        except doc_loader.DocPendingError as e:
+            # 文件任务只在 doc 更新提交后才入队，这里仍是占位符说明上传从未完成
+            logger.error(f"task {task_id} doc file was never uploaded: {e}")
+            task_service.mark_task_failed(task_id, str(e))
+            return
         except doc_loader.DocPathError as e:
-            logging.error(f"task {task_id} invalid doc path: {e}")
+            logger.error(f"task {task_id} invalid doc path: {e}")
             task_service.mark_task_failed(task_id, str(e))
             return
         
@@ -59,65 +113,106 @@ def process_task(task_id: int):
         product = task.product
         feature = task.feature
 
-        result = run_doc_check_structured(doc, product, feature)
+        with span("check_document"):
+            result = near_dup_service.check_document(
+                task_id, doc, product, feature, previous_task_id=task.previous_task_id,
+                prompt_version=task.prompt_version, model=task.model,
+            )
 
-        task_service.mark_task_success(task_id, result)
-        logging.info(f"task {task_id} processed successfully")
+        # 写库前的各阶段耗时和 token 用量；mark_task_success 自身的耗时只在导出的 trace 里
+        trace = current_trace()
+        if trace is not None:
+            meta = result.setdefault("meta", {})
+            meta["timings_ms"] = trace.stage_timings_ms()
+            if trace.counters:
+                meta["usage"] = dict(trace.counters)
+        with span("mark_task_success"):
+            task_service.mark_task_success(task_id, result)
+        logger.info(f"task {task_id} processed successfully")
+    except DeadlineExceededError as e:
+        logger.warning(f"task {task_id} abandoned: {e}")
+        task_service.mark_task_failed(task_id, str(e))
+    except CircuitOpenError:
+        # LLM 后端已熔断：任务退回 pending，由 worker_loop 放入 deferred 队列
+        logger.warning(f"task {task_id} deferred, LLM circuit is open")
+        task_service.release_task(task_id)
+        raise
     except Exception as e:
-        logging.exception(f"task {task_id} failed: {repr(e)}")
+        logger.exception(f"task {task_id} failed: {repr(e)}")
         task_service.mark_task_failed(task_id, str(e))
 
 
-def worker_loop():
-    """文档检查任务 worker 主循环"""
-    logging.info("doc_llm_test_worker started, waiting for tasks...")
-    while True:
+def release_deferred_tasks() -> int:
+    """
+    熔断器关闭后，把 deferred 队列里的任务放回 ready 队列。
+    半开状态只放回一个，作为探测请求；打开状态不放回。
+    """
+    state = llm_circuit_breaker.state()
+    if state == CircuitState.open:
+        return 0
+
+    limit = 1 if state == CircuitState.half_open else None
+    released = 0
+    while limit is None or released < limit:
+        if redis_client.rpoplpush(TASK_QUEUE_DEFERRED_KEY, TASK_QUEUE_READY_KEY) is None:
+            break
+        released += 1
+
+    if released:
+        logger.info(f"released {released} deferred tasks, circuit state={state.value}")
+    return released
+
+
+def worker_loop(stop_event: threading.Event | None = None):
+    """
+    文档检查任务 worker 主循环，可以在同一进程里起多个线程并发执行。
+    stop_event 置位后不再领取新任务，当前任务处理完即返回（优雅退出）。
+    """
+    stop_event = stop_event or threading.Event()
+    queue_stats.add_worker_slots(1)
+    logger.info("doc_llm_test_worker started, waiting for tasks...")
+    while not stop_event.is_set():
         try:
-            raw_item = redis_client.brpoplpush(TASK_QUEUE_READY_KEY, TASK_QUEUE_PROCESSING_KEY, timeout=10)
+            queue_stats.worker_heartbeat()
+            # 熔断打开时不领取任务，避免把任务耗在已知不可用的后端上
+            if not llm_circuit_breaker.allows_requests():
+                stop_event.wait(CIRCUIT_OPEN_POLL_SECONDS)
+                continue
+            release_deferred_tasks()
+
+            raw_item = redis_client.brpoplpush(TASK_QUEUE_READY_KEY, TASK_QUEUE_PROCESSING_KEY, timeout=WORKER_POLL_TIMEOUT_SECONDS)
             if not raw_item:
-                time.sleep(5)
+                stop_event.wait(5)
                 continue # 没有任务，就继续下一轮
 
             try:
-                payload_str = raw_item.decode("utf-8")
-                data = json.loads(payload_str)
+                data = parse_task_payload(raw_item)
                 task_id = int(data["task_id"])
             except Exception as e:
-                logging.exception(f"invalid processing queue item: {raw_item!r}")
+                logger.exception(f"invalid processing queue item: {raw_item!r}")
                 redis_client.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw_item)
                 continue
             
-            start_ts = int(time.time())
-            redis_client.hset(TASK_PROCESSING_TS_KEY, task_id, start_ts)
+            # 时间预算从取出时开始算，排队时间不计入
+            deadline = task_deadline()
+            pipe = redis_client.pipeline()
+            pipe.hset(TASK_PROCESSING_PAYLOAD_KEY, task_id, raw_item)
+            pipe.zadd(TASK_PROCESSING_DEADLINES_KEY, {task_id: processing_deadline()})
+            pipe.execute()
 
             try:
-                process_task(task_id)
+                with queue_stats.inflight_scope():
+                    process_task(task_id, deadline)
+            except CircuitOpenError:
+                redis_client.lpush(TASK_QUEUE_DEFERRED_KEY, raw_item)
             finally:
-                redis_client.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw_item)
-                redis_client.hdel(TASK_PROCESSING_TS_KEY, task_id)
+                pipe = redis_client.pipeline()
+                pipe.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw_item)
+                pipe.zrem(TASK_PROCESSING_DEADLINES_KEY, task_id)
+                pipe.hdel(TASK_PROCESSING_PAYLOAD_KEY, task_id)
+                pipe.execute()
         except Exception:
-            logging.exception("unexpected error in worker loop, sleep 3s")
-            time.sleep(3)
-        
-
-def wait_for_doc_ready(task_id: int):
-    """
-    当 doc == "__PENDING_FILE__" 时，等待 doc 字段被控制面更新。
-    超过最大重试次数仍未更新则抛出异常。
-    """
-    PENDING_RETRY_INTERVAL = 2
-    PENDING_RETRY_MAX = 5
-
-    for i in range(PENDING_RETRY_MAX):
-        time.sleep(PENDING_RETRY_INTERVAL)
-        task = task_service.get_task_by_id(task_id)
-        if not task:
-            raise RuntimeError(f"task {task_id} disappeared during pending wait")
-        
-        doc = (task.doc or "").strip()
-        if doc != doc_loader.PENDING_MARK:
-            logging.info(f"task {task_id} doc is ready after {i+1} retries: {doc}")
-            return task
-        logging.info(f"task {task_id} doc still pending (retry {i+1}/{PENDING_RETRY_MAX})")
-
-    raise RuntimeError(f"task {task_id} doc still pending after max retries")
+            logger.exception("unexpected error in worker loop, sleep 3s")
+            stop_event.wait(3)
+    queue_stats.add_worker_slots(-1)
+    logger.info("doc_llm_test_worker stopped")
@@ -4,6 +4,8 @@ from typing import Tuple
 
 from app.services import file_service
 
+logger = logging.getLogger(__name__)
+
 PENDING_MARK = "__PENDING_FILE__"
 
 
@@ -60,7 +62,7 @@ def load_doc_for_task(task) -> str:
     
     if _is_minio_path(doc):
         bucket, object_name = _parse_minio_path(doc)
-        logging.info(
+        logger.info(
             f"task {task.task_id} doc is minio path, bucket={bucket}, object={object_name}"
         )
         content_bytes = file_service.download_file(bucket, object_name)
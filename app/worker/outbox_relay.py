@@ -0,0 +1,28 @@
+# app/worker/outbox_relay.py
+# outbox relay：把 controller 提交后没来得及发布的入队消息补发到 Redis，
+# 保证 MySQL 里的 pending 任务不会因为进程在提交与入队之间崩溃而永远不被处理
+import logging
+import os
+import time
+
+from app.services import task_outbox
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_RELAY_INTERVAL_SECONDS = float(os.getenv("OUTBOX_RELAY_INTERVAL_SECONDS", "2"))
+OUTBOX_RELAY_BATCH_SIZE = int(os.getenv("OUTBOX_RELAY_BATCH_SIZE", "200"))
+
+
+def outbox_relay_loop():
+    """outbox 补发主循环：一批发满时立即继续，否则等待下一轮"""
+    logger.info(f"doc_llm_outbox_relay started, interval={OUTBOX_RELAY_INTERVAL_SECONDS}s")
+    while True:
+        try:
+            published = task_outbox.relay_pending(OUTBOX_RELAY_BATCH_SIZE)
+            if published:
+                logger.info(f"doc_llm_outbox_relay: published {published} outbox messages")
+            if published >= OUTBOX_RELAY_BATCH_SIZE:
+                continue
+        except Exception:
+            logger.exception("unexpected error in outbox relay loop")
+        time.sleep(OUTBOX_RELAY_INTERVAL_SECONDS)
@@ -0,0 +1,229 @@
+# app/worker/supervisor.py
+# 多进程 worker：一个容器用满所有核
+#   - WORKER_PROCESSES 个任务进程，每个进程起 WORKER_THREADS 个 worker_loop 线程（解析 / 抽取等 CPU 步骤不再受单个 GIL 限制）
+#   - 1 个维护进程运行 reaper / scheduler / outbox relay / webhook；每台主机只有它去竞争 leader 锁，跨主机仍由锁选出唯一执行者
+#   - 子进程用 spawn 启动：父进程不持有 Redis / MySQL 连接，子进程各自建连接池，不会共享 fork 来的 socket
+#   - 子进程异常退出后按指数退避重启；SIGTERM / SIGINT 优雅退出，SIGHUP 逐个滚动重启任务进程
+from __future__ import annotations
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0")) or os.cpu_count() or 1
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "1"))
+# 优雅退出时等待子进程处理完当前任务的时间，超时后强杀，未完成的任务由 reaper 回收
+WORKER_SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("WORKER_SHUTDOWN_TIMEOUT_SECONDS", "60"))
+WORKER_RESTART_BACKOFF_MAX_SECONDS = float(os.getenv("WORKER_RESTART_BACKOFF_MAX_SECONDS", "30"))
+# 子进程运行超过该时长后再退出，重启退避从头计算
+WORKER_RESTART_RESET_SECONDS = float(os.getenv("WORKER_RESTART_RESET_SECONDS", "60"))
+
+MAINTENANCE_SLOT = "maintenance"
+
+_mp = multiprocessing.get_context("spawn")
+
+
+def start_background_threads() -> list[threading.Thread]:
+    """启动后台巡检线程（reaper / scheduler / outbox relay / webhook），各自用 leader 锁或 SKIP LOCKED 协调多副本"""
+    from app.worker.outbox_relay import outbox_relay_loop
+    from app.worker.task_reaper import reaper_loop
+    from app.worker.task_scheduler import scheduler_loop
+    from app.worker.webhook_dispatcher import webhook_loop
+
+    loops = [(reaper_loop, "doc_llm_reaper"), (scheduler_loop, "doc_llm_scheduler")]
+    if os.getenv("OUTBOX_RELAY_ENABLED", "1") == "1":
+        loops.append((outbox_relay_loop, "doc_llm_outbox_relay"))
+    if os.getenv("WEBHOOK_DISPATCHER_ENABLED", "1") == "1":
+        loops.append((webhook_loop, "doc_llm_webhook"))
+
+    threads = []
+    for target, name in loops:
+        thread = threading.Thread(target=target, name=name, daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def _init_child(metrics_port: int | None) -> threading.Event:
+    """子进程公共初始化，返回收到 SIGTERM / SIGINT 时置位的 stop 事件"""
+    from app.common.logging_setup import setup_logging
+    from app.common.metrics import start_metrics_server
+    from app.common.profiling import install_profiler_signal
+    from app.llm import init_llm
+
+    setup_logging("worker")
+    init_llm()
+    if metrics_port:
+        start_metrics_server(metrics_port)
+    profiler_signal = os.getenv("WORKER_PROFILER_SIGNAL")
+    if profiler_signal:
+        install_profiler_signal(profiler_signal)
+
+    stop_event = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_: stop_event.set())
+    # 滚动重启只由 supervisor 发起，子进程忽略终端发来的 SIGHUP
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    return stop_event
+
+
+def run_worker_process(threads: int, metrics_port: int | None = None) -> None:
+    """任务进程入口：threads 个 worker_loop 线程，stop 后等当前任务处理完再退出"""
+    stop_event = _init_child(metrics_port)
+    from app.worker.doc_llm_test_worker import worker_loop
+
+    workers = [
+        threading.Thread(target=worker_loop, args=(stop_event,), name=f"doc_llm_worker_{i}")
+        for i in range(threads)
+    ]
+    for thread in workers:
+        thread.start()
+    # 主线程带超时 join，保证信号处理函数能及时执行
+    while any(thread.is_alive() for thread in workers):
+        for thread in workers:
+            thread.join(1)
+
+
+def run_maintenance_process(metrics_port: int | None = None) -> None:
+    """维护进程入口：后台巡检线程；退出前主动释放 leader 锁，其他副本无需等锁过期"""
+    stop_event = _init_child(metrics_port)
+    from app.worker.task_reaper import reaper_leader
+    from app.worker.task_scheduler import scheduler_leader
+
+    start_background_threads()
+    stop_event.wait()
+    reaper_leader.release()
+    scheduler_leader.release()
+
+
+@dataclass
+class _Child:
+    slot: str
+    process: multiprocessing.Process | None = None
+    started_at: float = 0.0
+    restart_at: float = 0.0
+    backoff: float = 1.0
+    retiring: list = field(default_factory=list)
+
+
+class Supervisor:
+    """管理维护进程和任务进程的生命周期，本身不连接 Redis / MySQL"""
+
+    def __init__(
+        self,
+        processes: int = WORKER_PROCESSES,
+        threads: int = WORKER_THREADS,
+        metrics_port: int | None = None,
+        maintenance: bool = True,
+    ):
+        self.threads = threads
+        # 有 metrics 端口时维护进程用基础端口，任务进程依次 +1
+        self.metrics_port = metrics_port
+        slots = [str(i) for i in range(processes)]
+        if maintenance:
+            slots.insert(0, MAINTENANCE_SLOT)
+        self.children = {slot: _Child(slot) for slot in slots}
+        self._stopping = False
+        self._rolling = False
+
+    def _port_of(self, slot: str) -> int | None:
+        if not self.metrics_port:
+            return None
+        return self.metrics_port if slot == MAINTENANCE_SLOT else self.metrics_port + int(slot) + 1
+
+    def _spawn(self, child: _Child) -> None:
+        if child.slot == MAINTENANCE_SLOT:
+            target, args = run_maintenance_process, (self._port_of(child.slot),)
+        else:
+            target, args = run_worker_process, (self.threads, self._port_of(child.slot))
+        process = _mp.Process(target=target, args=args, name=f"doc_llm_worker_{child.slot}")
+        process.start()
+        child.process = process
+        child.started_at = time.monotonic()
+        logger.info(f"[SUPERVISOR] started child {child.slot}, pid={process.pid}")
+
+    def _reap(self) -> None:
+        """处理退出的子进程：异常退出的按退避时间重启"""
+        now = time.monotonic()
+        for child in self.children.values():
+            child.retiring = [p for p in child.retiring if p.is_alive()]
+            process = child.process
+            if process is None:
+                if not self._stopping and now >= child.restart_at:
+                    self._spawn(child)
+                continue
+            if process.is_alive():
+                continue
+            process.join()
+            child.process = None
+            if self._stopping:
+                continue
+            if now - child.started_at >= WORKER_RESTART_RESET_SECONDS:
+                child.backoff = 1.0
+            child.restart_at = now + child.backoff
+            logger.error(
+                f"[SUPERVISOR] child {child.slot} pid={process.pid} exited with code {process.exitcode}, "
+                f"restart in {child.backoff:.0f}s"
+            )
+            child.backoff = min(child.backoff * 2, WORKER_RESTART_BACKOFF_MAX_SECONDS)
+
+    def _roll(self) -> None:
+        """逐个替换任务进程：先起新进程，再让旧进程处理完当前任务后退出，期间并发度不下降"""
+        logger.info("[SUPERVISOR] rolling restart of worker processes")
+        for child in self.children.values():
+            if self._stopping:
+                return
+            if child.slot == MAINTENANCE_SLOT or child.process is None:
+                continue
+            old = child.process
+            self._spawn(child)
+            old.terminate()
+            child.retiring.append(old)
+            self._wait([old], WORKER_SHUTDOWN_TIMEOUT_SECONDS)
+
+    def _wait(self, processes: list, timeout: float) -> None:
+        """等待进程退出，超时后 SIGKILL"""
+        deadline = time.monotonic() + timeout
+        for process in processes:
+            process.join(max(deadline - time.monotonic(), 0))
+        for process in processes:
+            if process.is_alive():
+                logger.warning(f"[SUPERVISOR] pid={process.pid} did not exit in {timeout:.0f}s, killing")
+                process.kill()
+                process.join()
+
+    def stop(self, *_) -> None:
+        self._stopping = True
+
+    def request_roll(self, *_) -> None:
+        self._rolling = True
+
+    def run(self) -> None:
+        """主循环（需在主线程调用），直到收到 SIGTERM / SIGINT 并且所有子进程退出"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.request_roll)
+        logger.info(
+            f"[SUPERVISOR] starting {len(self.children)} children, "
+            f"worker_threads={self.threads}, pid={os.getpid()}"
+        )
+        while not self._stopping:
+            if self._rolling:
+                self._rolling = False
+                self._roll()
+            self._reap()
+            time.sleep(0.5)
+
+        processes = [c.process for c in self.children.values() if c.process is not None]
+        processes += [p for c in self.children.values() for p in c.retiring]
+        logger.info(f"[SUPERVISOR] shutting down {len(processes)} children")
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        self._wait(processes, WORKER_SHUTDOWN_TIMEOUT_SECONDS)
+        logger.info("[SUPERVISOR] all children exited")
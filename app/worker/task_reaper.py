@@ -1,75 +1,266 @@
 # app/worker/task_reaper.py
-import json
+# 卡死任务回收：
+#   1. 每轮用 ZRANGEBYSCORE 取出心跳截止时间已过的任务（只碰超时的那部分，不再遍历整个 processing 队列）
+#   2. 每隔 REAPER_DB_SWEEP_INTERVAL_SECONDS 在 MySQL 侧按 (status, processing_started_at) 索引分批兜底扫描，
+#      覆盖 Redis 被清空 / ZSET 丢失的情况，并分页核对 processing 队列里没有截止时间的残留消息
+# 回收的任务按 retry_count 退避后才重新入队；超过 MAX_TASK_RETRIES 的任务进入 dead_letter 隔离
+# 多个 worker 副本都会启动 reaper 线程，但只有抢到 leader 锁的那个真正执行
 import logging
-import time
-import threading
-import redis
 import os
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
+from typing import Iterator
 
+from app.common.leader_lock import LeaderLock
+from app.common.metrics import registry as metrics_registry
+from app.common.models import TaskStatus
+from app.common.redis_client import lazy_redis
+from app.common.task_queue import (
+    MAX_TASK_RETRIES,
+    PROCESSING_TIMEOUT_SECONDS,
+    TASK_PROCESSING_DEADLINES_KEY,
+    TASK_PROCESSING_PAYLOAD_KEY,
+    TASK_QUEUE_PROCESSING_KEY,
+    TASK_QUEUE_DELAYED_KEY,
+    TASK_QUEUE_READY_KEY,
+    build_delayed_member,
+    build_task_payload,
+    parse_task_payload,
+    processing_deadline,
+    retry_backoff_seconds,
+)
 from app.services import task_service
 
-TASK_QUEUE_READY_KEY = "doc_llm:task_queue:ready"
-TASK_QUEUE_PROCESSING_KEY = "doc_llm:task_queue:processing"
-TASK_PROCESSING_TS_KEY = "doc_llm:hash:processing_ts"
+logger = logging.getLogger(__name__)
 
-REDIS_HOST = os.getenv("REDIS_HOST", "127.0.0.1")
-REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
-REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
+redis_client = lazy_redis()
 
-redis_client = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=0,
-    password=REDIS_PASSWORD,
-)
+REAPER_INTERVAL_SECONDS = int(os.getenv("REAPER_INTERVAL_SECONDS", "30"))
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "500"))
+REAPER_DB_SWEEP_INTERVAL_SECONDS = int(os.getenv("REAPER_DB_SWEEP_INTERVAL_SECONDS", "300"))
+# leader 锁过期时间：持有者崩溃后最多这么久由其他副本接手
+REAPER_LEADER_TTL_SECONDS = int(os.getenv("REAPER_LEADER_TTL_SECONDS", str(REAPER_INTERVAL_SECONDS * 3)))
 
-PROCESSING_TIMEOUT_SECONDS = 600
-REAPER_INTERVAL_SECONDS = 30
+reaper_leader = LeaderLock(redis_client, "reaper", REAPER_LEADER_TTL_SECONDS)
 
+# 上一轮核对时没有截止时间的 processing 消息；连续两轮都是孤儿才处理，
+# 避开 worker 刚 BRPOPLPUSH 还没来得及写 ZSET 的窗口
+_orphan_candidates: set[bytes] = set()
 
-def reaper_loop():
-    """巡检 processing 队列，恢复超时的任务"""
-    logging.info("doc_llm_reaper started, interval=%ss, timeout=%ss", REAPER_INTERVAL_SECONDS, PROCESSING_TIMEOUT_SECONDS)
+
+def _timeout_threshold_dt() -> datetime:
+    # 和 processing_started_at 一样取数据库时钟，避免 worker 与 MySQL 时区 / 时钟不一致
+    return task_service.processing_timeout_threshold(PROCESSING_TIMEOUT_SECONDS)
+
+
+def _task_name_of(raw: bytes | None) -> str | None:
+    if raw is None:
+        return None
+    try:
+        return parse_task_payload(raw).get("task_name")
+    except Exception:
+        return None
+
+
+def _requeue(
+    task_names: dict[int, str | None],
+    raws: dict[int, bytes | None],
+    retry_counts: dict[int, int] | None = None,
+) -> None:
+    """
+    清掉 processing 侧的残留（队列消息、截止时间、原始消息）后重新入队：
+    给了 retry_counts 的任务放进延迟集合，退避结束后由 scheduler 搬回 ready 队列；其余直接放回 ready
+    """
+    now = time.time()
+    pipe = redis_client.pipeline()
+    for task_id, task_name in task_names.items():
+        raw = raws.get(task_id)
+        if raw is not None:
+            pipe.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw)
+        pipe.zrem(TASK_PROCESSING_DEADLINES_KEY, task_id)
+        pipe.hdel(TASK_PROCESSING_PAYLOAD_KEY, task_id)
+        if retry_counts and task_id in retry_counts:
+            due = now + retry_backoff_seconds(retry_counts[task_id])
+            pipe.zadd(TASK_QUEUE_DELAYED_KEY, {build_delayed_member(task_id, task_name): due})
+        else:
+            pipe.lpush(TASK_QUEUE_READY_KEY, build_task_payload(task_id, task_name))
+    pipe.execute()
+
+
+def _dead_letter(task_ids: list[int], raws: dict[int, bytes | None]) -> None:
+    """重试预算用完的任务：清理 Redis 残留并标记 dead_letter"""
+    _forget(task_ids, raws)
+    for task_id in task_ids:
+        task_service.dead_letter_task(
+            task_id, f"任务已重试 {MAX_TASK_RETRIES} 次仍处理超时，超过重试上限，转入 dead_letter"
+        )
+    metrics_registry.inc("doc_llm_tasks_dead_lettered_total", len(task_ids))
+    logger.error(f"doc_llm_reaper: tasks exceeded retry budget, moved to dead_letter: {task_ids}")
+
+
+def _forget(task_ids: list[int], raws: dict[int, bytes | None]) -> None:
+    """任务在 MySQL 里已结束（worker 写完库后崩溃），只清理 Redis 残留"""
+    pipe = redis_client.pipeline()
+    for task_id in task_ids:
+        raw = raws.get(task_id)
+        if raw is not None:
+            pipe.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw)
+        pipe.zrem(TASK_PROCESSING_DEADLINES_KEY, task_id)
+        pipe.hdel(TASK_PROCESSING_PAYLOAD_KEY, task_id)
+    pipe.execute()
+
+
+def reap_expired_tasks() -> int:
+    """处理 ZSET 里心跳已过期的任务，返回回收的任务数"""
+    now = time.time()
+    total = 0
     while True:
-        try:
-            now_ts = int(time.time())
-            timeout_border_ts = now_ts - PROCESSING_TIMEOUT_SECONDS
-            timeout_threshold_dt = datetime.utcnow() - timedelta(seconds=PROCESSING_TIMEOUT_SECONDS)
-            
-            items = redis_client.lrange(TASK_QUEUE_PROCESSING_KEY, 0, -1)
-            if not items:
-                time.sleep(REAPER_INTERVAL_SECONDS)
-                continue
-            for raw in items:
-                try:
-                    payload_str = raw.decode("utf-8")
-                    payload = json.loads(payload_str)
-                    task_id = payload.get("task_id")
-                    task_name = payload.get("task_name")
-                except Exception:
-                    redis_client.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw)
-                    continue
-
-                start_ts_raw = redis_client.hget(TASK_PROCESSING_TS_KEY, task_id)
-                if start_ts_raw is None:
-                    continue
-                start_ts = int(start_ts_raw)
-                if start_ts > timeout_border_ts:
-                    continue
-                logging.warning(f"doc_llm_reaper: task {task_id} seems stuck, start_ts={start_ts}, now_ts={now_ts}")
-
-                ok = task_service.reclaim_task(task_id, timeout_threshold_dt)
-                if not ok:
-                    continue
+        members = redis_client.zrangebyscore(
+            TASK_PROCESSING_DEADLINES_KEY, "-inf", now, start=0, num=REAPER_BATCH_SIZE
+        )
+        if not members:
+            break
+        task_ids = [int(m) for m in members]
+        raws = dict(zip(task_ids, redis_client.hmget(TASK_PROCESSING_PAYLOAD_KEY, task_ids)))
+
+        reclaimed, exhausted = task_service.reclaim_tasks(task_ids, _timeout_threshold_dt())
+        if reclaimed:
+            _requeue({task_id: _task_name_of(raws[task_id]) for task_id in reclaimed}, raws, reclaimed)
+            logger.warning(f"doc_llm_reaper: reclaimed {len(reclaimed)} stuck tasks from deadline set: {list(reclaimed)}")
+        if exhausted:
+            _dead_letter(exhausted, raws)
+
+        # 没被回收的按 MySQL 状态分三种：
+        #   pending    -> worker 在 mark_task_processing 之前崩溃，消息直接重新入队
+        #   processing -> MySQL 心跳仍新（Redis 心跳写失败），推后截止时间下轮再看
+        #   其他/不存在 -> 任务已结束，清理残留
+        handled = set(reclaimed) | set(exhausted)
+        rest = [task_id for task_id in task_ids if task_id not in handled]
+        statuses = task_service.get_task_statuses(rest)
+        pending = {t: _task_name_of(raws[t]) for t in rest if statuses.get(t) == TaskStatus.pending}
+        alive = [t for t in rest if statuses.get(t) == TaskStatus.processing]
+        finished = [t for t in rest if t not in pending and statuses.get(t) != TaskStatus.processing]
+        if pending:
+            _requeue(pending, raws)
+        if alive:
+            redis_client.zadd(TASK_PROCESSING_DEADLINES_KEY, {t: processing_deadline(now) for t in alive}, xx=True)
+        if finished:
+            _forget(finished, raws)
+
+        total += len(reclaimed) + len(exhausted) + len(pending)
+        if len(members) < REAPER_BATCH_SIZE:
+            break
+    if total:
+        metrics_registry.inc("doc_llm_reaper_reclaimed_total", total, source="deadline_set")
+    return total
+
+
+def sweep_stuck_tasks() -> int:
+    """MySQL 侧兜底：按 processing_started_at 从最早的开始分批扫描心跳超时的任务，集合式回收并重新入队"""
+    threshold_dt = _timeout_threshold_dt()
+    after = None
+    total = 0
+    while True:
+        rows = task_service.find_stuck_tasks(threshold_dt, REAPER_BATCH_SIZE, after)
+        if not rows:
+            break
+        last_task_id, _, last_started_at = rows[-1]
+        after = (last_started_at, last_task_id)
+        task_names = {task_id: task_name for task_id, task_name, _ in rows}
+
+        reclaimed, exhausted = task_service.reclaim_tasks(list(task_names), threshold_dt)
+        if reclaimed or exhausted:
+            affected = list(reclaimed) + exhausted
+            raws = dict(zip(affected, redis_client.hmget(TASK_PROCESSING_PAYLOAD_KEY, affected)))
+            if reclaimed:
+                _requeue({task_id: task_names[task_id] for task_id in reclaimed}, raws, reclaimed)
+                logger.warning(f"doc_llm_reaper: reclaimed {len(reclaimed)} stuck tasks from db sweep: {list(reclaimed)}")
+            if exhausted:
+                _dead_letter(exhausted, raws)
+            total += len(affected)
+        if len(rows) < REAPER_BATCH_SIZE:
+            break
+    if total:
+        metrics_registry.inc("doc_llm_reaper_reclaimed_total", total, source="db_sweep")
+    return total
+
+
+def _processing_queue_pages(page_size: int = REAPER_BATCH_SIZE) -> Iterator[list[bytes]]:
+    """
+    从尾部（最早取出的一端）分页读取 processing 队列，每次 LRANGE 最多 page_size 条，不一次性读出整个列表。
+    新消息从头部插入，不影响尾部的下标；翻页期间有消息被删除时可能漏看几条，下一轮核对会补上
+    """
+    start = 0
+    while True:
+        page = redis_client.lrange(TASK_QUEUE_PROCESSING_KEY, -(start + page_size), -(start + 1))
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+def reconcile_processing_queue() -> int:
+    """核对 processing 队列里没有截止时间的消息（如 worker 在写 ZSET 之前崩溃），返回处理的条数"""
+    # 只保留孤儿消息，内存和单次 Redis 调用都不随队列长度增长
+    orphans: dict[bytes, int] = {}
+    for page in _processing_queue_pages():
+        parsed: dict[bytes, int] = {}
+        for raw in page:
+            try:
+                parsed[raw] = int(parse_task_payload(raw)["task_id"])
+            except Exception:
+                logger.warning(f"doc_llm_reaper: drop invalid processing queue item: {raw!r}")
                 redis_client.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw)
-                redis_client.hdel(TASK_PROCESSING_TS_KEY, task_id)
 
-                new_payload = json.dumps(
-                    {"task_id": task_id, "task_name": task_name}, ensure_ascii=False
-                )
-                redis_client.lpush(TASK_QUEUE_READY_KEY, new_payload)
-                logging.info(f"doc_llm_reaper: task {task_id} reclaimed and requeued to READY")
+        pipe = redis_client.pipeline(transaction=False)
+        for task_id in parsed.values():
+            pipe.zscore(TASK_PROCESSING_DEADLINES_KEY, task_id)
+        scores = pipe.execute()
+        orphans.update((raw, task_id) for (raw, task_id), score in zip(parsed.items(), scores) if score is None)
+
+    confirmed = orphans.keys() & _orphan_candidates
+    _orphan_candidates.clear()
+    _orphan_candidates.update(orphans.keys() - confirmed)
+    if not confirmed:
+        return 0
+
+    statuses = task_service.get_task_statuses([orphans[raw] for raw in confirmed])
+    pipe = redis_client.pipeline()
+    for raw in confirmed:
+        task_id = orphans[raw]
+        status = statuses.get(task_id)
+        if status == TaskStatus.processing:
+            # 交给截止时间集合接管，超时后走正常回收流程
+            pipe.hset(TASK_PROCESSING_PAYLOAD_KEY, task_id, raw)
+            pipe.zadd(TASK_PROCESSING_DEADLINES_KEY, {task_id: processing_deadline()}, nx=True)
+            continue
+        pipe.lrem(TASK_QUEUE_PROCESSING_KEY, 1, raw)
+        if status == TaskStatus.pending:
+            pipe.lpush(TASK_QUEUE_READY_KEY, build_task_payload(task_id, _task_name_of(raw)))
+    pipe.execute()
+    logger.warning(f"doc_llm_reaper: reconciled {len(confirmed)} orphan processing queue items")
+    return len(confirmed)
+
+
+def reaper_loop():
+    """回收超时任务；只有持有 leader 锁的副本执行"""
+    logger.info(
+        "doc_llm_reaper started, interval=%ss, timeout=%ss, db_sweep_interval=%ss",
+        REAPER_INTERVAL_SECONDS, PROCESSING_TIMEOUT_SECONDS, REAPER_DB_SWEEP_INTERVAL_SECONDS,
+    )
+    next_sweep_at = 0.0
+    while True:
+        try:
+            if reaper_leader.acquire_or_renew():
+                reap_expired_tasks()
+                if time.monotonic() >= next_sweep_at:
+                    sweep_stuck_tasks()
+                    reconcile_processing_queue()
+                    next_sweep_at = time.monotonic() + REAPER_DB_SWEEP_INTERVAL_SECONDS
+            else:
+                # 失去 leader 后重新当选时立即做一次全量兜底
+                next_sweep_at = 0.0
         except Exception:
-            logging.exception("unexpected error in reaper loop, sleep 3s")
-        time.sleep(REAPER_INTERVAL_SECONDS)
\ No newline at end of file
+            logger.exception("unexpected error in reaper loop")
+        time.sleep(REAPER_INTERVAL_SECONDS)
@@ -0,0 +1,106 @@
+# app/worker/task_scheduler.py
+# 延迟 / 定时任务的搬运：
+#   - TASK_QUEUE_DELAYED_KEY：reaper 回收后的退避、指定 not_before 的任务，到期即搬进 ready 队列
+#   - TASK_QUEUE_BULK_KEY：低优先级批量任务，到期后还要满足
+#       1. 当前处于任务的 run_window 时间窗内（不在窗内的改到下一次窗口开始）
+#       2. LLM 熔断器关闭，且 ready 队列长度低于 BULK_READY_MAX（有空闲额度时才放，不和在线任务抢限流配额）
+#   - 评测（eval_run）：每 EVAL_DISPATCH_INTERVAL_SECONDS 按各评测的并发上限补充派发组合任务
+# 多个 worker 副本都会启动 scheduler 线程，但只有抢到 leader 锁的那个真正执行，避免并发搬运时超发
+import logging
+import os
+import time
+from datetime import datetime
+
+from app.common import CircuitState, json_codec
+from app.common.leader_lock import LeaderLock
+from app.common.metrics import registry as metrics_registry
+from app.common.redis_client import lazy_redis
+from app.common.task_queue import (
+    TASK_QUEUE_BULK_KEY,
+    TASK_QUEUE_DELAYED_KEY,
+    TASK_QUEUE_READY_KEY,
+    build_task_payload,
+    in_run_window,
+    next_run_window_start,
+)
+from app.llm.llm_config import llm_circuit_breaker
+from app.services import eval_service
+
+logger = logging.getLogger(__name__)
+
+redis_client = lazy_redis()
+
+SCHEDULER_INTERVAL_SECONDS = float(os.getenv("SCHEDULER_INTERVAL_SECONDS", "1"))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+# ready 队列低于该长度时才放入批量任务
+BULK_READY_MAX = int(os.getenv("BULK_READY_MAX", "10"))
+EVAL_DISPATCH_INTERVAL_SECONDS = float(os.getenv("EVAL_DISPATCH_INTERVAL_SECONDS", "5"))
+
+scheduler_leader = LeaderLock(redis_client, "scheduler", max(SCHEDULER_INTERVAL_SECONDS * 10, 10))
+
+
+def _promote(key: str, member: bytes) -> bool:
+    """从 ZSET 搬进 ready 队列；ZREM 成功的一方负责入队，保证不会重复搬运"""
+    if not redis_client.zrem(key, member):
+        return False
+    data = json_codec.loads(member)
+    redis_client.lpush(TASK_QUEUE_READY_KEY, build_task_payload(data["task_id"], data.get("task_name")))
+    return True
+
+
+def promote_delayed_tasks(now: float | None = None) -> int:
+    """把到期的延迟任务搬进 ready 队列，返回搬运数"""
+    now = now if now is not None else time.time()
+    due = redis_client.zrangebyscore(TASK_QUEUE_DELAYED_KEY, "-inf", now, start=0, num=SCHEDULER_BATCH_SIZE)
+    promoted = sum(1 for member in due if _promote(TASK_QUEUE_DELAYED_KEY, member))
+    if promoted:
+        metrics_registry.inc("doc_llm_tasks_promoted_total", promoted, queue="delayed")
+        logger.info(f"promoted {promoted} delayed tasks to ready queue")
+    return promoted
+
+
+def promote_bulk_tasks(now: float | None = None) -> int:
+    """按时间窗和 ready 队列余量搬运批量任务，返回搬运数"""
+    if llm_circuit_breaker.state() != CircuitState.closed:
+        return 0
+    budget = min(BULK_READY_MAX - redis_client.llen(TASK_QUEUE_READY_KEY), SCHEDULER_BATCH_SIZE)
+    if budget <= 0:
+        return 0
+
+    now = now if now is not None else time.time()
+    now_dt = datetime.fromtimestamp(now)
+    due = redis_client.zrangebyscore(TASK_QUEUE_BULK_KEY, "-inf", now, start=0, num=budget)
+    promoted = 0
+    for member in due:
+        run_window = json_codec.loads(member).get("run_window")
+        if run_window and not in_run_window(run_window, now_dt):
+            # 窗口外：推迟到下一次窗口开始，之后的轮询不再扫到它
+            next_start = next_run_window_start(run_window, now_dt).timestamp()
+            redis_client.zadd(TASK_QUEUE_BULK_KEY, {member: next_start}, xx=True)
+            continue
+        if _promote(TASK_QUEUE_BULK_KEY, member):
+            promoted += 1
+    if promoted:
+        metrics_registry.inc("doc_llm_tasks_promoted_total", promoted, queue="bulk")
+        logger.info(f"promoted {promoted} bulk tasks to ready queue")
+    return promoted
+
+
+def scheduler_loop():
+    """延迟 / 批量任务搬运主循环；只有持有 leader 锁的副本执行"""
+    logger.info(
+        f"doc_llm_scheduler started, interval={SCHEDULER_INTERVAL_SECONDS}s, bulk_ready_max={BULK_READY_MAX}"
+    )
+    next_eval_dispatch_at = 0.0
+    while True:
+        try:
+            if scheduler_leader.acquire_or_renew():
+                now = time.time()
+                promote_delayed_tasks(now)
+                promote_bulk_tasks(now)
+                if time.monotonic() >= next_eval_dispatch_at:
+                    next_eval_dispatch_at = time.monotonic() + EVAL_DISPATCH_INTERVAL_SECONDS
+                    eval_service.dispatch_eval_runs()
+        except Exception:
+            logger.exception("unexpected error in scheduler loop")
+        time.sleep(SCHEDULER_INTERVAL_SECONDS)
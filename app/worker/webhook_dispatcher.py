@@ -0,0 +1,247 @@
+# app/worker/webhook_dispatcher.py
+# webhook 投递：从投递队列取任务，按回调地址合并批量推送，失败指数退避重试
+#   - 取任务时原子地移进 processing 列表并登记租约，投递成功或进死信后才删除
+#   - 进程崩溃 / 被强杀时没投递完的任务在租约到期后由任意副本重新入队（至少投递一次）
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from app.common import BackoffConfig, RetryableError, json_codec, retry_with_backoff
+from app.common.redis_client import lazy_redis
+from app.services import task_service
+from app.services.webhook_service import (
+    WEBHOOK_DEAD_KEY,
+    WEBHOOK_LEASES_KEY,
+    WEBHOOK_PROCESSING_KEY,
+    WEBHOOK_QUEUE_KEY,
+    check_callback_host,
+)
+
+logger = logging.getLogger(__name__)
+
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "8"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_BATCH_MAX_SIZE = int(os.getenv("WEBHOOK_BATCH_MAX_SIZE", "50"))
+# 取到第一条后最多再等多久凑批（秒）
+WEBHOOK_BATCH_WINDOW_SECONDS = float(os.getenv("WEBHOOK_BATCH_WINDOW_SECONDS", "1"))
+# 设置后对请求体做 HMAC-SHA256 签名，放在 X-DocLLM-Signature 头里
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# 投递租约（秒），应大于一批任务排队等线程池 + 全部重试的最长耗时，超过后任务会被重新投递
+WEBHOOK_LEASE_SECONDS = float(os.getenv("WEBHOOK_LEASE_SECONDS", "600"))
+# 队列为空时的轮询间隔（秒）
+WEBHOOK_POLL_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_POLL_INTERVAL_SECONDS", "0.5"))
+# 每隔多久检查一次到期的租约（秒）
+WEBHOOK_REQUEUE_INTERVAL_SECONDS = float(os.getenv("WEBHOOK_REQUEUE_INTERVAL_SECONDS", "30"))
+
+redis_client = lazy_redis()
+
+# 从队列右侧取一条移进 processing 列表，同时登记租约；队列为空返回 nil
+_TAKE_SCRIPT = """
+local raw = redis.call('RPOPLPUSH', KEYS[1], KEYS[2])
+if raw then
+    redis.call('ZADD', KEYS[3], ARGV[1], raw)
+end
+return raw
+"""
+
+# 租约到期且仍在 processing 列表里的任务按原顺序放回队列右侧（下一批被取出）
+_REQUEUE_SCRIPT = """
+local expired = redis.call('ZRANGEBYSCORE', KEYS[3], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+local requeued = 0
+for i = #expired, 1, -1 do
+    local raw = expired[i]
+    redis.call('ZREM', KEYS[3], raw)
+    if redis.call('LREM', KEYS[2], 1, raw) == 1 then
+        redis.call('RPUSH', KEYS[1], raw)
+        requeued = requeued + 1
+    end
+end
+return requeued
+"""
+
+_scripts: dict = {}
+
+
+def _script(name: str, source: str):
+    if name not in _scripts:
+        _scripts[name] = redis_client.register_script(source)
+    return _scripts[name]
+
+
+def _take_job() -> bytes | None:
+    return _script("take", _TAKE_SCRIPT)(
+        keys=[WEBHOOK_QUEUE_KEY, WEBHOOK_PROCESSING_KEY, WEBHOOK_LEASES_KEY],
+        args=[time.time() + WEBHOOK_LEASE_SECONDS],
+    )
+
+
+def _ack_jobs(raws: list[bytes]) -> None:
+    """投递结束（成功或已进死信）后删除 processing 列表里的任务和租约"""
+    pipe = redis_client.pipeline(transaction=False)
+    for raw in raws:
+        pipe.lrem(WEBHOOK_PROCESSING_KEY, 1, raw)
+        pipe.zrem(WEBHOOK_LEASES_KEY, raw)
+    pipe.execute()
+
+
+def requeue_expired_jobs(limit: int = 100) -> int:
+    """把租约到期的任务放回投递队列，返回放回的条数"""
+    return _script("requeue", _REQUEUE_SCRIPT)(
+        keys=[WEBHOOK_QUEUE_KEY, WEBHOOK_PROCESSING_KEY, WEBHOOK_LEASES_KEY],
+        args=[time.time(), limit],
+    )
+
+
+class WebhookRetryableError(RetryableError):
+    """回调方暂时不可用（5xx / 429 / 网络错误），适合重试"""
+    pass
+
+
+_webhook_backoff_config = BackoffConfig(
+    max_retries=5,
+    base_delay=1.0,
+    factor=2.0,
+    jitter=True,
+    max_delay=30.0,
+    retry_exceptions=(WebhookRetryableError,),
+)
+
+
+def _build_session() -> requests.Session:
+    """复用连接的 HTTP session，连接池大小和并发数一致"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=WEBHOOK_CONCURRENCY, pool_maxsize=WEBHOOK_CONCURRENCY)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = _build_session()
+
+
+def _task_payload(task_id: int, status: str) -> dict:
+    task = task_service.get_task_by_id(task_id)
+    if not task:
+        return {"task_id": task_id, "status": status, "deleted": True}
+    return {
+        "task_id": task.task_id,
+        "task_name": task.task_name,
+        "product": task.product,
+        "feature": task.feature,
+        "status": task.status,
+        "result": task_service.get_task_result(task),
+    }
+
+
+@retry_with_backoff(_webhook_backoff_config)
+def _post(url: str, body: bytes) -> None:
+    headers = {
+        "Content-Type": "application/json",
+        "X-DocLLM-Event": "task.completed",
+    }
+    if WEBHOOK_SECRET:
+        digest = hmac.new(WEBHOOK_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+        headers["X-DocLLM-Signature"] = f"sha256={digest}"
+
+    try:
+        response = _session.post(url, data=body, headers=headers, timeout=WEBHOOK_TIMEOUT_SECONDS)
+    except requests.exceptions.RequestException as e:
+        raise WebhookRetryableError(f"webhook request error: {e!r}") from e
+
+    status = response.status_code
+    if status < 300:
+        return
+    if status == HTTPStatus.TOO_MANY_REQUESTS or status >= 500:
+        raise WebhookRetryableError(f"webhook transient error, status={status}")
+    raise RuntimeError(f"webhook rejected, status={status}")
+
+
+def _deliver(url: str, entries: list[tuple[bytes, dict]], batch: bool) -> None:
+    """投递一批任务，最终失败的放进死信列表，方便人工排查 / 重放；两种情况都结束后才从 processing 列表删除"""
+    jobs = [job for _, job in entries]
+    try:
+        # 投递前再解析一次，防止提交后 DNS 被改到内网地址
+        check_callback_host(url)
+        payloads = [_task_payload(job["task_id"], job["status"]) for job in jobs]
+        body_obj = {"tasks": payloads} if batch else payloads[0]
+        _post(url, json_codec.dumps_bytes(body_obj))
+        logger.info(f"webhook delivered, url={url}, tasks={[job['task_id'] for job in jobs]}")
+    except Exception as e:
+        logger.error(f"webhook delivery failed, url={url}, tasks={[job['task_id'] for job in jobs]}: {e}")
+        pipe = redis_client.pipeline(transaction=False)
+        for job in jobs:
+            pipe.lpush(WEBHOOK_DEAD_KEY, json_codec.dumps({**job, "error": str(e)}))
+        pipe.execute()
+    _ack_jobs([raw for raw, _ in entries])
+
+
+def _collect_jobs(first_raw: bytes) -> list[tuple[bytes, dict]]:
+    """拿到第一条后在窗口期内继续取，最多 WEBHOOK_BATCH_MAX_SIZE 条，返回 (原始消息, 任务)"""
+    raws = [first_raw]
+    end_at = time.monotonic() + WEBHOOK_BATCH_WINDOW_SECONDS
+    while len(raws) < WEBHOOK_BATCH_MAX_SIZE and time.monotonic() < end_at:
+        raw = _take_job()
+        if raw is None:
+            time.sleep(0.05)
+            continue
+        raws.append(raw)
+
+    entries, invalid = [], []
+    for raw in raws:
+        try:
+            entries.append((raw, json_codec.loads(raw)))
+        except Exception:
+            logger.warning(f"invalid webhook job: {raw!r}")
+            invalid.append(raw)
+    if invalid:
+        _ack_jobs(invalid)
+    return entries
+
+
+def _group_jobs(entries: list[tuple[bytes, dict]]) -> list[tuple[str, list[tuple[bytes, dict]], bool]]:
+    """接受批量的回调地址合并成一次请求，其余逐条投递"""
+    batched: dict[str, list[tuple[bytes, dict]]] = {}
+    groups: list[tuple[str, list[tuple[bytes, dict]], bool]] = []
+    for raw, job in entries:
+        if job.get("batch"):
+            batched.setdefault(job["callback_url"], []).append((raw, job))
+        else:
+            groups.append((job["callback_url"], [(raw, job)], False))
+    groups.extend((url, url_entries, True) for url, url_entries in batched.items())
+    return groups
+
+
+def webhook_loop():
+    """webhook 投递主循环，请求在线程池中并发发出，不阻塞取任务"""
+    logger.info(f"doc_llm_webhook started, concurrency={WEBHOOK_CONCURRENCY}")
+    executor = ThreadPoolExecutor(max_workers=WEBHOOK_CONCURRENCY, thread_name_prefix="doc_llm_webhook")
+    # 回调方变慢时限制积压在线程池里的批次数，剩下的留在 Redis 队列里
+    in_flight = threading.BoundedSemaphore(WEBHOOK_CONCURRENCY * 2)
+    next_requeue_at = 0.0
+    while True:
+        try:
+            if time.monotonic() >= next_requeue_at:
+                next_requeue_at = time.monotonic() + WEBHOOK_REQUEUE_INTERVAL_SECONDS
+                requeued = requeue_expired_jobs()
+                if requeued:
+                    logger.warning(f"requeued {requeued} webhook jobs with expired lease")
+
+            first_raw = _take_job()
+            if first_raw is None:
+                time.sleep(WEBHOOK_POLL_INTERVAL_SECONDS)
+                continue
+            for url, entries, batch in _group_jobs(_collect_jobs(first_raw)):
+                in_flight.acquire()
+                future = executor.submit(_deliver, url, entries, batch)
+                future.add_done_callback(lambda _: in_flight.release())
+        except Exception:
+            logger.exception("unexpected error in webhook loop, sleep 3s")
+            time.sleep(3)
@@ -0,0 +1,64 @@
+# benchmarks/e2e/check_circuit_breaker.py
+# 熔断器半开探测的回归检查：探测请求不管以什么方式结束，都不能一直占着探测锁
+#
+#   python -m benchmarks.e2e.check_circuit_breaker
+#
+# LLM / Redis 用本地替身，不需要外部服务
+from __future__ import annotations
+import os
+import sys
+import time
+
+from benchmarks.e2e import standins
+from benchmarks.e2e.stubs import FakeDashScopeServer, LLMProfile
+
+
+def _force_half_open(breaker) -> None:
+    """把熔断器置为 open，且 opened_at 早于 open_seconds，下一次调用即为半开探测"""
+    breaker.redis.delete(breaker.probe_key)
+    breaker.redis.hset(breaker.key, mapping={
+        "state": "open",
+        "opened_at": time.time() - breaker.cfg.open_seconds - 1,
+        "failures": breaker.cfg.failure_threshold,
+    })
+
+
+def check_half_open_400(llm_url: str) -> None:
+    """半开时探测请求得到 400：请求本身有问题但后端可用，熔断器关闭并释放探测锁"""
+    import dashscope
+    from app.common import CircuitState
+    from app.llm.llm_client import chat_with_model
+    from app.llm.llm_config import llm_circuit_breaker
+
+    dashscope.base_http_api_url = f"{llm_url}/api/v1"
+    _force_half_open(llm_circuit_breaker)
+    assert llm_circuit_breaker.state() == CircuitState.half_open
+
+    try:
+        chat_with_model([{"role": "user", "content": "ping"}])
+    except RuntimeError as e:
+        assert "status=400" in str(e), e
+    else:
+        raise AssertionError("expected RuntimeError for HTTP 400")
+
+    assert llm_circuit_breaker.state() == CircuitState.closed
+    assert not llm_circuit_breaker.redis.exists(llm_circuit_breaker.probe_key), "probe lock still held"
+    # 之后的调用不再被“探测中”挡住
+    llm_circuit_breaker.before_call()
+
+
+def main() -> int:
+    llm = FakeDashScopeServer(LLMProfile(latency_median=0.0, latency_sigma=0, error_400_rate=1.0))
+    llm_url = llm.start()
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["ALIYUN_API_KEY"] = "bench"
+    standins.use_fake_redis()
+
+    check_half_open_400(llm_url)
+    assert llm.stats.bad_requests == 1, llm.stats.to_dict()
+    print("half-open 400: ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,291 @@
+# benchmarks/e2e/run_e2e.py
+# 端到端压测：submit_doc_task -> worker_loop -> mark_task_success，全部依赖换成本地替身
+#
+#   python -m benchmarks.e2e.run_e2e --tasks 200 --rate 20 --workers 8 --output run.json
+#   python -m benchmarks.e2e.run_e2e ... --baseline run.json     # 与上次结果对比
+#
+# LLM：本地假 DashScope 服务（对数正态延迟，可注入 429 / 5xx）
+# Redis：默认进程内 fakeredis，--redis real 时使用 REDIS_HOST 指向的真实 Redis
+# MySQL：默认 sqlite 文件，--db-url 可指定真实数据库（需提前执行迁移）
+# MinIO：内存版 S3 替身，--file-ratio 控制走文件上传的任务比例
+from __future__ import annotations
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+from benchmarks.e2e import standins
+from benchmarks.e2e.stubs import FakeDashScopeServer, FakeMinioServer, LLMProfile
+
+RESULT_KEYS = (
+    "throughput_tasks_per_sec",
+    "e2e_latency_p50", "e2e_latency_p95", "e2e_latency_p99",
+    "queue_wait_p50", "queue_wait_p95", "queue_wait_p99",
+    "cpu_seconds", "max_rss_mb",
+)
+
+TRACE_FILE = os.path.join(os.getenv("TMPDIR", "/tmp"), "doc_llm_bench_traces.jsonl")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="doc-llm end-to-end benchmark")
+    parser.add_argument("--tasks", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=20.0, help="每秒提交的任务数")
+    parser.add_argument("--workers", type=int, default=8, help="worker_loop 线程数")
+    parser.add_argument("--doc-chars", type=int, default=4000)
+    parser.add_argument("--file-ratio", type=float, default=0.0, help="通过 MinIO 文件提交的任务比例")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="LLM 延迟中位数（秒）")
+    parser.add_argument("--llm-sigma", type=float, default=0.5, help="LLM 延迟对数正态 sigma")
+    parser.add_argument("--error-429", type=float, default=0.0, help="注入 429 的比例")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="注入 5xx 的比例")
+    parser.add_argument("--bugs", type=int, default=5, help="每个回答中的 bug 数")
+    parser.add_argument("--near-dup", action="store_true", help="开启近似重复复用（默认关闭，保证每个任务都调用 LLM）")
+    parser.add_argument("--redis", choices=("fake", "real"), default="fake")
+    parser.add_argument("--db-url", default=None, help="默认使用临时 sqlite 文件")
+    parser.add_argument("--timeout", type=float, default=600.0, help="等待全部任务结束的最长时间")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果写入的 JSON 文件")
+    parser.add_argument("--baseline", help="对比用的历史结果 JSON 文件")
+    return parser.parse_args(argv)
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return round(ordered[idx], 4)
+
+
+def make_doc(rng: random.Random, chars: int, index: int) -> str:
+    words = ["接口", "参数", "返回值", "配置项", "默认值", "超时", "重试", "示例", "说明", "注意"]
+    lines = [f"# 压测文档 {index}"]
+    size = 0
+    while size < chars:
+        line = "".join(rng.choice(words) for _ in range(20)) + f"（{rng.randrange(10 ** 6)}）。"
+        lines.append(line)
+        size += len(line)
+    return "\n".join(lines)
+
+
+def setup_environment(args, llm_url: str, minio_url: str) -> None:
+    """import app 之前设置环境变量"""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["DB_ECHO"] = "0"
+    # 文档用固定种子生成，连续两次压测内容相同，关闭按内容去重以免第二次全部命中已有任务
+    os.environ.setdefault("IDEMPOTENCY_WINDOW_SECONDS", "0")
+    os.environ["NEAR_DUP_ENABLED"] = "1" if args.near_dup else "0"
+    os.environ["MINIO_ENDPOINT"] = minio_url.replace("http://", "")
+    os.environ["MINIO_REGION"] = "us-east-1"
+    os.environ["ALIYUN_API_KEY"] = "bench"
+    # 队列等待 / 端到端耗时取 worker trace 里的精确时间戳，MySQL DATETIME 只到秒
+    if os.path.exists(TRACE_FILE):
+        os.remove(TRACE_FILE)
+    os.environ["TRACE_EXPORT_FILE"] = TRACE_FILE
+    if args.redis == "fake":
+        standins.use_fake_redis()
+    if args.db_url:
+        os.environ["DATABASE_URL"] = args.db_url
+    else:
+        standins.use_sqlite(os.path.join(os.getenv("TMPDIR", "/tmp"), "doc_llm_bench.db"))
+
+
+def submit(rng: random.Random, index: int, args) -> int:
+    from werkzeug.datastructures import FileStorage
+    from app.services import doc_check_service, file_service
+
+    doc = make_doc(rng, args.doc_chars, index)
+    task_name = f"bench-{index}"
+    if rng.random() >= args.file_ratio:
+        return doc_check_service.submit_doc_task(task_name, doc, "bench", None)
+
+    task_id = doc_check_service.submit_doc_task(task_name, "__PENDING_FILE__", "bench", None, enqueue=False)
+    file_obj = FileStorage(io.BytesIO(doc.encode("utf-8")), filename=f"{task_name}.md", content_type="text/markdown")
+    doc_path = file_service.save_task_file(task_id, file_obj)
+    doc_check_service.attach_task_file(task_id, task_name, doc_path)
+    return task_id
+
+
+def fetch_rows(task_ids: list[int]):
+    from sqlalchemy import select
+    from app.common.db import get_session
+    from app.common.models import TaskDocLLM
+
+    with get_session() as session:
+        return session.execute(
+            select(
+                TaskDocLLM.task_id, TaskDocLLM.status,
+                TaskDocLLM.processing_started_at, TaskDocLLM.update_time,
+            ).where(TaskDocLLM.task_id.in_(task_ids))
+        ).all()
+
+
+def load_traces() -> dict[int, list[dict]]:
+    """task_id -> 该任务每次被处理的 trace（重试 / 熔断延后会有多次）"""
+    traces: dict[int, list[dict]] = {}
+    if not os.path.exists(TRACE_FILE):
+        return traces
+    with open(TRACE_FILE, encoding="utf-8") as f:
+        for line in f:
+            trace = json.loads(line)
+            traces.setdefault(trace["attributes"]["task_id"], []).append(trace)
+    return traces
+
+
+def _root_span(trace: dict) -> dict:
+    return next(s for s in trace["spans"] if s["name"] == trace["name"])
+
+
+def wait_finished(task_ids: list[int], timeout: float) -> bool:
+    from app.common.models import TERMINAL_TASK_STATUSES
+
+    end_at = time.monotonic() + timeout
+    while time.monotonic() < end_at:
+        rows = fetch_rows(task_ids)
+        if sum(1 for row in rows if row.status in TERMINAL_TASK_STATUSES) == len(task_ids):
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def run(args) -> dict:
+    llm = FakeDashScopeServer(LLMProfile(
+        latency_median=args.llm_latency,
+        latency_sigma=args.llm_sigma,
+        error_429_rate=args.error_429,
+        error_5xx_rate=args.error_5xx,
+        bugs_per_answer=args.bugs,
+        seed=args.seed,
+    ))
+    llm_url = llm.start()
+    minio = FakeMinioServer()
+    minio_url = minio.start()
+    setup_environment(args, llm_url, minio_url)
+
+    import dashscope
+    from app.common.logging_setup import setup_logging
+    from app.common.models import TaskStatus
+    from app.worker.doc_llm_test_worker import worker_loop
+
+    setup_logging("benchmark")
+    if not args.db_url:
+        standins.create_tables()
+    dashscope.base_http_api_url = f"{llm_url}/api/v1"
+
+    for i in range(args.workers):
+        threading.Thread(target=worker_loop, name=f"bench_worker_{i}", daemon=True).start()
+
+    rng = random.Random(args.seed)
+    usage_start = resource.getrusage(resource.RUSAGE_SELF)
+    submit_ts: dict[int, float] = {}
+    started = time.time()
+    for i in range(args.tasks):
+        delay = started + i / args.rate - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        ts = time.time()
+        submit_ts[submit(rng, i, args)] = ts
+    submit_seconds = time.time() - started
+
+    finished = wait_finished(list(submit_ts), args.timeout)
+    usage_end = resource.getrusage(resource.RUSAGE_SELF)
+
+    rows = fetch_rows(list(submit_ts))
+    traces = load_traces()
+    e2e, queue_wait, finish_times = [], [], []
+    stage_totals: dict[str, float] = {}
+    succeeded = failed = 0
+    for row in rows:
+        if row.status == TaskStatus.success:
+            succeeded += 1
+        elif row.status == TaskStatus.failed:
+            failed += 1
+        else:
+            continue
+        task_traces = traces.get(row.task_id)
+        if task_traces:
+            first, last = _root_span(task_traces[0]), _root_span(task_traces[-1])
+            queue_wait.append(first["start"] - submit_ts[row.task_id])
+            finished_at = last["start"] + last["duration_ms"] / 1000
+            for trace in task_traces:
+                for s in trace["spans"]:
+                    stage_totals[s["name"]] = stage_totals.get(s["name"], 0.0) + s["duration_ms"]
+        else:
+            finished_at = row.update_time.timestamp()
+        finish_times.append(finished_at)
+        e2e.append(finished_at - submit_ts[row.task_id])
+
+    elapsed = (max(finish_times) - started) if finish_times else None
+    return {
+        "config": {
+            **{k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            "python": platform.python_version(),
+            "started_at": datetime.fromtimestamp(started).isoformat(),
+        },
+        "results": {
+            "completed_all": finished,
+            "succeeded": succeeded,
+            "failed": failed,
+            "unfinished": len(submit_ts) - succeeded - failed,
+            "submit_seconds": round(submit_seconds, 3),
+            "elapsed_seconds": round(elapsed, 3) if elapsed else None,
+            "throughput_tasks_per_sec": round((succeeded + failed) / elapsed, 3) if elapsed else None,
+            "e2e_latency_p50": percentile(e2e, 50),
+            "e2e_latency_p95": percentile(e2e, 95),
+            "e2e_latency_p99": percentile(e2e, 99),
+            "queue_wait_p50": percentile(queue_wait, 50),
+            "queue_wait_p95": percentile(queue_wait, 95),
+            "queue_wait_p99": percentile(queue_wait, 99),
+            "cpu_seconds": round(
+                (usage_end.ru_utime - usage_start.ru_utime) + (usage_end.ru_stime - usage_start.ru_stime), 3
+            ),
+            "max_rss_mb": round(usage_end.ru_maxrss / 1024, 1),
+            "threads": threading.active_count(),
+            "stage_mean_ms": {
+                name: round(total / max(succeeded + failed, 1), 2) for name, total in sorted(stage_totals.items())
+            },
+            "llm": llm.stats.to_dict(),
+        },
+    }
+
+
+def print_report(report: dict, baseline: dict | None = None) -> None:
+    results = report["results"]
+    print(f"tasks={report['config']['tasks']} workers={report['config']['workers']} "
+          f"succeeded={results['succeeded']} failed={results['failed']} unfinished={results['unfinished']}")
+    print(f"llm calls={results['llm']['calls']} throttled={results['llm']['throttled']} "
+          f"server_errors={results['llm']['server_errors']}")
+    base = (baseline or {}).get("results", {})
+    for key in RESULT_KEYS:
+        value = results.get(key)
+        line = f"  {key:<26} {value}"
+        old = base.get(key)
+        if isinstance(value, (int, float)) and isinstance(old, (int, float)) and old:
+            line += f"   (baseline {old}, {(value - old) / old * 100:+.1f}%)"
+        print(line)
+    print("  stage mean (ms): " + ", ".join(f"{k}={v}" for k, v in results["stage_mean_ms"].items()))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    report = run(args)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if report["results"]["completed_all"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+# benchmarks/e2e/standins.py
+# Redis / MySQL 的本地替身，必须在 import app 之前调用
+from __future__ import annotations
+import os
+
+
+def use_fake_redis() -> None:
+    """
+    让 app 的 Redis 连接池改用进程内 fakeredis。
+    redis_client 在 import 期就会建连接池，只能在连接池初始化时替换连接类。
+    """
+    import fakeredis
+    import redis.connection
+
+    server = fakeredis.FakeServer()
+    original_init = redis.connection.BlockingConnectionPool.__init__
+
+    def init(self, *args, **kwargs):
+        kwargs["connection_class"] = fakeredis.FakeConnection
+        kwargs["server"] = server
+        # FakeConnection 不接受 socket 相关参数
+        for key in ("socket_keepalive", "health_check_interval", "parser_class"):
+            kwargs.pop(key, None)
+        original_init(self, *args, **kwargs)
+
+    redis.connection.BlockingConnectionPool.__init__ = init
+
+
+def use_sqlite(path: str) -> None:
+    """用本地 sqlite 文件代替 MySQL，每次压测从空库开始"""
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+
+
+def create_tables() -> None:
+    """sqlite 没有迁移脚本，直接按模型建表（import app 之后调用）"""
+    from app.common import models  # noqa: F401  注册模型
+    from app.common.db import Base, engine
+
+    Base.metadata.create_all(engine)
@@ -0,0 +1,205 @@
+# benchmarks/e2e/stubs.py
+# 压测用的本地替身服务：假的 DashScope 文本生成接口、内存版 MinIO（S3 子集）
+from __future__ import annotations
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+GENERATION_PATH = "/api/v1/services/aigc/text-generation/generation"
+
+
+@dataclass
+class LLMProfile:
+    """假 LLM 的行为：对数正态延迟 + 按比例注入 429 / 5xx / 400"""
+    latency_median: float = 2.0     # 秒
+    latency_sigma: float = 0.5      # 对数正态的 sigma，0 表示固定延迟
+    latency_max: float = 60.0
+    error_429_rate: float = 0.0
+    error_5xx_rate: float = 0.0
+    error_400_rate: float = 0.0
+    bugs_per_answer: int = 5
+    seed: int = 42
+
+
+@dataclass
+class LLMStats:
+    calls: int = 0
+    throttled: int = 0
+    server_errors: int = 0
+    bad_requests: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def to_dict(self) -> dict:
+        return {"calls": self.calls, "throttled": self.throttled, "server_errors": self.server_errors,
+                "bad_requests": self.bad_requests}
+
+
+def build_answer(num_bugs: int) -> str:
+    parts = []
+    for i in range(1, num_bugs + 1):
+        parts.append(
+            f"问题编号：#{i:03d}\n问题类型：术语错误\n"
+            f"问题描述：第 {i} 处“配置项”描述与实际不一致\n优化建议：改为“正确描述”\n"
+        )
+    return "\n".join(parts)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def start(self) -> str:
+        threading.Thread(target=self.serve_forever, name=type(self).__name__, daemon=True).start()
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class FakeDashScopeServer(_Server):
+    def __init__(self, profile: LLMProfile, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _DashScopeHandler)
+        self.profile = profile
+        self.stats = LLMStats()
+        self.answer = build_answer(profile.bugs_per_answer)
+        self._rng = random.Random(profile.seed)
+        self._rng_lock = threading.Lock()
+
+    def draw(self) -> tuple[float, int]:
+        """返回 (延迟秒数, HTTP 状态码)"""
+        p = self.profile
+        with self._rng_lock:
+            if p.latency_sigma > 0:
+                latency = self._rng.lognormvariate(0, p.latency_sigma) * p.latency_median
+            else:
+                latency = p.latency_median
+            roll = self._rng.random()
+        if roll < p.error_429_rate:
+            status = 429
+        elif roll < p.error_429_rate + p.error_5xx_rate:
+            status = 503
+        elif roll < p.error_429_rate + p.error_5xx_rate + p.error_400_rate:
+            status = 400
+        else:
+            status = 200
+        return min(latency, p.latency_max), status
+
+
+class _DashScopeHandler(BaseHTTPRequestHandler):
+    server: FakeDashScopeServer
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        self.rfile.read(length)
+        if urlparse(self.path).path != GENERATION_PATH:
+            self._send(404, {"code": "NotFound", "message": self.path})
+            return
+
+        latency, status = self.server.draw()
+        stats = self.server.stats
+        with stats.lock:
+            stats.calls += 1
+            stats.throttled += status == 429
+            stats.server_errors += status >= 500
+            stats.bad_requests += status == 400
+        # 限流 / 故障一般比正常回答快得多
+        time.sleep(latency if status == 200 else min(latency, 0.05))
+
+        request_id = uuid.uuid4().hex
+        if status == 429:
+            self._send(429, {"code": "Throttling", "message": "Requests rate limit exceeded", "request_id": request_id})
+        elif status == 400:
+            self._send(400, {"code": "InvalidParameter", "message": "injected bad request", "request_id": request_id})
+        elif status != 200:
+            self._send(status, {"code": "InternalError", "message": "injected failure", "request_id": request_id})
+        else:
+            self._send(200, {
+                "request_id": request_id,
+                "output": {
+                    "choices": [{"finish_reason": "stop", "message": {"role": "assistant", "content": self.server.answer}}],
+                },
+                "usage": {"input_tokens": length // 3, "output_tokens": len(self.server.answer) // 2},
+            })
+
+    def _send(self, status: int, body: dict):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeMinioServer(_Server):
+    """只实现 file_service 用到的 bucket 检查 / 创建、对象上传 / 下载，不校验签名"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        super().__init__((host, port), _MinioHandler)
+        self.buckets: dict[str, dict[str, bytes]] = {}
+        self.lock = threading.Lock()
+
+
+class _MinioHandler(BaseHTTPRequestHandler):
+    server: FakeMinioServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _split(self) -> tuple[str, str]:
+        path = urlparse(self.path).path.lstrip("/")
+        bucket, _, key = path.partition("/")
+        return bucket, key
+
+    def _reply(self, status: int, body: bytes = b"", content_type: str = "application/xml"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _not_found(self, code: str):
+        body = f"<?xml version=\"1.0\"?><Error><Code>{code}</Code><Message>{code}</Message></Error>"
+        self._reply(404, body.encode("utf-8"))
+
+    def do_HEAD(self):
+        bucket, key = self._split()
+        with self.server.lock:
+            objects = self.server.buckets.get(bucket)
+            found = objects is not None and (not key or key in objects)
+        if found:
+            self._reply(200)
+        else:
+            self._reply(404)
+
+    def do_PUT(self):
+        bucket, key = self._split()
+        length = int(self.headers.get("Content-Length") or 0)
+        data = self.rfile.read(length)
+        with self.server.lock:
+            objects = self.server.buckets.setdefault(bucket, {})
+            if key:
+                objects[key] = data
+        self.send_response(200)
+        self.send_header("ETag", f"\"{uuid.uuid4().hex}\"")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        bucket, key = self._split()
+        if "location" in urlparse(self.path).query:
+            body = '<?xml version="1.0"?><LocationConstraint xmlns="http://s3.amazonaws.com/doc/2006-03-01/"></LocationConstraint>'
+            self._reply(200, body.encode("utf-8"))
+            return
+        with self.server.lock:
+            data = self.server.buckets.get(bucket, {}).get(key)
+        if data is None:
+            self._not_found("NoSuchKey")
+            return
+        self._reply(200, data, content_type="application/octet-stream")
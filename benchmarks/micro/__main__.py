@@ -0,0 +1,54 @@
+# benchmarks/micro/__main__.py
+# 运行全部微基准并与 baseline.json 对比：
+#
+#   python -m benchmarks.micro                    # 运行并对比
+#   python -m benchmarks.micro -k to_dict         # 只跑名称包含 to_dict 的用例
+#   python -m benchmarks.micro --check            # 有退化时返回非 0，可放进 CI
+#   python -m benchmarks.micro --save-baseline    # 在参考机器上更新基线
+from __future__ import annotations
+import argparse
+import sys
+
+from benchmarks.micro import runner
+from benchmarks.micro.cases import CASES
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.micro")
+    parser.add_argument("-k", dest="keyword", default="", help="只运行名称包含该关键字的用例")
+    parser.add_argument("--samples", type=int, default=10)
+    parser.add_argument("--warmups", type=int, default=2)
+    parser.add_argument("--min-time", type=float, default=0.1, help="单次采样的最短时间（秒）")
+    parser.add_argument("--threshold", type=float, default=0.15, help="中位数变慢超过该比例视为退化")
+    parser.add_argument("--check", action="store_true", help="有退化时返回非 0")
+    parser.add_argument("--save-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    baseline = runner.load_baseline()
+    results = []
+    regressions = []
+    for name, case in CASES.items():
+        if args.keyword not in name:
+            continue
+        stats = runner.run_case(name, case, samples=args.samples, warmups=args.warmups, min_time=args.min_time)
+        results.append(stats)
+        note, regressed = runner.compare(stats, baseline, args.threshold)
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:<38} {runner.format_time(stats.median):>10} +- {runner.format_time(stats.stdev):<10} "
+            f"(loops={stats.loops})  {note}{'  REGRESSION' if regressed else ''}"
+        )
+
+    if args.save_baseline:
+        runner.save_baseline(results)
+        print(f"baseline saved to {runner.BASELINE_FILE}")
+    if regressions:
+        print(f"{len(regressions)} regression(s): {', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# benchmarks/micro/bench_parse_answer.py
+# parse_doc_check_answer 在大回答上的耗时，对比旧版 re.split 实现
+#
+# 用法：python -m benchmarks.micro.bench_parse_answer [--bugs 2000] [--repeat 7]
+from __future__ import annotations
+import argparse
+import random
+import re
+import statistics
+import timeit
+
+from app.llm.doc_check_llm import parse_doc_check_answer
+
+
+def legacy_parse_doc_check_answer(answer: str) -> dict:
+    """旧实现（去掉了 print），只用于对比"""
+    bugs = []
+    segments = re.split(r'问题编号[:：]', answer)
+    for seg in segments[1:]:
+        seg = seg.strip()
+        if not seg:
+            continue
+        m = re.match(r"[#﹟]?\s*(\d+)\s*(.*)", seg, re.S)
+        if m:
+            bug_id = m.group(1)
+            rest = m.group(2).strip()
+        else:
+            bug_id = None
+            rest = seg
+        lines = [l.strip() for l in rest.splitlines() if l.strip()]
+        bug = {"id": bug_id}
+        for line in lines:
+            if line.startswith("问题类型"):
+                bug["type"] = line.split("：", 1)[-1].strip()
+            elif line.startswith("问题描述"):
+                bug["description"] = line.split("：", 1)[-1].strip()
+            elif line.startswith("优化建议"):
+                bug["suggestion"] = line.split("：", 1)[-1].strip()
+            else:
+                bug.setdefault("extra", []).append(line)
+        bugs.append(bug)
+    return {"bugs": bugs, "raw_answer": answer}
+
+
+def build_answer(num_bugs: int, seed: int = 42) -> str:
+    """生成与线上格式一致的回答：每个 bug 四个字段，偶尔带一行补充说明"""
+    rng = random.Random(seed)
+    types = ["错别字", "术语错误", "语病", "格式问题", "功能点未覆盖"]
+    parts = ["以下是对文档的审查结果：\n"]
+    for i in range(1, num_bugs + 1):
+        parts.append(f"问题编号：#{i:03d}\n")
+        parts.append(f"问题类型：{rng.choice(types)}\n")
+        parts.append(f"问题描述：第 {i} 处“某某配置项”描述与实际行为不一致，{'细节' * rng.randint(5, 40)}\n")
+        parts.append(f"优化建议：建议改为“正确的描述”，{'说明' * rng.randint(5, 30)}\n")
+        if rng.random() < 0.2:
+            parts.append("补充：该问题在多个章节重复出现。\n")
+        parts.append("\n")
+    return "".join(parts)
+
+
+# 带列表序号的回答：字段前面有 “1.” 时也必须识别出全部 bug
+NUMBERED_LIST_ANSWER = (
+    "1. 问题编号：#001\n问题类型：术语错误\n问题描述：术语前后不一致\n优化建议：统一术语\n\n"
+    "2. 问题编号：#002\n问题类型：语病\n问题描述：句子缺少主语\n优化建议：补全主语\n"
+)
+
+# 编号在“问题编号：”的下一行
+ID_ON_NEXT_LINE_ANSWER = "问题编号：\n#001\n问题类型：错别字\n问题描述：“配制”应为“配置”\n优化建议：改为“配置”\n"
+# 第一个“问题编号”在行中间，后面的在行首
+MID_LINE_FIRST_ANSWER = (
+    "审查结果如下：问题编号：#001\n问题类型：错别字\n问题描述：错字\n优化建议：改正\n"
+    "问题编号：#002\n问题类型：语病\n问题描述：缺主语\n优化建议：补全\n"
+)
+
+
+def _without_extra(bugs: list[dict]) -> list[dict]:
+    # 旧实现会把下一项的序号 “2.” 当成 extra 挂在上一个 bug 上，对比时忽略 extra
+    return [{k: v for k, v in bug.items() if k != "extra"} for bug in bugs]
+
+
+def check_parity(answer: str) -> None:
+    """当前实现与旧实现识别出的 bug 一致"""
+    assert parse_doc_check_answer(answer)["bugs"] == legacy_parse_doc_check_answer(answer)["bugs"]
+    numbered = parse_doc_check_answer(NUMBERED_LIST_ANSWER)["bugs"]
+    assert _without_extra(numbered) == _without_extra(legacy_parse_doc_check_answer(NUMBERED_LIST_ANSWER)["bugs"])
+    assert len(numbered) == 2
+    for shape in (ID_ON_NEXT_LINE_ANSWER, MID_LINE_FIRST_ANSWER):
+        bugs = parse_doc_check_answer(shape)["bugs"]
+        assert bugs == legacy_parse_doc_check_answer(shape)["bugs"], shape
+        assert all(bug["id"] for bug in bugs), shape
+    assert len(parse_doc_check_answer(MID_LINE_FIRST_ANSWER)["bugs"]) == 2
+
+
+def bench(func, answer: str, repeat: int) -> list[float]:
+    timer = timeit.Timer(lambda: func(answer))
+    number, _ = timer.autorange()
+    return [t / number for t in timer.repeat(repeat=repeat, number=number)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--bugs", type=int, default=2000, help="回答中的 bug 数量")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    answer = build_answer(args.bugs)
+    check_parity(answer)
+
+    print(f"answer: {len(answer)} chars, {args.bugs} bugs")
+    for name, func in (("legacy", legacy_parse_doc_check_answer), ("current", parse_doc_check_answer)):
+        timings = bench(func, answer, args.repeat)
+        print(
+            f"{name:>8}: median {statistics.median(timings) * 1000:.2f} ms, "
+            f"min {min(timings) * 1000:.2f} ms, stdev {statistics.pstdev(timings) * 1000:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+# benchmarks/micro/cases.py
+# 热点纯 Python 路径的微基准用例，数据都用固定种子生成，保证各次运行可比
+from __future__ import annotations
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+# list_all_tasks 用内存 sqlite，必须在 import app 之前设置
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from benchmarks.micro.bench_parse_answer import build_answer  # noqa: E402
+
+SERIALIZATION_ROWS = 10_000
+
+
+def parse_answer_large():
+    from app.llm.doc_check_llm import parse_doc_check_answer
+
+    answer = build_answer(2000)
+    return lambda: parse_doc_check_answer(answer)
+
+
+def retry_decorated_call():
+    from app.common import BackoffConfig, RetryableError, retry_with_backoff
+
+    @retry_with_backoff(BackoffConfig(max_retries=5, retry_exceptions=(RetryableError,)))
+    def noop():
+        return None
+
+    return noop
+
+
+def retry_plain_call():
+    """与 retry_decorated_call 对照，差值即装饰器本身的开销"""
+    def noop():
+        return None
+
+    return noop
+
+
+def _sample_result(i: int) -> dict:
+    return {
+        "bugs": [
+            {"id": f"{j:03d}", "type": "术语错误", "description": f"第 {i}-{j} 处描述不一致", "suggestion": "修改", "offset": j * 10}
+            for j in range(1, 6)
+        ],
+        "raw_answer": "问题编号：#001\n" * 20,
+        "meta": {"product": "bench", "feature": None, "prompt_version": "1.0.2"},
+    }
+
+
+def _make_tasks(n: int):
+    from app.common.models import TaskDocLLM, TaskStatus
+
+    now = datetime(2024, 6, 1, 12, 0, 0)
+    return [
+        TaskDocLLM(
+            task_id=i, task_name=f"bench-{i}", doc="文档内容" * 200, product="bench", feature=None,
+            status=TaskStatus.success, result=_sample_result(i), create_time=now, update_time=now,
+            processing_started_at=now, retry_count=0,
+        )
+        for i in range(1, n + 1)
+    ]
+
+
+def task_to_dict_10k():
+    tasks = _make_tasks(SERIALIZATION_ROWS)
+    return lambda: [task.to_dict() for task in tasks]
+
+
+def list_all_tasks_10k():
+    """从 sqlite 读 10k 行、组装 dict 并 json 序列化（接近 GET /tasks/ 的整条路径）"""
+    from app.common.db import Base, engine, get_session
+    from app.services import doc_check_service
+
+    Base.metadata.create_all(engine)
+    with get_session() as session:
+        if session.query(doc_check_service.TaskDocLLM).count() == 0:
+            session.add_all(_make_tasks(SERIALIZATION_ROWS))
+
+    def run():
+        tasks = doc_check_service.list_all_tasks()
+        return json.dumps(tasks, ensure_ascii=False, default=str)
+
+    return run
+
+
+COMPACT_ROWS = 1_000
+COMPACT_TASK_ID_BASE = 1_000_000
+
+
+def _expand_compact(parts: tuple[str, ...]):
+    """task_bug / task_raw_answer 里 1k 个紧凑格式结果拼回完整结构，对比带不带原始回答的开销"""
+    def case():
+        from app.common.db import Base, engine, get_session
+        from app.common.models import TaskBug
+        from app.services import task_result
+
+        Base.metadata.create_all(engine)
+        results = {}
+        with get_session() as session:
+            # 任务ID从 COMPACT_TASK_ID_BASE 开始，不和 list_all_tasks 的数据冲突，只写子表
+            seeded = session.query(TaskBug).filter(TaskBug.task_id > COMPACT_TASK_ID_BASE).count() > 0
+            for i in range(1, COMPACT_ROWS + 1):
+                task = SimpleNamespace(task_id=COMPACT_TASK_ID_BASE + i, product="bench", result=None)
+                full = _sample_result(i)
+                full["raw_answer"] = build_answer(20)
+                if not seeded:
+                    task_result.store_result(session, task, full)
+                else:
+                    task.result = {"meta": full["meta"], task_result.COMPACT_MARKER: {"bug_count": 5}}
+                results[task.task_id] = task.result
+
+        def run():
+            with get_session() as session:
+                return task_result.expand_results(session, results, parts)
+
+        return run
+
+    return case
+
+
+def parse_minio_path():
+    from app.worker.doc_loader import _parse_minio_path
+
+    paths = [f"minio://doc-llm-bucket/{i}_readme.md" for i in range(100)] + [f"/doc-llm-bucket/{i}_a.md" for i in range(100)]
+    return lambda: [_parse_minio_path(p) for p in paths]
+
+
+def load_doc_inline_64k():
+    from app.worker.doc_loader import load_doc_for_task
+
+    task = SimpleNamespace(task_id=1, doc=("测试文档内容。" * 9400)[:65535])
+    return lambda: load_doc_for_task(task)
+
+
+@contextmanager
+def run_doc_check_prompt_assembly():
+    """run_doc_check 去掉 LLM 调用后的部分：读 prompt 文件 + 拼消息；case 结束后还原 patch，不影响后面的 case"""
+    from app.llm import doc_check_llm
+
+    doc = "测试文档内容。" * 2000
+    with mock.patch.object(doc_check_llm, "chat_with_model", lambda messages, **kwargs: messages):
+        yield lambda: doc_check_llm.run_doc_check(doc, "bench", "功能A\n功能B")
+
+
+CASES = {
+    "parse_doc_check_answer[2000 bugs]": parse_answer_large,
+    "retry_with_backoff[decorated noop]": retry_decorated_call,
+    "retry_with_backoff[plain noop]": retry_plain_call,
+    "TaskDocLLM.to_dict[10k]": task_to_dict_10k,
+    "list_all_tasks+json[10k]": list_all_tasks_10k,
+    "expand_results[1k compact, bugs]": _expand_compact(("bugs",)),
+    "expand_results[1k compact, bugs+raw]": _expand_compact(("bugs", "raw_answer")),
+    "_parse_minio_path[200]": parse_minio_path,
+    "load_doc_for_task[inline 64KB]": load_doc_inline_64k,
+    "run_doc_check[prompt assembly]": run_doc_check_prompt_assembly,
+}
@@ -0,0 +1,119 @@
+# benchmarks/micro/runner.py
+# 微基准的最小运行框架：自动校准循环次数、预热、多次采样，输出 pyperf 风格统计并与基线对比
+from __future__ import annotations
+import gc
+import json
+import platform
+import statistics
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, ContextManager
+
+BASELINE_FILE = Path(__file__).resolve().parent / "baseline.json"
+
+# 每个 case：返回一个无参可调用对象，只计时该对象的调用（setup 不计时）。
+# 需要清理的 case（如 mock.patch）可以返回上下文管理器，进入时给出被计时的对象，计时结束后退出
+Case = Callable[[], Callable[[], object] | ContextManager[Callable[[], object]]]
+
+
+@dataclass
+class Stats:
+    name: str
+    loops: int
+    samples: list[float]     # 每次调用的平均耗时（秒）
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.samples)
+
+    @property
+    def mean(self) -> float:
+        return statistics.fmean(self.samples)
+
+    @property
+    def stdev(self) -> float:
+        return statistics.stdev(self.samples) if len(self.samples) > 1 else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "loops": self.loops,
+            "median": self.median,
+            "mean": self.mean,
+            "stdev": self.stdev,
+            "min": min(self.samples),
+            "max": max(self.samples),
+        }
+
+
+def _calibrate(func: Callable[[], object], min_time: float) -> int:
+    """找到单次采样耗时不少于 min_time 的循环次数"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        if time.perf_counter() - start >= min_time:
+            return loops
+        loops *= 2
+
+
+def run_case(name: str, case: Case, samples: int = 10, warmups: int = 2, min_time: float = 0.1) -> Stats:
+    made = case()
+    if not hasattr(made, "__enter__"):
+        return _run(name, made, samples, warmups, min_time)
+    with made as func:
+        return _run(name, func, samples, warmups, min_time)
+
+
+def _run(name: str, func: Callable[[], object], samples: int, warmups: int, min_time: float) -> Stats:
+    loops = _calibrate(func, min_time)
+    results = []
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()  # 与 timeit 一致，避免 GC 时机带来的抖动
+    try:
+        for i in range(warmups + samples):
+            start = time.perf_counter()
+            for _ in range(loops):
+                func()
+            elapsed = (time.perf_counter() - start) / loops
+            if i >= warmups:
+                results.append(elapsed)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return Stats(name, loops, results)
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def load_baseline(path: Path = BASELINE_FILE) -> dict:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding="utf-8")).get("benchmarks", {})
+
+
+def save_baseline(results: list[Stats], path: Path = BASELINE_FILE) -> None:
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "benchmarks": {r.name: r.summary() for r in results},
+    }
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n", encoding="utf-8")
+
+
+def compare(result: Stats, baseline: dict, threshold: float) -> tuple[str, bool]:
+    """返回 (对比说明, 是否退化)。中位数变慢超过 threshold 且超出基线 2 个标准差才算退化"""
+    old = baseline.get(result.name)
+    if not old:
+        return "no baseline", False
+    change = (result.median - old["median"]) / old["median"]
+    noise = 2 * max(old.get("stdev", 0.0), result.stdev)
+    regressed = change > threshold and result.median - old["median"] > noise
+    return f"{change * 100:+.1f}% vs baseline {format_time(old['median'])}", regressed
@@ -0,0 +1,53 @@
+# run_autoscaler.py
+# doc-llm-worker 副本数自动调整：
+#   python run_autoscaler.py --once              # 打印一次快照和建议值（JSON），不做任何改动
+#   python run_autoscaler.py --apply             # 循环执行，通过 docker compose --scale 调整副本数
+# 不加 --apply 时当前副本数取 Redis 里上报心跳的 worker 主机数，只需要能连上 Redis（本地 / 离线环境可用）
+import argparse
+import json
+import logging
+import time
+
+from app.common import CircuitState
+from app.common.logging_setup import setup_logging
+from app.common.queue_stats import queue_snapshot
+from app.llm.llm_config import llm_circuit_breaker
+from app.worker.autoscaler import Autoscaler, ComposeScaler
+
+logger = logging.getLogger("doc_llm_autoscaler")
+
+
+def run_once(autoscaler: Autoscaler, scaler: ComposeScaler | None) -> dict:
+    snapshot = queue_snapshot()
+    current = scaler.current_replicas() if scaler else snapshot.live_hosts
+    decision = autoscaler.step(
+        snapshot, current, circuit_closed=llm_circuit_breaker.state() == CircuitState.closed
+    )
+    if scaler and decision.changed:
+        scaler.scale(decision.target)
+        autoscaler.reset()
+    return {"snapshot": snapshot.to_dict(), "decision": {**decision.__dict__, "applied": bool(scaler and decision.changed)}}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="doc-llm-worker autoscaler")
+    parser.add_argument("--once", action="store_true", help="只计算一次并输出")
+    parser.add_argument("--apply", action="store_true", help="通过 docker compose 实际调整副本数")
+    parser.add_argument("--interval", type=float, default=15.0, help="循环间隔（秒）")
+    parser.add_argument("--service", default="doc-llm-worker")
+    parser.add_argument("--compose-file", default=None)
+    args = parser.parse_args()
+
+    setup_logging("autoscaler")
+    compose_args = ["-f", args.compose_file] if args.compose_file else []
+    scaler = ComposeScaler(args.service, compose_args) if args.apply else None
+    autoscaler = Autoscaler()
+    while True:
+        try:
+            result = run_once(autoscaler, scaler)
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+        except Exception:
+            logger.exception("autoscaler step failed")
+        if args.once:
+            break
+        time.sleep(args.interval)
@@ -0,0 +1,14 @@
+# run_supervisor.py
+# 多进程 worker 入口：WORKER_PROCESSES 个任务进程（默认等于 CPU 核数）× WORKER_THREADS 个线程，外加一个维护进程
+#   kill -HUP <pid>   逐个滚动重启任务进程
+#   kill -TERM <pid>  优雅退出：不再领取新任务，等当前任务处理完（最多 WORKER_SHUTDOWN_TIMEOUT_SECONDS）
+# 单进程调试仍可用 run_worker.py
+import os
+
+from app.common.logging_setup import setup_logging
+from app.worker.supervisor import Supervisor
+
+if __name__ == "__main__":
+    setup_logging("worker")
+    metrics_port = os.getenv("WORKER_METRICS_PORT")
+    Supervisor(metrics_port=int(metrics_port) if metrics_port else None).run()
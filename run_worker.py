@@ -1,25 +1,20 @@
 # run_worker.py
-import logging
-import threading
+import os
+from app.common.logging_setup import setup_logging
+from app.common.metrics import start_metrics_server
+from app.common.profiling import install_profiler_signal
 from app.llm import init_llm
 from app.worker.doc_llm_test_worker import worker_loop
-from app.worker.task_reaper import reaper_loop
-
-
-def setup_logging():
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(name)s: %(message)s",
-    )
-
-
-def start_reaper_thread():
-    reaper_thread = threading.Thread(target=reaper_loop, name="doc_llm_reaper", daemon=True)
-    reaper_thread.start()
-    return reaper_thread
+from app.worker.supervisor import start_background_threads
 
 if __name__ == "__main__":
-    setup_logging()
+    setup_logging("worker")
     init_llm()
-    start_reaper_thread()
-    worker_loop()
\ No newline at end of file
+    metrics_port = os.getenv("WORKER_METRICS_PORT")
+    if metrics_port:
+        start_metrics_server(int(metrics_port))
+    profiler_signal = os.getenv("WORKER_PROFILER_SIGNAL")
+    if profiler_signal:
+        install_profiler_signal(profiler_signal)
+    start_background_threads()
+    worker_loop()